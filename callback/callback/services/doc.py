@@ -17,9 +17,22 @@ from reportlab.pdfgen import canvas
 from callback.services import minio as minio_service
 from configs.config import config
 from extensions.minio import minio_client
-from utils.build_prompt import build_docqa_prompt_from_search_list
+from utils.bm25 import BM25Ranker
+from utils.build_prompt import (
+    MAX_INPUT_TOKENS,
+    build_docqa_prompt_from_search_list,
+    format_search_segment,
+    get_search_context_budget,
+)
+from utils.doc_cache import DocParseCache, parse_cache_key
 from utils.log import logger
 from utils.response import BizError
+from utils.tokenizers import CustomTokenizer
+
+doc_parse_cache = DocParseCache(
+    max_chars=int(config.callback_cfg["DOC"].get("PARSE_CACHE_MAX_CHARS", fallback=50000000)),
+    ttl=int(config.callback_cfg["DOC"].get("PARSE_CACHE_TTL", fallback=86400)),
+)
 
 
 def process_documents(query, file_urls, sentence_size, overlap_size):
@@ -34,13 +47,13 @@ def process_documents(query, file_urls, sentence_size, overlap_size):
     all_docs = []
 
     with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_url = {
-            executor.submit(parse_doc, url, sentence_size, overlap_size): url
+        futures = [
+            executor.submit(parse_doc_cached, url, sentence_size, overlap_size)
             for url in file_urls
-        }
+        ]
 
-        for future in concurrent.futures.as_completed(future_to_url):
-            url = future_to_url[future]
+        # 按文件顺序汇总，切块顺序不受解析完成先后影响
+        for url, future in zip(file_urls, futures):
             try:
                 docs = future.result()
                 all_docs.extend(docs)
@@ -61,10 +74,48 @@ def process_documents(query, file_urls, sentence_size, overlap_size):
     ]
 
     # 构建提示词
-    prompt = build_docqa_prompt_from_search_list(query, doc_list)
+    prompt = build_docqa_prompt_from_search_list(
+        query, select_relevant_chunks(query, doc_list)
+    )
     return prompt
 
 
+def select_relevant_chunks(query, doc_list, max_tokens=MAX_INPUT_TOKENS):
+    """
+    文档内容超出扣除 docqa 模板后的 token 预算时，按与 query 的 BM25 相关度重排切块，
+    使拼接时保留最相关的切块而不是文件开头的切块；未超出预算时保持原始顺序。
+    预算与切块长度的计算方式与 build_docqa_prompt_from_search_list 拼接时一致。
+    """
+    tokenizer = CustomTokenizer()
+    budget = get_search_context_budget("docqa", max_length=max_tokens, tokenizer=tokenizer)
+    total_tokens = sum(
+        tokenizer.count_tokens(format_search_segment(idx, doc, "参考信息"))
+        for idx, doc in enumerate(doc_list)
+    )
+    if total_tokens <= budget or not query:
+        return doc_list
+
+    order = BM25Ranker([doc["snippet"] or "" for doc in doc_list]).rank(query)
+    logger.info(
+        f"文档切块超出 token 预算({total_tokens} > {budget})，按相关度重排 {len(doc_list)} 个切块"
+    )
+    return [doc_list[i] for i in order]
+
+
+def parse_doc_cached(file_url, sentence_size, overlap_size):
+    """
+    带缓存的文档解析，同一文件与切块参数只解析一次
+    """
+    key = parse_cache_key(file_url, sentence_size, overlap_size)
+    docs = doc_parse_cache.get(key)
+    if docs is not None:
+        logger.info(f"命中文档解析缓存 {file_url}, 切块数量: {len(docs)}")
+        return docs
+    docs = parse_doc(file_url, sentence_size, overlap_size)
+    doc_parse_cache.put(key, docs)
+    return docs
+
+
 def generate_file_to_minio(formatted_markdown, filename, to_format="txt"):
 
     pdfmetrics.registerFont(TTFont("SimHei", "callback/static/simhei.ttf"))
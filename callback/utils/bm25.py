@@ -0,0 +1,77 @@
+import math
+import re
+from collections import Counter
+from typing import List
+
+# 英文/数字按词切分，中日韩文字按单字与相邻二字切分，无需分词词典
+_WORD_PATTERN = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af]+")
+_CJK_PATTERN = re.compile(r"[\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    将文本切分为检索用的词项。
+
+    参数：
+        text (str): 原始文本。
+
+    返回：
+        list: 词项列表，英文小写化，中文为单字加二字组合。
+    """
+    tokens = []
+    for word in _WORD_PATTERN.findall((text or "").lower()):
+        if _CJK_PATTERN.match(word):
+            tokens.extend(word)
+            tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+class BM25Ranker:
+    """
+    轻量的内存 BM25 排序器，用于从单次请求的文档切块中挑选与问题最相关的切块。
+    """
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_freqs = [Counter(tokenize(text)) for text in texts]
+        self.doc_lens = [sum(freqs.values()) for freqs in self.doc_freqs]
+        self.avg_len = sum(self.doc_lens) / len(self.doc_lens) if self.doc_lens else 0
+        df = Counter()
+        for freqs in self.doc_freqs:
+            df.update(freqs.keys())
+        n = len(self.doc_freqs)
+        self.idf = {
+            term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()
+        }
+
+    def scores(self, query: str) -> List[float]:
+        """
+        计算问题与每个切块的 BM25 得分。
+
+        参数：
+            query (str): 用户问题。
+
+        返回：
+            list: 与输入切块顺序一致的得分列表。
+        """
+        query_terms = set(tokenize(query))
+        result = []
+        for freqs, doc_len in zip(self.doc_freqs, self.doc_lens):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * doc_len / self.avg_len) if self.avg_len else self.k1
+            for term in query_terms:
+                tf = freqs.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            result.append(score)
+        return result
+
+    def rank(self, query: str) -> List[int]:
+        """
+        按相关度返回切块下标：有得分的切块按得分降序，其余保持原始顺序排在后面。
+        """
+        scores = self.scores(query)
+        return sorted(range(len(scores)), key=lambda i: (-scores[i], i))
@@ -17,6 +17,44 @@ MAX_INPUT_TOKENS = int(
 TRUNCATION_THRESHOLD = 20
 
 
+def format_search_segment(idx: int, item: dict, citation_label: str) -> str:
+    """
+    将第 idx 个搜索结果格式化为拼接到上下文中的片段（编号从 1 开始）。
+    """
+    file_name = (
+        f"参考文件：{item.get('file_name', '')}\n" if item.get("file_name") else ""
+    )
+    sub_query = f"{item.get('sub_query', '')}\n" if item.get("sub_query") else ""
+    snippet = item.get("snippet", "")
+
+    return (
+        f"{citation_label}-{idx + 1:02d}:\n{sub_query}{file_name}{snippet}"
+        if citation_label
+        else f"{idx + 1:02d}:\n{sub_query}{file_name}{snippet}"
+    )
+
+
+def get_template_name(template_prefix: str, auto_citation: bool = False) -> str:
+    return f"{template_prefix}_prompt{'_citation' if auto_citation else ''}.txt"
+
+
+def get_search_context_budget(
+    template_prefix: str,
+    auto_citation: bool = False,
+    max_length: int = MAX_INPUT_TOKENS,
+    tokenizer: CustomTokenizer = None,
+) -> int:
+    """
+    计算扣除提示词模板后可用于搜索内容的 token 数。
+    """
+    tokenizer = tokenizer or CustomTokenizer()
+    template_path = Path(
+        prompts_base_path, get_template_name(template_prefix, auto_citation)
+    )  # 确保 prompts_base_path 为 Path 类型
+    template_content = template_path.read_text(encoding="utf-8")
+    return max_length - tokenizer.count_tokens(template_content)
+
+
 def assemble_search_context(
     search_list: list,
     citation_label: str,
@@ -42,17 +80,7 @@ def assemble_search_context(
     current_tokens = 0
 
     for idx, item in enumerate(search_list):
-        file_name = (
-            f"参考文件：{item.get('file_name', '')}\n" if item.get("file_name") else ""
-        )
-        sub_query = f"{item.get('sub_query', '')}\n" if item.get("sub_query") else ""
-        snippet = item.get("snippet", "")
-
-        segment = (
-            f"{citation_label}-{idx + 1:02d}:\n{sub_query}{file_name}{snippet}"
-            if citation_label
-            else f"{idx + 1:02d}:\n{sub_query}{file_name}{snippet}"
-        )
+        segment = format_search_segment(idx, item, citation_label)
 
         segment_tokens = tokenizer.count_tokens(segment)
         new_total = current_tokens + segment_tokens
@@ -101,16 +129,10 @@ def build_prompt_from_search_list(
     tokenizer = CustomTokenizer()
     citation_label = "citation" if auto_citation else "参考信息"
 
-    template_name = (
-        f"{template_prefix}_prompt{'_citation' if auto_citation else ''}.txt"
+    template_name = get_template_name(template_prefix, auto_citation)
+    search_content_max_length = get_search_context_budget(
+        template_prefix, auto_citation, max_length, tokenizer
     )
-    template_path = Path(
-        prompts_base_path, template_name
-    )  # 确保 prompts_base_path 为 Path 类型
-    template_content = template_path.read_text(encoding="utf-8")
-    template_token_num = tokenizer.count_tokens(template_content)
-
-    search_content_max_length = max_length - template_token_num
     search_contents = assemble_search_context(
         search_list, citation_label, tokenizer, search_content_max_length
     )
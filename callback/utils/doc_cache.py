@@ -0,0 +1,92 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from extensions import redis as redis_ext
+from utils.log import logger
+
+# redis 中解析结果的 key 前缀
+DOC_PARSE_CACHE_PREFIX = "callback:doc_parse:"
+
+
+def parse_cache_key(file_url: str, sentence_size, overlap_size) -> str:
+    """
+    解析结果的缓存 key，同一文件使用不同切块参数时分别缓存。
+    """
+    raw = json.dumps([file_url, sentence_size, overlap_size], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class DocParseCache:
+    """
+    文档解析结果缓存：进程内 LRU 为一级缓存(按字符数限制容量)，
+    redis 为二级缓存(带过期时间，供多个 worker 共享)，同一文档的多轮对话不再重复解析。
+    """
+
+    def __init__(self, max_chars: int, ttl: int):
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (docs, 字符数)
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(docs: list) -> int:
+        return sum(len(doc.get("text") or "") for doc in docs)
+
+    def _put_local(self, key: str, docs: list):
+        size = self._size(docs)
+        if size > self.max_chars:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._chars -= old[1]
+            self._data[key] = (docs, size)
+            self._chars += size
+            while self._chars > self.max_chars:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self._chars -= evicted_size
+
+    def get(self, key: str):
+        """
+        查询解析结果，未命中返回 None。
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                return entry[0]
+        client = redis_ext.redis_client
+        if client is None:
+            return None
+        try:
+            cached = client.get(DOC_PARSE_CACHE_PREFIX + key)
+        except Exception as e:
+            logger.warning(f"读取文档解析缓存失败: {e}")
+            return None
+        if cached is None:
+            return None
+        docs = json.loads(cached)
+        self._put_local(key, docs)
+        return docs
+
+    def put(self, key: str, docs: list):
+        """
+        写入解析结果，空结果不缓存，避免解析失败被长期复用。
+        """
+        if not docs:
+            return
+        self._put_local(key, docs)
+        client = redis_ext.redis_client
+        if client is None:
+            return
+        try:
+            client.set(
+                DOC_PARSE_CACHE_PREFIX + key,
+                json.dumps(docs, ensure_ascii=False),
+                ex=self.ttl,
+            )
+        except Exception as e:
+            logger.warning(f"写入文档解析缓存失败: {e}")
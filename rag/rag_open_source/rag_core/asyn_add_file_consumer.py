@@ -0,0 +1,628 @@
+import os
+import nltk
+import copy
+# 设置NLTK数据路径
+# 获取当前文件的绝对路径
+current_file_path = os.path.abspath(__file__)
+# 获取当前文件所在的目录
+current_dir = os.path.dirname(current_file_path)
+# 拼接nltk_data文件夹的路径
+nltk_data_path = os.path.join(current_dir, 'nltk_data')
+nltk.data.path.append(nltk_data_path)
+nltk.data.path.append("/opt/nltk_data")
+from utils import milvus_utils
+from utils import minio_utils
+from utils import es_utils
+from utils import file_utils
+from utils import mq_rel_utils
+from utils import knowledge_base_utils
+from utils.file_utils import SplitConfig
+from utils import schema_utils
+from utils import redis_utils
+from utils.ingest_scheduler import IngestScheduler, OffsetTracker
+import subprocess
+from kafka import KafkaConsumer, OffsetAndMetadata, ConsumerRebalanceListener
+import json
+import time
+import threading
+from concurrent import futures
+from logging_config import setup_logging
+from datetime import datetime
+import re
+from settings import *
+from utils.constant import CONVERT_DIR, USER_DATA_PATH
+from utils.constant import INGEST_MAX_WORKERS, KAFKA_MAX_POLL_RECORDS
+graph_redis_client = redis_utils.get_redis_connection()
+
+# 定义路径
+paths = ["./data", "./user_data"]
+# 遍历路径列表
+for path in paths:
+    # 检查路径是否存在
+    if not os.path.exists(path):
+        # 如果不存在，则创建目录
+        os.makedirs(path)
+        print(f"目录 {path} 已创建。")
+    else:
+        print(f"目录 {path} 已存在。")
+
+
+logger_name = 'rag_asyn_add_files_utils'
+app_name = os.getenv("LOG_FILE")
+logger = setup_logging(app_name, logger_name)
+logger.info(logger_name + '---------LOG_FILE：' + repr(app_name))
+
+master_control_logger_name = 'mc_rag_asyn_add_files_utils'
+master_control_app_name = os.getenv("LOG_FILE") + "_master_control"
+master_control_logger = setup_logging(master_control_app_name, master_control_logger_name)
+master_control_logger.info(logger_name + '---------LOG_FILE：' + repr(master_control_app_name))
+
+# 向量库/全文库写入线程池，每个文件占用两个线程(milvus、es)
+store_writer_pool = futures.ThreadPoolExecutor(max_workers=INGEST_MAX_WORKERS * 2)
+
+CONVERT_OFFICE_FORMAT_MAP = {".doc": "docx", ".wps": "docx", ".xls": "xlsx", ".ppt": "pptx", ".ofd": "pdf"}
+
+def create_consumer():
+    if KAFKA_SASL_USE:
+        return KafkaConsumer(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+                             security_protocol='SASL_PLAINTEXT',
+                             sasl_mechanism='PLAIN',
+                             sasl_plain_username=KAFKA_SASL_PLAIN_USERNAME,
+                             sasl_plain_password=KAFKA_SASL_PLAIN_PASSWORD,
+                             group_id=KAFKA_GROUP_ID,
+                             enable_auto_commit=KAFKA_ENABLE_AUTO_COMMIT,
+                             max_poll_records=KAFKA_MAX_POLL_RECORDS,  # 批量拉取，由调度器控制并发
+                             value_deserializer=lambda x: x.decode('utf-8'))
+    return KafkaConsumer(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+                         group_id=KAFKA_GROUP_ID,
+                         enable_auto_commit=KAFKA_ENABLE_AUTO_COMMIT,
+                         max_poll_records=KAFKA_MAX_POLL_RECORDS,  # 批量拉取，由调度器控制并发
+                         value_deserializer=lambda x: x.decode('utf-8'))
+
+
+def parse_add_file_message(message_value):
+    """ 解析kafka消息，返回 add_files 的参数，消息不合法时返回 None """
+    doc = message_value["doc"]
+    if "ocr_model_id" not in doc:
+        logger.error("no ocr_model_id")
+        return None
+    # 文件导入时选择解析方式，默认勾选文字提取，可选光学识别ocr当多选时此参数默认为["text"],当勾选ocr时传：["text","ocr"]
+    split_config = SplitConfig(
+        sentence_size=doc["chunk_size"],
+        overlap_size=doc["overlap"],
+        chunk_type=doc.get("chunk_type", "default"),
+        separators=doc.get("separators", ['。']),
+        parser_choices=doc.get("parser_choices", ["text"]),
+        ocr_model_id=doc["ocr_model_id"],
+        split_type=doc.get("split_type", "common"),
+        child_chunk_config=doc.get("child_chunk_config", None)
+    )
+    return {
+        "user_id": doc["userId"],
+        "kb_name": doc["categoryId"],
+        "file_name": doc["originalName"],
+        "object_name": doc["objectName"],
+        "file_id": doc["id"],
+        "is_enhanced": doc.get("is_enhanced", 'false'),
+        "enable_knowledge_graph": doc.get("enable_knowledge_graph", "false"),
+        "pre_process_rules": doc.get("pre_process", []),
+        "meta_data_rules": doc.get("meta_data", []),
+        "split_config": split_config,
+        "kb_id": doc.get("kb_id", ""),
+    }
+
+
+class OffsetCommitListener(ConsumerRebalanceListener):
+    """ 分区被回收前提交已完成的 offset """
+
+    def __init__(self, consumer, tracker):
+        self.consumer = consumer
+        self.tracker = tracker
+
+    def on_partitions_revoked(self, revoked):
+        commit_finished_offsets(self.consumer, self.tracker)
+        self.tracker.forget(revoked)
+
+    def on_partitions_assigned(self, assigned):
+        pass
+
+
+def commit_finished_offsets(consumer, tracker):
+    """ 只提交已处理完成的连续 offset，需在消费者线程中调用 """
+    if KAFKA_ENABLE_AUTO_COMMIT:
+        return
+    offsets = tracker.committable()
+    if not offsets:
+        return
+    try:
+        consumer.commit(offsets={tp: OffsetAndMetadata(offset, "") for tp, offset in offsets.items()})
+        tracker.mark_committed(offsets)
+        logger.info('consumer.commit offset：' + repr(offsets))
+        master_control_logger.info('consumer.commit offset：' + repr(offsets))
+    except Exception as e:
+        logger.error("kafka提交offset异常：" + repr(e))
+
+
+def run_add_files(kwargs):
+    add_files(**kwargs)
+    logger.info('----->kafka异步消费完成：user_id=%s,kb_name=%s,filename=%s,file_id=%s,process finished' % (
+        kwargs["user_id"], kwargs["kb_name"], kwargs["file_name"], kwargs["file_id"]))
+    master_control_logger.info('----->kafka异步消费完成：user_id=%s,kb_name=%s,filename=%s,file_id=%s,process finished' % (
+        kwargs["user_id"], kwargs["kb_name"], kwargs["file_name"], kwargs["file_id"]))
+
+
+def kafkal():
+    """
+    批量拉取文档入库消息，交给有界的入库调度器处理：
+    工作线程数受限、按租户轮转、小文件优先；在途文件达到上限时暂停拉取；
+    offset 在文件处理结束后才提交
+    """
+    # 未开启异步添加时只用一个工作线程，保持逐个文件处理
+    scheduler = IngestScheduler(max_workers=INGEST_MAX_WORKERS if KAFKA_USE_ASYN_ADD else 1)
+    while True:
+        print('开始消费消息')
+        tracker = OffsetTracker()
+        consumer = create_consumer()
+        consumer.subscribe([KAFKA_TOPICS], listener=OffsetCommitListener(consumer, tracker))
+        try:
+            while True:
+                # 背压：调度器满载时暂停所有分区，但继续 poll 以维持心跳
+                if scheduler.is_full():
+                    consumer.pause(*consumer.assignment())
+                elif consumer.paused():
+                    consumer.resume(*consumer.paused())
+                records = consumer.poll(timeout_ms=1000)
+                for tp, messages in records.items():
+                    for message in messages:
+                        tracker.track(tp, message.offset)
+                        dispatch_message(scheduler, tracker, tp, message)
+                commit_finished_offsets(consumer, tracker)
+        except Exception as e:
+            import traceback
+            logger.error("kafka消费异常：" + repr(e))
+            logger.error(traceback.format_exc())
+            master_control_logger.error("kafka消费异常：" + repr(e))
+            try:
+                consumer.close(autocommit=False)
+            except Exception:
+                pass
+            time.sleep(3)
+
+
+def dispatch_message(scheduler, tracker, tp, message):
+    print('收到新kafka消息：' + repr(message.value))
+    logger.info('收到新kafka消息：' + repr(message.value))
+    master_control_logger.info('收到新kafka消息：' + repr(message.value))
+    try:
+        kwargs = parse_add_file_message(json.loads(message.value))
+    except Exception as e:
+        logger.error("kafka处理异常：" + repr(e))
+        master_control_logger.error("kafka处理异常：" + repr(e))
+        kwargs = None
+    if kwargs is None:  # 非法消息直接确认，避免阻塞分区
+        tracker.done(tp, message.offset)
+        return
+    file_size = minio_utils.get_file_size(kwargs["object_name"])
+    logger.info(f"file_name: {kwargs['file_name']}, file_size: {file_size}, "
+                f"pending: {scheduler.pending_count()}")
+    scheduler.submit(kwargs["user_id"], file_size, run_add_files, kwargs,
+                     on_done=lambda ok: tracker.done(tp, message.offset))
+
+
+def pre_process_text(text: str, pre_processing_rules: list[str]) -> str:
+    for pre_processing_rule in pre_processing_rules:
+        if pre_processing_rule == "replace_symbols":
+            pattern = r"\n{3,}"
+            text = re.sub(pattern, "\n\n", text)
+            pattern = r"[\t\f\r\x20\u00a0\u1680\u180e\u2000-\u200a\u202f\u205f\u3000]{2,}"
+            text = re.sub(pattern, " ", text)
+        elif pre_processing_rule == "delete_links":
+            pattern = r"([a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)"
+            text = re.sub(pattern, "", text)
+
+            # Remove URL but keep Markdown image URLs
+            # First, temporarily replace Markdown image URLs with a placeholder
+            markdown_image_pattern = r"!\[.*?\]\((https?://[^\s)]+)\)"
+            placeholders: list[str] = []
+
+            def replace_with_placeholder(match, placeholders=placeholders):
+                url = match.group(1)
+                placeholder = f"__MARKDOWN_IMAGE_URL_{len(placeholders)}__"
+                placeholders.append(url)
+                return f"![image]({placeholder})"
+
+            text = re.sub(markdown_image_pattern, replace_with_placeholder, text)
+
+            # Now remove all remaining URLs
+            url_pattern = r"https?://[^\s)]+"
+            text = re.sub(url_pattern, "", text)
+
+            # Finally, restore the Markdown image URLs
+            for i, url in enumerate(placeholders):
+                text = text.replace(f"__MARKDOWN_IMAGE_URL_{i}__", url)
+    return text
+
+
+def retype_meta_datas(meta_datas: list):
+    result = []
+    for item in meta_datas:
+        new_item = copy.deepcopy(item)
+        if item["value_type"] == "string":
+            new_item["string_value"] = str(item["value"])
+        elif item["value_type"] == "number" or item["value_type"] == "time":
+            new_item["int_value"] = int(item["value"])
+        result.append(new_item)
+    return result
+
+
+def parse_meta_data(docs, parse_rules):
+    result = []
+
+    if not parse_rules:
+        return result
+
+    def parse_date_to_timestamp(date_str):
+        # 常见的日期格式列表
+        date_formats = [
+            # 英文格式
+            "%Y-%m-%d %H:%M:%S",
+            "%Y-%m-%d %H:%M",
+            "%Y-%m-%d",
+            "%m/%d/%Y",
+            "%m/%d/%Y %H:%M:%S",
+            "%d/%m/%Y",
+            "%d/%m/%Y %H:%M:%S",
+            "%Y/%m/%d",
+            "%Y/%m/%d %H:%M:%S",
+
+            # 中文格式
+            "%Y年%m月%d日 %H时%M分%S秒",
+            "%Y年%m月%d日 %H:%M:%S",
+            "%Y年%m月%d日 %H时%M分",
+            "%Y年%m月%d日",
+            "%Y年%m月%d日 %H:%M",
+
+            # 其他常见格式
+            "%Y.%m.%d",
+            "%Y.%m.%d %H:%M:%S",
+        ]
+
+        # 预处理：处理一些特殊情况
+        processed_str = date_str.strip()
+        processed_str = processed_str.replace(" ", "")
+        for suffix in ["发布", "实施"]:
+            if processed_str.endswith(suffix):
+                processed_str = processed_str[:-len(suffix)]
+                break
+
+        # 尝试每种格式
+        for fmt in date_formats:
+            try:
+                dt = datetime.strptime(processed_str, fmt)
+                return int(dt.timestamp() - 8 * 3600) * 1000
+            except ValueError:
+                continue
+
+        raise ValueError(f"无法解析日期格式: {date_str}")
+
+    # for rule_name, rules in parse_rules.items():
+    for item in parse_rules:
+        pattern = item["rule"]
+        if pattern:
+            # 通过rule提取元数据
+            meta_datas = []
+            #反转义
+            tmp = pattern.encode().decode('unicode_escape')
+            pattern = tmp.encode('latin-1').decode('utf-8')
+            for doc in docs:
+                text = doc["text"]
+                matches = re.findall(pattern, text)
+                for match in matches:
+                    meta_datas.append(str(match.strip()))
+            if meta_datas:
+                item["value"] = meta_datas[-1]
+                if item["value_type"] == "time":
+                    try:
+                        item["value"] = str(parse_date_to_timestamp(item["value"]))
+                    except ValueError:
+                        # 提取的时间类型的元数据不支持转成unix timestamp
+                        continue
+            else:
+                #提取不到元数据
+                continue
+        else:
+            item["value"] = str(item["value"])
+
+        # 如果item["rule"] 为空，item["value"]是固定值
+        result.append(item)
+
+    return retype_meta_datas(result)
+
+
+def dump_chunk_files(file_name, chunks, sub_chunk):
+    """ 切分结果留档，便于排查 """
+    try:
+        with open("./data/%s_chunk.txt" % file_name, 'w', encoding='utf-8') as chunks_file:
+            for item in chunks:
+                chunks_file.write(json.dumps(item, ensure_ascii=False))
+                chunks_file.write("\n")
+        with open("./data/%s_subchunk.txt" % file_name, 'w', encoding='utf-8') as sub_chunk_file:
+            for item in sub_chunk:
+                sub_chunk_file.write(json.dumps(item, ensure_ascii=False))
+                sub_chunk_file.write("\n")
+    except Exception as e:
+        logger.error(f"file_name: {file_name}, 切分结果留档失败: {e}")
+
+
+def rollback_es_file(user_id, kb_name, file_name, kb_id=""):
+    """ milvus 写入失败时删除与其并发写入的 es 分段，避免失败文件仍可被检索 """
+    try:
+        del_es_result = es_utils.del_es_file(user_id, kb_name, file_name, kb_id=kb_id)
+        logger.info(repr(file_name) + 'milvus写入失败，回滚es结果：' + repr(del_es_result))
+        master_control_logger.info(repr(file_name) + 'milvus写入失败，回滚es结果：' + repr(del_es_result))
+    except Exception as e:
+        logger.error(repr(e))
+        master_control_logger.error('milvus写入失败，回滚es异常' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name) + repr(e))
+
+
+def add_files(user_id, kb_name, file_name, object_name, file_id,
+              is_enhanced, enable_knowledge_graph, pre_process_rules, meta_data_rules, split_config: SplitConfig, kb_id=""):
+    response_info = {'code': 0, "message": "成功"}
+    user_data_path = USER_DATA_PATH
+    convert_dir = CONVERT_DIR
+    res_filename = ""
+
+    try:
+        filepath = os.path.join(user_data_path, user_id, kb_name)
+        logger.info('add_files_filepath=%s' % filepath)
+        master_control_logger.info('add_files_filepath=%s' % filepath)
+        if not os.path.exists(filepath):
+            os.makedirs(filepath)
+        else:
+            logger.info('filepath=%s 已存在' % filepath)
+            master_control_logger.info('filepath=%s 已存在' % filepath)
+        logger.info('文档查重开始')
+        master_control_logger.info('文档查重开始')
+        files_in_milvus = milvus_utils.list_knowledge_file(user_id, kb_name, kb_id=kb_id)
+        logger.info('向量库已有文档查询结果：' + repr(files_in_milvus))
+        master_control_logger.info('向量库已有文档查询结果：' + repr(files_in_milvus))
+
+        if files_in_milvus['code'] != 0:
+            logger.error('文档向量库重复查询校验失败')
+            master_control_logger.error('文档向量库重复查询校验失败')
+            mq_rel_utils.update_doc_status(file_id, status=51)
+            return
+        filenames_in_milvus = files_in_milvus['data']['knowledge_file_names']
+        if file_name in filenames_in_milvus:
+            logger.error('文档已存在该知识库')
+            master_control_logger.error('文档已存在该知识库')
+            mq_rel_utils.update_doc_status(file_id, status=52)
+            return
+        else:
+            logger.info('文档查重完成')
+            master_control_logger.info('文档查重完成')
+            mq_rel_utils.update_doc_status(file_id, status=31)
+    except Exception as e:
+        logger.error(repr(e))
+        logger.error('文档向量库重复查询校验失败')
+        master_control_logger.error('文档向量库重复查询校验失败' + repr(e))
+        mq_rel_utils.update_doc_status(file_id, status=51)
+        return
+
+    try:
+        logger.info('文档下载开始')
+        master_control_logger.info('文档下载开始')
+        download_path = os.path.join(filepath, file_name)
+        download_status, download_link = minio_utils.get_file_from_minio(object_name, download_path)
+        logger.info("------>download_link:%s" % download_link)
+        master_control_logger.info("------>download_link:%s" % download_link)
+        if not download_status:
+            logger.error('文档下载失败')
+            master_control_logger.error('文档下载失败')
+            mq_rel_utils.update_doc_status(file_id, status=53)
+            return
+        else:
+            logger.info('文档下载完成')
+            master_control_logger.info('文档下载完成')
+            mq_rel_utils.update_doc_status(file_id, status=32)
+            # 转换文件格式
+            base_filename, file_extension = os.path.splitext(file_name)  # 分离文件名和后缀
+            master_control_logger.info(f"base_filename={base_filename} file_extension={file_extension}")
+            if "model" in split_config.parser_choices and file_extension in [".doc", ".docx", ".pptx"]:  # 先判断是否模型解析
+                convert_office_format_map = {".doc": "pdf", ".docx": "pdf", ".pptx": "pdf"}
+                target_format = convert_office_format_map[file_extension]  # 获取目标格式
+                res_filename = knowledge_base_utils.convert_office_file(download_path, convert_dir, target_format)
+                if res_filename:
+                    master_control_logger.error(f"{download_path} convert_office_file successfully => {res_filename}")
+                else:
+                    master_control_logger.error(f"{download_path} convert_office_file failed")
+                    mq_rel_utils.update_doc_status(file_id, status=53)
+                    return
+            elif file_extension in CONVERT_OFFICE_FORMAT_MAP:
+                target_format = CONVERT_OFFICE_FORMAT_MAP[file_extension]  # 获取目标格式
+                res_filename = knowledge_base_utils.convert_office_file(download_path, convert_dir, target_format)
+                if res_filename:
+                    master_control_logger.error(f"{download_path} convert_office_file successfully => {res_filename}")
+                else:
+                    master_control_logger.error(f"{download_path} convert_office_file failed")
+                    mq_rel_utils.update_doc_status(file_id, status=53)
+                    return
+
+    except Exception as e:
+        logger.error(repr(e))
+        logger.error('文档下载失败')
+        master_control_logger.error('文档下载失败' + repr(e))
+        mq_rel_utils.update_doc_status(file_id, status=53)
+        return
+
+    meta_parsed = {}
+    try:
+        logger.info('文档切分开始')
+        master_control_logger.info('文档切分开始')
+        if res_filename:  # 需要传递转换后的 文件路径
+            add_file_path = res_filename
+        else:
+            add_file_path = download_path
+        logger.info('------>add_file_path=%s' % add_file_path)
+        master_control_logger.info('------>add_file_path=%s' % add_file_path)
+        # 检查文件是否存在
+        if os.path.exists(add_file_path):
+            logger.info(f'{user_id}-{kb_name}' + '文件已成功保存存在本地, 文件路径是：' + add_file_path)
+            master_control_logger.info(f'{user_id}-{kb_name}' + '文件已成功保存存在本地, 文件路径是：' + add_file_path)
+        else:
+            logger.info(f'{user_id}-{kb_name}' + add_file_path + ",文件在本地不存在，未保存成功")
+            master_control_logger.info(f'{user_id}-{kb_name}' + add_file_path + ",文件在本地不存在，未保存成功")
+            logger.error('文档下载完成，但文件不存在本地')
+            master_control_logger.error('文档下载完成，但文件不存在本地')
+            mq_rel_utils.update_doc_status(file_id, status=53)
+            return
+
+        sub_chunk, chunks = file_utils.split_text_file(add_file_path, download_link, split_config)
+
+        if is_enhanced == 'true' and len(chunks) > 0:
+            logger.info(f'is_enhanced:{is_enhanced}')
+            # enhance_subchunk = add_enhance_subchunk(chunks)
+            # if len(enhance_subchunk) > 0:
+            #     sub_chunk.extend(enhance_subchunk)
+
+        meta_parsed = parse_meta_data(chunks, meta_data_rules)
+        logger.info(f"file_name: {file_name}, meta提取规则: {meta_data_rules}, 提取元数据: {meta_parsed}")
+        logger.info(f"file_name: {file_name}, 文本预处理规则: {pre_process_rules}")
+        logger.info(repr(file_name) + '文档切分长度：' + repr(len(chunks)))
+        logger.info(repr(file_name) + '文档递归切分长度：' + repr(len(sub_chunk)))
+        master_control_logger.info(repr(file_name) + '文档切分长度：' + repr(len(chunks)))
+        master_control_logger.info(repr(file_name) + '文档递归切分长度：' + repr(len(sub_chunk)))
+
+        file_meta = {}
+        for item in chunks:
+            if "download_link" not in item["meta_data"]:
+                item["meta_data"]["download_link"] = download_link  # 添加file下载链接
+            if res_filename and "file_name" in item["meta_data"]:  # 如果有转换后的文件，则替换回原来文件名
+                item["meta_data"]["file_name"] = file_name
+            # 存储 BUCKET 和 object_name
+            item["meta_data"]["bucket_name"] = BUCKET_NAME  # 添加文件桶名
+            item["meta_data"]["object_name"] = object_name  # 添加文件下载对象名
+
+            if pre_process_rules:
+                item["text"] = pre_process_text(item["text"], pre_process_rules)
+            item["meta_data"]["doc_meta"] = meta_parsed
+            if not file_meta:
+                file_meta = item["meta_data"]
+        for item in sub_chunk:
+            if "download_link" not in item["meta_data"]:
+                item["meta_data"]["download_link"] = download_link  # 添加file下载链接
+            if res_filename and "file_name" in item["meta_data"]:  # 如果有转换后的文件，则替换回原来文件名
+                item["meta_data"]["file_name"] = file_name
+            # 存储 BUCKET 和 object_name
+            item["meta_data"]["bucket_name"] = BUCKET_NAME  # 添加文件桶名
+            item["meta_data"]["object_name"] = object_name  # 添加文件下载对象名
+
+            if pre_process_rules:
+                item["content"] = pre_process_text(item["content"], pre_process_rules)
+            item["meta_data"]["doc_meta"] = meta_parsed
+
+        if len(chunks) == 0 or len(sub_chunk) == 0:
+            logger.error('文档切分失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            master_control_logger.error('文档切分失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            mq_rel_utils.update_doc_status(file_id, status=61)
+            return
+        else:
+            logger.info('文档切分完成' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            master_control_logger.info('文档切分完成' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            mq_rel_utils.update_doc_status(file_id, status=33)
+    except Exception as e:
+        import traceback
+        logger.error("add_konwledge error %s" % e)
+        logger.error(traceback.format_exc())
+        if "Error loading" in repr(e):  # 文件不可用
+            logger.error('文档切分失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            master_control_logger.error(
+                '文档切分失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name) + repr(e))
+            mq_rel_utils.update_doc_status(file_id, status=62)
+            return
+        else:
+            logger.error(repr(e))
+            logger.error('文档切分失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            master_control_logger.error('文档切分失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name) + repr(e))
+            mq_rel_utils.update_doc_status(file_id, status=54)
+            return
+    try:
+        logger.info('添加文档meta开始' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+        master_control_logger.info('添加文档meta开始' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+        add_file_result = es_utils.add_file(user_id, kb_name, file_name, file_meta, kb_id=kb_id)
+        logger.info(repr(file_name) + '添加文档meta结果：' + repr(add_file_result))
+        master_control_logger.info(repr(file_name) + '添加文档meta结果：' + repr(add_file_result))
+        if add_file_result['code'] != 0:
+            # 回调
+            logger.error('添加文档meta失败'+ "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            master_control_logger.error('添加文档meta失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            mq_rel_utils.update_doc_status(file_id, status=55)
+            return
+        else:
+            logger.info('添加文档meta完成'+ "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+    except Exception as e:
+        logger.error(repr(e))
+        logger.error('添加文档meta失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+        master_control_logger.error(
+            '添加文档meta失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name) + repr(e))
+        mq_rel_utils.update_doc_status(file_id, status=55)
+        return
+
+    # 向量库与全文库互不依赖，并发写入；状态回调仍按 milvus -> es 的顺序上报
+    logger.info('文档插入milvus、es开始' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+    master_control_logger.info('文档插入milvus、es开始' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+    milvus_future = store_writer_pool.submit(milvus_utils.add_milvus, user_id, kb_name, sub_chunk, file_name,
+                                             add_file_path, kb_id=kb_id)
+    es_future = store_writer_pool.submit(es_utils.add_es, user_id, kb_name, chunks, file_name, kb_id=kb_id)
+    futures.wait([milvus_future, es_future])
+    # 切分结果留档不在入库的关键路径上，写入结束后后台落盘
+    threading.Thread(target=dump_chunk_files, args=(file_name, chunks, sub_chunk), daemon=True).start()
+
+    try:
+        insert_milvus_result = milvus_future.result()
+        logger.info(repr(file_name) + '添加milvus结果：' + repr(insert_milvus_result))
+        master_control_logger.info(repr(file_name) + '添加milvus结果：' + repr(insert_milvus_result))
+        if insert_milvus_result['code'] != 0:
+            logger.error('文档插入milvus失败'+ "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            master_control_logger.error('文档插入milvus失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            rollback_es_file(user_id, kb_name, file_name, kb_id=kb_id)
+            mq_rel_utils.update_doc_status(file_id, status=55)
+            return
+        else:
+            logger.info('文档插入milvus完成'+ "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            master_control_logger.info('文档插入milvus完成' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            mq_rel_utils.update_doc_status(file_id, status=34)
+    except Exception as e:
+        logger.error(repr(e))
+        logger.error('文档插入milvus失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+        master_control_logger.error('文档插入milvus失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name) + repr(e))
+        rollback_es_file(user_id, kb_name, file_name, kb_id=kb_id)
+        mq_rel_utils.update_doc_status(file_id, status=55)
+        return
+
+    try:
+        insert_es_result = es_future.result()
+        logger.info(repr(file_name) + '添加es结果：' + repr(insert_es_result))
+        master_control_logger.info(repr(file_name) + '添加es结果：' + repr(insert_es_result))
+        if insert_es_result['code'] != 0:
+            logger.error('文档插入es失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            master_control_logger.error('文档插入es失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            mq_rel_utils.update_doc_status(file_id, status=56)
+            return
+        else:
+            logger.info('文档插入es完成' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            master_control_logger.info('文档插入es完成' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+            mq_rel_utils.update_doc_status(file_id, status=35)
+    except Exception as e:
+        logger.error(repr(e))
+        logger.error('文档插入es失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name))
+        master_control_logger.error('文档插入es失败' + "user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name) + repr(e))
+        mq_rel_utils.update_doc_status(file_id, status=56)
+        return
+
+    # --------------7、最终完成
+
+    logger.info("user_id=%s,kb_name=%s,file_name=%s" % (user_id, kb_name, file_name) + '===== 文档上传成功且完成')
+    master_control_logger.info("user_id=%s,kb_name=%s,file_name=%s,kb_id=%s" % (user_id, kb_name, file_name, kb_id) + '===== 文档上传成功且完成')
+    mq_rel_utils.update_doc_status(file_id, status=10, meta_datas=meta_parsed)
+
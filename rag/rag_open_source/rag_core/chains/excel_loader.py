@@ -3,6 +3,8 @@ import logging
 
 import re
 import json
+import heapq
+from bisect import bisect_right
 from pathlib import Path
 from typing import List, Optional, cast
 # from langchain.docstore.document import Document
@@ -11,6 +13,11 @@ from langchain_core.documents import Document
 from langchain_community.document_loaders import TextLoader
 from openpyxl import load_workbook
 from openpyxl.utils.cell import coordinate_from_string, column_index_from_string, get_column_letter
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries
+from openpyxl.packaging.relationship import RelationshipList, get_dependents, get_rels_path
+from openpyxl.worksheet.hyperlink import HyperlinkList
+from openpyxl.xml.constants import SHEET_MAIN_NS
+from openpyxl.xml.functions import iterparse
 import sys
 import os
 import nltk
@@ -51,153 +58,320 @@ def trans_excel(filepath,del_columns=[]):
             f.write(text+"\n")
     return filepath.replace(".xlsx", ".txt")
 
+ROW_TAG = '{%s}row' % SHEET_MAIN_NS
+MERGE_CELL_TAG = '{%s}mergeCell' % SHEET_MAIN_NS
+HYPERLINKS_TAG = '{%s}hyperlinks' % SHEET_MAIN_NS
+
+
+class MergedCellIndex:
+    """
+    合并单元格的按行区间索引。
+    行号递增查询，扫描线维护覆盖当前行的合并区域，每行合并为有序不相交的列区间后二分查找，
+    避免每个单元格线性扫描全部合并区域。
+    """
+
+    def __init__(self, ranges):
+        # ranges: [(min_col, min_row, max_col, max_row)]，按工作表中的顺序
+        self._ranges = sorted(enumerate(ranges), key=lambda item: item[1][1])
+        self._next = 0
+        self._active = []  # 最小堆 (max_row, 顺序号, bounds)
+        self._starts = []
+        self._ends = []
+        self._row = 0
+
+    def move_to(self, row):
+        """定位到第 row 行，返回该行是否存在合并单元格"""
+        changed = False
+        while self._active and self._active[0][0] < row:
+            heapq.heappop(self._active)
+            changed = True
+        while self._next < len(self._ranges) and self._ranges[self._next][1][1] <= row:
+            order, bounds = self._ranges[self._next]
+            self._next += 1
+            if bounds[3] >= row:
+                heapq.heappush(self._active, (bounds[3], order, bounds))
+                changed = True
+        if changed:
+            spans = sorted((bounds[0], bounds[2]) for _, _, bounds in self._active)
+            self._starts, self._ends = [], []
+            for min_col, max_col in spans:
+                if self._ends and min_col <= self._ends[-1]:
+                    self._ends[-1] = max(self._ends[-1], max_col)
+                else:
+                    self._starts.append(min_col)
+                    self._ends.append(max_col)
+        self._row = row
+        return bool(self._active)
+
+    def contains(self, col):
+        """当前行第 col 列是否位于合并区域内(含左上角单元格)"""
+        i = bisect_right(self._starts, col) - 1
+        return i >= 0 and col <= self._ends[i]
+
+    def covering(self, col):
+        """当前行覆盖第 col 列的合并区域，按工作表中的顺序"""
+        return [bounds for _, _, bounds in sorted(self._active, key=lambda item: item[1])
+                if bounds[0] <= col <= bounds[2]]
+
+    def is_merged_cell(self, col):
+        """当前行第 col 列是否为合并区域中除左上角以外的单元格，完整模式下其值恒为 None"""
+        if not self.contains(col):
+            return False
+        return any((bounds[1], bounds[0]) != (self._row, col) for bounds in self.covering(col))
+
+
+class ReadOnlySheet:
+    """
+    只读模式打开的工作表。
+    只读模式不提供合并单元格与超链接，这里先流式预扫描一遍工作表 xml，得到合并区域、超链接以及
+    与完整模式一致的行列范围，再按行返回与完整模式下 iter_rows(values_only=True) 相同的值。
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.merged_ranges = []
+        self.hyperlinks = {}  # (row, col) -> 超链接目标地址
+        self.link_values = {}  # (row, col) -> 单元格为空时以超链接地址作为值
+        self.max_row = 1
+        self.max_column = 1
+        self.is_empty = True
+        self._scan()
+
+    def _scan(self):
+        max_row = max_col = 0
+        row_counter = 0
+        links = []
+        # 只读工作表没有公开的 xml 读取接口，与 openpyxl 内部按需读取的方式一致
+        src = self.ws._get_source()
+        try:
+            for _, element in iterparse(src):
+                tag = element.tag
+                if tag == ROW_TAG:
+                    r = element.get("r")
+                    row_counter = int(float(r)) if r else row_counter + 1
+                    col_counter = 0
+                    for cell in element:
+                        coordinate = cell.get("r")
+                        if coordinate:
+                            row, col_counter = coordinate_to_tuple(coordinate)
+                        else:
+                            col_counter += 1
+                            row = row_counter
+                        max_row = max(max_row, row)
+                        max_col = max(max_col, col_counter)
+                    element.clear()
+                elif tag == MERGE_CELL_TAG:
+                    self.merged_ranges.append(range_boundaries(element.get("ref")))
+                elif tag == HYPERLINKS_TAG:
+                    links = HyperlinkList.from_tree(element).hyperlink
+                    element.clear()
+        finally:
+            src.close()
+
+        for min_col, min_row, range_max_col, range_max_row in self.merged_ranges:
+            max_row = max(max_row, range_max_row)
+            max_col = max(max_col, range_max_col)
+        if links:
+            self._bind_hyperlinks(links)
+        for row, col in self.hyperlinks:
+            max_row = max(max_row, row)
+            max_col = max(max_col, col)
+        if max_row:
+            self.is_empty = False
+            self.max_row = max_row
+            self.max_column = max_col
+
+    def _bind_hyperlinks(self, links):
+        """与完整模式绑定超链接的规则一致：合并区域内的单元格链接到左上角，后出现的链接覆盖先出现的"""
+        rels = None
+        targets = []
+        for link in links:
+            target = link.target
+            if link.id:
+                if rels is None:
+                    rels = RelationshipList()
+                    rels_path = get_rels_path(self.ws._worksheet_path)
+                    if rels_path in self.ws.parent._archive.namelist():
+                        rels = get_dependents(self.ws.parent._archive, rels_path)
+                target = rels[link.id].Target
+            if ":" in link.ref:
+                min_col, min_row, max_col, max_row = range_boundaries(link.ref)
+                cells = [(row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)]
+            else:
+                cells = [coordinate_to_tuple(link.ref)]
+            targets.append((target, link.location, ":" in link.ref, cells))
+
+        # 按行扫描一次合并区域，判断链接单元格是否位于合并区域内
+        merged_cells = {}
+        index = MergedCellIndex(self.merged_ranges)
+        for row, col in sorted({cell for _, _, _, cells in targets for cell in cells}):
+            if index.move_to(row) and index.is_merged_cell(col):
+                anchor = index.covering(col)[0]
+                merged_cells[(row, col)] = (anchor[1], anchor[0])
+
+        for target, location, is_range, cells in targets:
+            for cell in cells:
+                if cell in merged_cells:
+                    if is_range:
+                        continue
+                    cell = merged_cells[cell]
+                self.hyperlinks[cell] = target
+                value = target or location
+                if value is not None:
+                    self.link_values.setdefault(cell, value)
+
+    def iter_values(self, min_row=1, max_row=None, max_col=None):
+        """
+        按行返回 (行号, 值元组, 合并区域索引)，值与完整模式下 ws.iter_rows(values_only=True) 一致；
+        合并区域索引已定位到当前行，该行没有合并单元格时为 None
+        """
+        if self.is_empty:
+            return
+        max_row = max_row or self.max_row
+        max_col = max_col or self.max_column
+        index = MergedCellIndex(self.merged_ranges)
+        link_rows = {}
+        for (row, col), value in self.link_values.items():
+            link_rows.setdefault(row, {})[col] = value
+        rows = self.ws.iter_rows(min_row=min_row, max_row=max_row, max_col=max_col, values_only=True)
+        for row_idx, values in enumerate(rows, start=min_row):
+            has_merged = index.move_to(row_idx)
+            row_links = link_rows.get(row_idx)
+            if has_merged or row_links:
+                values = list(values)
+                if has_merged:
+                    for col in range(1, len(values) + 1):
+                        if index.is_merged_cell(col):
+                            values[col - 1] = None
+                if row_links:
+                    for col, value in row_links.items():
+                        if col <= len(values) and values[col - 1] is None:
+                            values[col - 1] = value
+                values = tuple(values)
+            yield row_idx, values, index if has_merged else None
+
+
 class ExcelLoader(TextLoader):
 
     def load(self) -> List[Document]:
         """Load from file path."""
-        text = ""
+        text_parts = []
         # max_sen_size = 3000
         try:
             path_obj = Path(self.file_path)
             file_name = path_obj.stem
-            file_full_name = os.path.split(self.file_path)[-1]
-            wb = load_workbook(filename=self.file_path, data_only=True)
-
-            valid_sheet_list = []
-            for sheet_name in wb.sheetnames:
-                ws = wb[sheet_name]
-                total_rows = int(ws.max_row)
-                if total_rows > 1:
-                    valid_sheet_list.append(sheet_name)
-            print(valid_sheet_list)
-            for sheet_name in valid_sheet_list:
-                ws = wb[sheet_name]
-                # ws = wb.active
-                # 打印总行数
-                total_rows = int(ws.max_row)
-
-                logger.info(f"=======>Total rows in '{file_name}_{sheet_name}': {total_rows}")
-                # 获取所有合并单元格的范围
-                merged_cells_ranges = ws.merged_cells.ranges
-                # 将合并单元格范围转换为更易于处理的格式
-                merged_ranges = []
-                for rng in merged_cells_ranges:
-                    min_row, min_col, max_row, max_col = rng.bounds
-                    merged_ranges.append(((min_row, min_col), (max_row, max_col)))
-                columns = [cell.value for cell in next(ws.iter_rows()) if cell.value is not None]
-                last_column_dict = {}
-                if len(valid_sheet_list) > 1:
-                    title = "Excel工作簿名称：%s, 每行信息如下:" % sheet_name
-                else:
-                    title = "Excel中每行信息如下:"
-                text += title + "\n"
-                for row_idx, row in enumerate(ws.iter_rows(min_row=2, max_col=len(columns), values_only=True), start=2):
-                    # 检查行是否全为空
-                    if all(cell is None for cell in row):
-                        continue  # 跳过空行
-
-
-                    for idx, cell_value in enumerate(row, start=1):
-
-                        # 检查单元格是否在合并单元格范围内
-                        column_letter = get_column_letter(idx)  # 直接使用列索引获取列字母
-                        # 检查单元格是否在合并单元格范围内
-                        cell_position = f'{column_letter}{row_idx}'
-                        col_num, row_num = coordinate_from_string(cell_position)
-                        col_num_index = column_index_from_string(col_num)  # 将列字母转换为列号
-                        column_name = str(columns[col_num_index - 1])
-                        cell_coordinate = f"{col_num}{row_num}"
-                        cell = ws[cell_coordinate]
-                        if cell.hyperlink:
-                            get_last_value = f"[{cell_value}]({cell.hyperlink.target})"
-                            text = text + column_name + ":" + get_last_value + ";"
-                            continue
-
-                        if cell_value is None and any(
-                                min_row <= row_num <= max_row and min_col <= col_num_index <= max_col
-                                for ((min_col, min_row), (max_col, max_row)) in merged_ranges):
-                            # print(f"Cell {cell_position} is part of a merged cell.")
-                            get_last_value = str(
-                                last_column_dict[column_name]) if column_name in last_column_dict else ""
-                            text = text + column_name + ":" + get_last_value + ";"
-                            # 根据需求处理合并单元格的值
-                        elif len(columns) >= col_num_index:
-                            cell_process_value = '' if cell_value is None else str(cell_value).replace("\n", " ")
-
-                            # if '\\' in cell_process_value:
-                            #     cell_process_value = eval(repr(cell_process_value.replace('\\\\', '\\')))
-
-                            if column_name:
-                                text = text + column_name + ":" + cell_process_value + ";"
-                            else:
-                                text = text + cell_process_value + ";"
-                            # logger.info("========>cell_process_value=%s,text=%s" % (cell_process_value, text))
-                            # 若本单元格有值且存在跨单元格合并则缓存到历史dict中
-                            if cell_value and any(min_row <= row_num <= max_row and min_col <= col_num_index <= max_col
-                                                  for ((min_col, min_row), (max_col, max_row)) in merged_ranges):
-                                last_column_dict[column_name] = cell_value
-
-                    # if len(text) > max_sen_size:
-                    #     text = text[:max_sen_size]
-                    text += "\n"
-                    logger.info("=======>row_idx=%s,chunk_size=%s" % (row_idx, len(text)))
-            print("=======>len=%s,text=%s" % (len(text),text))
+            wb = load_workbook(filename=self.file_path, read_only=True, data_only=True)
+            try:
+                sheets = {}
+                valid_sheet_list = []
+                for sheet_name in wb.sheetnames:
+                    sheet = ReadOnlySheet(wb[sheet_name])
+                    if sheet.max_row > 1:
+                        valid_sheet_list.append(sheet_name)
+                        sheets[sheet_name] = sheet
+                logger.info(f"=======>valid sheets in '{file_name}': {valid_sheet_list}")
+                for sheet_name in valid_sheet_list:
+                    sheet = sheets.pop(sheet_name)
+                    # 打印总行数
+                    total_rows = sheet.max_row
+                    logger.info(f"=======>Total rows in '{file_name}_{sheet_name}': {total_rows}")
+                    _, first_row, _ = next(sheet.iter_values(max_row=1))
+                    columns = [value for value in first_row if value is not None]
+                    last_column_dict = {}
+                    if len(valid_sheet_list) > 1:
+                        title = "Excel工作簿名称：%s, 每行信息如下:" % sheet_name
+                    else:
+                        title = "Excel中每行信息如下:"
+                    text_parts.append(title + "\n")
+                    for row_idx, row, merged in sheet.iter_values(min_row=2, max_col=len(columns)):
+                        # 检查行是否全为空
+                        if all(cell is None for cell in row):
+                            continue  # 跳过空行
+
+                        for col_num_index, cell_value in enumerate(row, start=1):
+                            column_name = str(columns[col_num_index - 1])
+                            if (row_idx, col_num_index) in sheet.hyperlinks:
+                                get_last_value = f"[{cell_value}]({sheet.hyperlinks[(row_idx, col_num_index)]})"
+                                text_parts.append(column_name + ":" + get_last_value + ";")
+                                continue
+
+                            # 检查单元格是否在合并单元格范围内
+                            in_merged = merged is not None and merged.contains(col_num_index)
+                            if cell_value is None and in_merged:
+                                get_last_value = str(
+                                    last_column_dict[column_name]) if column_name in last_column_dict else ""
+                                text_parts.append(column_name + ":" + get_last_value + ";")
+                                # 根据需求处理合并单元格的值
+                            elif len(columns) >= col_num_index:
+                                cell_process_value = '' if cell_value is None else str(cell_value).replace("\n", " ")
+
+                                if column_name:
+                                    text_parts.append(column_name + ":" + cell_process_value + ";")
+                                else:
+                                    text_parts.append(cell_process_value + ";")
+                                # 若本单元格有值且存在跨单元格合并则缓存到历史dict中
+                                if cell_value and in_merged:
+                                    last_column_dict[column_name] = cell_value
+
+                        text_parts.append("\n")
+            finally:
+                wb.close()
 
         except ValueError as ve:
             logger.info(f"遇到值错误: {ve}. 请检查文件中的数据是否符合预期格式.")
         except Exception as e:
             raise RuntimeError(f"Error loading {self.file_path}") from e
 
+        text = "".join(text_parts)
+        logger.info("=======>len=%s" % len(text))
         metadata = {"source": self.file_path}
         return [Document(page_content=text, metadata=metadata)]
 
 
 
     def load_and_split_doc(self) -> (List[dict]):
+        return list(self.iter_split_doc())
 
-        chunks = []
-        embedding_content = []
-        max_sen_size = 3000
+    def iter_split_doc(self):
+        """
+        按行产出切分结果。工作簿以只读模式流式读取，不再整本加载为单元格对象；
+        行内取值沿用 DataFrame 的类型推断，因此按工作表构建 DataFrame。
+        """
         try:
-            path_obj = Path(self.file_path)
-            file_name = path_obj.stem
-            file_full_name = os.path.split(self.file_path)[-1]
-            wb = load_workbook(filename=self.file_path, data_only=True)
-            for sheet_name in wb.sheetnames:
-                sheet = wb[sheet_name]
-                data = sheet.values
-                try:
-                    cols = next(data)
-                except StopIteration:
-                    continue
-                df = pd.DataFrame(data, columns=cols)
-
-                df.dropna(how="all", inplace=True)
-
-                for index, row in df.iterrows():
-                    page_content = []
-                    for col_index, (k, v) in enumerate(row.items()):
-                        if pd.notna(v):
-                            cell = sheet.cell(
-                                row=cast(int, index) + 2, column=col_index + 1
-                            )  # +2 to account for header and 1-based index
-                            if cell.hyperlink:
-                                value = f"[{v}]({cell.hyperlink.target})"
-                                page_content.append(f'"{k}":"{value}"')
-                            else:
-                                page_content.append(f'"{k}":"{v}"')
-                    # documents.append(
-                    #     Document(page_content=";".join(page_content), metadata={"source": self._file_path})
-                    # )
-                    text = ";".join(page_content)
-                    row_num = cast(int, index) + 2
-                    # print("index=%s,text=%s" % (row_num, text))
-                    chunk = {"text": text, "type": "text", "embedding_chunks": [],
-                             "meta_data": {"chunk_type": "excel", "chunk_size": len(text),
-                                           "row_num": row_num, "sheet_name": sheet_name}}
-                    chunks.append(chunk)
-
-                    logger.info("=======>row_idx=%s,chunk_size=%s" % (row_num, len(text)))
+            wb = load_workbook(filename=self.file_path, read_only=True, data_only=True)
+            try:
+                for sheet_name in wb.sheetnames:
+                    sheet = ReadOnlySheet(wb[sheet_name])
+                    data = (values for _, values, _ in sheet.iter_values())
+                    try:
+                        cols = next(data)
+                    except StopIteration:
+                        continue
+                    df = pd.DataFrame(data, columns=cols)
+
+                    df.dropna(how="all", inplace=True)
+
+                    row_count = 0
+                    for index, row in df.iterrows():
+                        page_content = []
+                        row_num = cast(int, index) + 2  # +2 to account for header and 1-based index
+                        for col_index, (k, v) in enumerate(row.items()):
+                            if pd.notna(v):
+                                if (row_num, col_index + 1) in sheet.hyperlinks:
+                                    value = f"[{v}]({sheet.hyperlinks[(row_num, col_index + 1)]})"
+                                    page_content.append(f'"{k}":"{value}"')
+                                else:
+                                    page_content.append(f'"{k}":"{v}"')
+                        text = ";".join(page_content)
+                        chunk = {"text": text, "type": "text", "embedding_chunks": [],
+                                 "meta_data": {"chunk_type": "excel", "chunk_size": len(text),
+                                               "row_num": row_num, "sheet_name": sheet_name}}
+                        row_count += 1
+                        yield chunk
+
+                    logger.info("=======>sheet_name=%s,row_count=%s" % (sheet_name, row_count))
+            finally:
+                wb.close()
 
         except Exception as e:
             import traceback
@@ -205,9 +379,6 @@ class ExcelLoader(TextLoader):
             logger.error(traceback.format_exc())
             # raise RuntimeError(f"Error loading {self.file_path}") from e
 
-        # metadata = {"source": self.file_path}
-        return chunks
-
     def load_and_split_xls(self) -> (List[dict]):
 
         chunks = []
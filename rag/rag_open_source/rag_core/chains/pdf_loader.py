@@ -27,6 +27,9 @@ nltk.data.path.append(nltk_data_path)
 
 from utils import minio_utils
 from utils import ocr_utils
+from chains.pdf_page_parser import (has_table, contains_figure, scan_text_line, scan_text_element,
+                                     iter_parsed_pages)
+from utils.constant import PDF_PROBE_PAGES
 from logging_config import setup_logging
 #
 logger_name='rag_pdf_loader'
@@ -35,31 +38,6 @@ logger = setup_logging(app_name,logger_name)
 logger.info(logger_name+'---------LOG_FILE：'+repr(app_name))
 
 
-
-
-def has_table(page, min_rows=2, min_cols=2):
-    """
-    判断给定的 pdfplumber.Page 对象中是否包含实际的表格。
-
-    参数:
-        page (pdfplumber.page.Page): 由 pdfplumber 解析得到的页面对象。
-        min_rows (int): 考虑为表格的最小行数，默认为2。
-        min_cols (int): 考虑为表格的最小列数，默认为2。
-
-    返回:
-        bool: 如果页面包含表格则返回 True，否则返回 False。
-    """
-    tables = page.find_tables(table_settings={
-        "vertical_strategy": "lines_strict",
-        "horizontal_strategy": "lines_strict"
-    })
-
-    for table in tables:
-        # 检查表格是否至少有指定数量的行和列
-        if len(table.rows) >= min_rows and len(table.cells[0]) >= min_cols:
-            return True
-
-    return False
 def is_chinese_char(cp):
     """Check if a character is a Chinese character."""
     return '\u4e00' <= cp <= '\u9fff'
@@ -133,91 +111,33 @@ class PDFLoader(TextLoader):
         # self.file_name = os.path.split(file_path)[-1]
         # print(f"PDFLoader initialized with file_path: {self.file_path}, download_link: {self.download_link}")  # 添加调试语句
 
-    def tb_text_extraction(self, text_line, height_list, title_list, page_width):
-        # 从行元素中提取文本
-        line_text = ""
-        line_size = 0
-        has_min_height = False
-        # line_text = element.get_text()
+    def apply_title(self, scan, height_list, title_list, strip_newline=False):
+        """
+        根据逐字符扫描结果和全文行高分布判断标题，并维护跨页的标题层级 title_list
+        """
+        line_text, line_formats, line_size, width_full_line, char_sizes = scan
         line_is_title = False
-        width_full_line = False
         high_height = False
-        title_level = 0
         title_coverage = False
+        title_level = 0
         last_height_dict = height_list[-1]
         parent_title_list = []
-        title_in_range = False
-        # 探析文本的格式
-        # 用文本行中出现的所有格式初始化列表
-        line_formats = []
         line_meta = {"line_is_title": line_is_title, "title_level": title_level, "line_text": line_text}
-        # x0, y0, x1, y1 = text_line.bbox
-        # if x0 >= 40 and x1 <= 553 and y0 <= 750 and y1 >= 85:
-        #     title_in_range = True
-        line_size = round(text_line['bottom'] - text_line['top'])
-        # 标题行不充满整行
-        width_full_line = True if (text_line['x1'] - text_line['x0']) >= (page_width-10) else False
-        # if text_line.y1 <= (page_height - 50):
-        # 遍历文本行中的每个字符
-
-        # current_line_dicts = []  # 用于存储当前行的字符信息
-        for i, character in enumerate(text_line['chars']):
-            # 判断标题条件1：单元行中字符的尺寸是否包含尺寸最小的字符信息，若包含则此行不是标题
-            if isinstance(character, dict) and (83 < character['y1'] < 756):
-                char_size = round(character['height'])
-                if str(char_size) in last_height_dict:
-                    has_min_height = True
-                char_dict = {
-                    "text": character['text'],
-                    "bbox": (character['x0'], character['y0'], character['x1'], character['y1']),
-                    "font_name": character['fontname'],
-                    "size": char_size
-                }
-
-                # 尝试在之前的行中找到相同文本的字符
-                for prev_char_dict in reversed(line_formats):  # 从后往前遍历，减少搜索量
-                    if prev_char_dict["text"] == char_dict["text"] and prev_char_dict["font_name"] == char_dict["font_name"] and prev_char_dict["size"] == char_dict["size"]:
-                        # 计算x0的差值
-                        x0_diff = character['x0'] - prev_char_dict["bbox"][0]
-                        if x0_diff > 1 or x0_diff < -100:  # 如果差值大于1，则添加新的char_dict
-                            if i > 0 and (character['x0'] - text_line['chars'][i - 1]['x1'] > 5):
-                                line_text += " " + char_dict["text"]
-                            else:
-                                line_text += char_dict["text"]
-                            line_formats.append(char_dict)
-                        break  # 不需要继续搜索，因为相同的文本在同一行中只会出现一次
-                else:  # 如果在line_formats中没有找到相同文本的字符
-                    # 若当前字符的x0坐标比上一个字符的x1坐标差值>5则说明有空格，需要补充空格
-                    if i > 0 and (character['x0']-text_line['chars'][i-1]['x1'] > 5):
-                        line_text += " " + char_dict["text"]
-                    else:
-                        line_text += char_dict["text"]
-                    line_formats.append(char_dict)
-                    # 找到行中唯一的字体大小和名称
-            # line_formats.extend(current_line_dicts)
-        
-        # format_per_line = list(set(line_formats))
-        # if line_text =='有   意   留   白':
-        #     line_text = ""
+        # 判断标题条件1：单元行中字符的尺寸是否包含尺寸最小的字符信息，若包含则此行不是标题
+        has_min_height = any(str(char_size) in last_height_dict for char_size in char_sizes)
         if line_text:
             title_size = str(line_size)
-
-            # 遍历列表，找到匹配的字典项
+            # 遍历列表，找到标题匹配的字典项
             for index, dict_item in enumerate(height_list):
 
                 if title_size in dict_item and (index <= len(height_list)/2) and (len(height_list) > 4):
                     # 字符尺寸在前50%
                     high_height = True
                     title_level = index + 1
-                    break  # 跳出循环，因为我们已经找到了匹配的项
-            # else:
-            #     # 如果没有找到匹配的项，打印相应的消息
-            #     print(f"没有找到标题大小为{title_size}的项")
-            # 返回包含每行文本及其格式的元组
+                    break
+
             # 标题判断：判断单元行除"."以外是否还包含其他断句标点符号
             chapter_pattern = re.compile(r'[;；!?。！？\?]', re.MULTILINE)
-            #  and title_in_range
-            #if (not chapter_pattern.match(line_text)) and (not has_min_height) and (not width_full_line) and high_height and (' ' not in line_text):
             if (not chapter_pattern.match(line_text)) and (not has_min_height) and (not width_full_line) and high_height:
                 line_is_title = True
                 if "-" in line_text:
@@ -237,140 +157,22 @@ class PDFLoader(TextLoader):
                         # 如果没有找到相同的height元素，则将新元素添加到列表末尾
                 if new_element not in title_list:
                     title_list.append(new_element)
-                    # title_list.append({"title_level": title_level, "title": line_text, "height": int(title_size)})
             parent_title_list = [item["title"] for item in title_list if int(item["height"]) > int(title_size)]
+            if strip_newline:
+                line_text = line_text[:-1] if line_text.endswith('\n') else line_text
             line_meta = {"line_is_title": line_is_title, "title_level": title_level, "line_text": line_text}
             if line_is_title is True and title_level > 0:
                 parent_title_str = "" if len(parent_title_list) == 0 else " " + " ".join(parent_title_list)
                 line_text = '#' * title_level + parent_title_str + ' ' + line_text
         return (line_text, line_formats, parent_title_list, line_is_title, title_coverage, line_meta)
 
+    def tb_text_extraction(self, text_line, height_list, title_list, page_width):
+        # 从表格上下方的文本行中提取文本
+        return self.apply_title(scan_text_line(text_line, page_width), height_list, title_list)
 
     def text_extraction(self, element, height_list, title_list, page_width):
         # 从行元素中提取文本
-        line_text = ""
-        line_size = 0
-        has_min_height = False
-        # line_text = element.get_text()
-        line_is_title = False
-        width_full_line = False
-        high_height = False
-        title_coverage = False
-        title_level = 0
-        last_height_dict = height_list[-1]
-        parent_title_list = []
-        line_meta = {"line_is_title": line_is_title, "title_level": title_level, "line_text": line_text}
-        title_in_range = False
-        # 探析文本的格式
-        # 用文本行中出现的所有格式初始化列表
-        line_formats = []
-        if len(element._objs) > 1:
-            objs_with_bbox = [obj for obj in element._objs if hasattr(obj, 'bbox')]
-            chars = sorted(objs_with_bbox, key=lambda char: (-char.bbox[1], char.bbox[0]))  # 排序有bbox的对象
-
-        else:
-            chars = element
-        for text_line in chars:
-            # line_text = line_text + self.remove_repeated_substrings(text_line.get_text())
-            if isinstance(text_line, LTTextContainer):
-                text_line_format = []
-                # x0, y0, x1, y1 = text_line.bbox
-                # if x0 >= 40 and x1 <= 553 and y0 <= 750 and y1 >= 85:
-                #     title_in_range = True
-                line_size = round(text_line.height)
-                # 标题行不充满整行
-                width_full_line = True if text_line.width >= (page_width-10) else False
-                # if text_line.y1 <= (page_height - 50):
-                # 遍历文本行中的每个字符
-                # current_line_dicts = []  # 用于存储当前行的字符信息
-                last_char_x1 = None
-                for character in text_line:
-                    # 判断若为LTAnno对象添加原文本中的空格
-                    if isinstance(character, LTAnno):
-                        line_text += character.get_text()
-                    # 判断标题条件1：单元行中字符的尺寸是否包含尺寸最小的字符信息，若包含则此行不是标题
-
-                    if isinstance(character, LTChar):
-                        char_size = round(character.size)
-                        if str(char_size) in last_height_dict:
-                            has_min_height = True
-                        char_dict = {
-                            "text": character.get_text(),
-                            "bbox": character.bbox,
-                            "font_name": character.fontname,
-                            "size": char_size
-                        }
-
-                        # 尝试在之前的行中找到相同文本的字符
-                        for prev_char_dict in reversed(text_line_format):  # 从后往前遍历，减少搜索量
-                            # and character.bbox[1] == prev_char_dict["bbox"][1]
-                            if (prev_char_dict["text"] == char_dict["text"] and
-                                    prev_char_dict["font_name"] == char_dict["font_name"]
-                                    and prev_char_dict["size"] == char_dict["size"]):
-                                # 计算x0的差值
-                                x0_diff = character.bbox[0] - prev_char_dict["bbox"][0]
-
-                                if x0_diff > 1 or x0_diff < -100:  # 如果差值大于1，则添加新的char_dict
-                                    if last_char_x1 and (character.bbox[0] - last_char_x1 > 5):
-                                        line_text += " " + char_dict["text"]
-                                    else:
-                                        line_text += char_dict["text"]
-                                    line_formats.append(char_dict)
-                                    text_line_format.append(char_dict)
-
-                                break  # 不需要继续搜索，因为相同的文本在同一行中只会出现一次
-
-                        else:  # 如果在line_formats中没有找到相同文本的字符
-                            if last_char_x1 and (character.bbox[0] - last_char_x1 > 5):
-                                line_text += " " + char_dict["text"]
-                            else:
-                                line_text += char_dict["text"]
-                            line_formats.append(char_dict)
-                            text_line_format.append(char_dict)
-
-                            # 找到行中唯一的字体大小和名称
-                        last_char_x1 = character.bbox[2]
-                    # line_formats.extend(current_line_dicts)
-
-        if line_text:
-            title_size = str(line_size)
-            # 遍历列表，找到标题匹配的字典项
-            for index, dict_item in enumerate(height_list):
-
-                if title_size in dict_item and (index <= len(height_list)/2) and (len(height_list) > 4):
-                    # 字符尺寸在前50%
-                    high_height = True
-                    title_level = index + 1
-                    break
-
-            chapter_pattern = re.compile(r'[;；!?。！？\?]', re.MULTILINE)
-            if (not chapter_pattern.match(line_text)) and (not has_min_height) and (not width_full_line) and high_height:
-                line_is_title = True
-                if "-" in line_text:
-                    line_text = process_hyphen(line_text)
-                # 准备添加的新dict元素
-                new_element = {'height': int(title_size), 'title': line_text, 'title_level': title_level}
-                # 检查height并替换或删除元素
-                for idx, item in reversed(list(enumerate(title_list))):
-                    if item['height'] == new_element['height']:
-                        # 替换相同的height元素
-                        title_list[idx] = new_element
-                        title_coverage = True
-                        break  # 不需要继续检查，因为height是唯一的
-                    elif item['title_level'] > new_element['title_level']:
-                        # 删除title_level更大的元素
-                        del title_list[idx]
-                        # 如果没有找到相同的height元素，则将新元素添加到列表末尾
-                if new_element not in title_list:
-                    title_list.append(new_element)
-                    # title_list.append({"title_level": title_level, "title": line_text, "height": int(title_size)})
-            parent_title_list = [item["title"] for item in title_list if int(item["height"]) > int(title_size)]
-            line_text = line_text[:-1] if line_text.endswith('\n') else line_text
-            line_meta = {"line_is_title": line_is_title, "title_level": title_level, "line_text": line_text}
-            if line_is_title is True and title_level > 0:
-                parent_title_str = "" if len(parent_title_list) == 0 else " " + " ".join(parent_title_list)
-                line_text = '#' * title_level + parent_title_str + ' ' + line_text
-        return (line_text, line_formats, parent_title_list, line_is_title, title_coverage, line_meta)
+        return self.apply_title(scan_text_element(element, page_width), height_list, title_list, strip_newline=True)
 
     def remove_repeated_twice(self, text):
         # 定义正则表达式，匹配任意连续重复两次的子字符串
@@ -488,7 +290,7 @@ class PDFLoader(TextLoader):
         :param page_objs: 页面的元素列表，通常为page._objs。
         :return: 如果列表中存在LTFigure实例，则返回True，否则返回False。
         """
-        return any(isinstance(obj, LTFigure) and (83 < obj.y1 < 756) for obj in page_objs)
+        return contains_figure(page_objs)
 
     def table_convert_html(self, table, last_table_header):
         embedding_content = []
@@ -654,58 +456,37 @@ class PDFLoader(TextLoader):
         if re.search(r'[^\x00-\x7F]', text) or re.search(r'[\x00-\x1F\x7F]{3,}', text):
             return True
         return False
+    def iter_pages(self):
+        """
+        逐页返回页面解析结果，文档类型判断时已解析的前几页直接复用
+        """
+        probe_pages = getattr(self, "_probe_pages", None) or []
+        self._probe_pages = None
+        yield from probe_pages
+        yield from iter_parsed_pages(self.file_path, start=len(probe_pages), logger=logger)
+
     def get_chunk_type(self):
         # text = ""
         chunk_type = 1
-        pdfFileObj = open(self.file_path, 'rb')
-        pdf = pdfplumber.open(self.file_path)
         lines_with_height = []
         height_groups = {}
         height_list = []
-        text = ""
+        has_text = False
         has_table = False
         has_image = False
         try:
-            pdfReaded = pypdf.PdfReader(pdfFileObj)
-
-            # 获取PDF总页数
-            total_pages = len(pdfReaded.pages)
-            logger.info(f"PDF总页数: {total_pages}")
-            for pagenum, page in enumerate(extract_pages(self.file_path)):
-                # 初始化从页面中提取文本所需的变量
-                pageObj = pdfReaded.pages[pagenum]
-                table_page = pdf.pages[pagenum]
-                tables = table_page.find_tables()
-                if len(tables) > 0:
+            # 只取前 PDF_PROBE_PAGES 页判断文档类型，解析结果缓存下来供切分时复用
+            probe_pages = list(iter_parsed_pages(self.file_path, stop=PDF_PROBE_PAGES, logger=logger))
+            for parsed in probe_pages:
+                if "error" in parsed:
+                    raise RuntimeError(parsed["error"])
+                if parsed["table_count"] > 0:
                     has_table = True
-                images = table_page.images
-                if len(images) > 0:
+                if parsed["image_count"] > 0:
                     has_image = True
-                page_content = pageObj.extract_text()
-                page_content = page_content.strip().replace('\u3000', '')
-                if page_content:
-                    text += page_content
-
-                page_elements = []
-                page_elements = [(element.y1, element) for element in page._objs]
-
-                # 对页面中出现的所有元素进行排序
-                page_elements.sort(key=lambda a: a[0], reverse=True)
-
-                # 查找组成页面的元素
-                for i, component in enumerate(page_elements):
-                    # 提取PDF中元素顶部的位置
-                    pos = component[0]
-                    # 提取页面布局的元素
-                    element = component[1]
-
-                    # 检查该元素是否为文本元素
-                    if isinstance(element, LTTextContainer):
-                        for text_line in element:
-                            if isinstance(text_line, LTTextContainer):
-                                lines_with_height.append((round(text_line.height), len(text_line.get_text().replace("\n", ''))))
-                if pagenum > 10:
-                    break
+                if parsed["has_text"]:
+                    has_text = True
+                lines_with_height.extend(parsed["line_heights"])
             for size, count in lines_with_height:
                 if size not in height_groups:
                     height_groups[size] = 0
@@ -714,23 +495,21 @@ class PDFLoader(TextLoader):
             data = [{str(size): count} for size, count in sorted_height_dict]
             # 按键从大到小排序，同时保持键为字符串类型
             height_list = sorted(data, key=lambda x: int(next(iter(x.keys()))), reverse=True)
-            if len(height_list) >= 2 and len(text) > 0 and (has_table or has_image):
+            if len(height_list) >= 2 and has_text and (has_table or has_image):
                 chunk_type = 2
-            elif (text == '') and ('ocr' in self.parser_choices):
+            elif (not has_text) and ('ocr' in self.parser_choices):
                 chunk_type = 3
+            self._probe_pages = probe_pages
 
         except Exception as e:
             raise RuntimeError(f"Error loading {self.file_path}") from e
-        finally:
-            pdfFileObj.close()
-            pdf.close()
         return (chunk_type, height_list)
 
 
     # 创建一个从pdf中裁剪图像元素的函数
-    def crop_image(self, element, pageObj, directory, file_name):
+    def crop_image(self, bbox, pageObj, directory, file_name):
         # 获取从PDF中裁剪图像的坐标
-        [image_left, image_top, image_right, image_bottom] = [element.x0, element.y0, element.x1, element.y1]
+        [image_left, image_top, image_right, image_bottom] = bbox
         # 使用坐标(left, bottom, right, top)裁剪页面
         pageObj.mediabox.lower_left = (image_left, image_bottom)
         pageObj.mediabox.upper_right = (image_right, image_top)
@@ -814,11 +593,15 @@ class PDFLoader(TextLoader):
 
 
     def load_and_split_doc(self, height_list) -> List[dict]:
-        text = ""
-        pdfFileObj = open(self.file_path, 'rb')
-        pdf = pdfplumber.open(self.file_path)
-        chunks = []
-        page_chunks = []
+        return list(self.iter_split_doc(height_list))
+
+    def iter_split_doc(self, height_list):
+        """
+        按页产出切分结果。页面解析(版面、字符、表格)在进程池中并行完成，
+        标题层级、表头等跨页状态仍在当前进程中按页序处理，输出与逐页串行解析一致。
+        """
+        pdfFileObj = None
+        pdfReaded = None
         # 获取文件所在的目录路径
         directory = os.path.dirname(self.file_path)
         path_obj = Path(self.file_path)
@@ -826,7 +609,6 @@ class PDFLoader(TextLoader):
         file_name = path_obj.stem
         try:
             logger.info('---------文字版PDF自适应解析策略按页解析切分---------')
-            pdfReaded = PyPDF2.PdfReader(pdfFileObj)
             # height_list = [{'30': 17}, {'16': 244}, {'14': 760}, {'12': 1024}, {'11': 30676}, {'10': 43921}]
             title_list = []
             last_parent_title = []
@@ -835,102 +617,39 @@ class PDFLoader(TextLoader):
             page_title_dict = {}
             last_page_title = ""
             last_page_embed = ""
-            for pagenum, page in enumerate(extract_pages(self.file_path)):
+            for parsed in self.iter_pages():
                 # 初始化从页面中提取文本所需的变量
-                pageObj = pdfReaded.pages[pagenum]
-                page_text = ""
-                page_embed_list = []
-                line_format = []
-                text_from_images = []
-                text_from_tables = []
-                chunk = {}
+                pagenum = parsed["pagenum"]
+                page_width = parsed.get("width")
+                pageObj = None
+                page_chunks = []
                 page_content = []
                 page_embedding_chunks = []
                 # 初始化检查表的数量
                 table_num = 0
-                upper_side = 0
-                lower_side = 0
-                first_element = True
-                table_extraction_flag = False
-                # 打开pdf文件
-
-                # 查找已检查的页面
-                table_page = pdf.pages[pagenum]
                 chunk_content = []
                 content_position = []
-                # page_position = []
                 start_position = {}
                 end_position = {}
-                # 找出本页上的表格数目
-                # if self.contains_figure(page._objs):
-                #     continue
                 try:
-                    tables = table_page.find_tables()
-                    table_text = ""
-                    for extract_table in table_page.extract_tables():
-                        for item_table in extract_table:
-                            for item in item_table:
-                                if item:
-                                    item_content = item.strip().replace('\u3000', '')
-                                    if item_content:
-                                        table_text += item_content
-                    # page_elements2 = [(element.y1, element) for element in page._objs]
-                    ###################################################################################
-                    # begin
-                    if has_table(table_page) and table_text and not self.contains_figure(page._objs):
-                        ts = {
-                            "vertical_strategy": "lines",
-                            "horizontal_strategy": "lines",
-                        }
-                        # Get the bounding boxes of the tables on the page.
-                        # bboxes = [table.bbox for table in table_page.find_tables(table_settings=ts)]
-                        bboxes = []
-
-                        last_table_bottom = 0
-
-                        for table in table_page.find_tables(table_settings=ts):
+                    if "error" in parsed:
+                        raise RuntimeError(parsed["error"])
+                    if parsed["table_mode"]:
+                        for table in parsed["tables"]:
 
                             ab_parent_title_list = []
                             bt_parent_title_list = []
                             table_parent_title_list = []
                             last_line_meta = {}
-                            bx0, by0, bx1, by1 = table.bbox
-
-                            bboxes.append(table.bbox)
-                            def not_within_bboxes(obj):
-
-                                """Check if the object is in any of the table's bbox."""
-                                def obj_above_bbox(_bbox):
-                                    """See https://github.com/jsvine/pdfplumber/blob/stable/pdfplumber/table.py#L404"""
-                                    v_mid = (obj["top"] + obj["bottom"]) / 2
-                                    h_mid = (obj["x0"] + obj["x1"]) / 2
-                                    x0, top, x1, bottom = _bbox
-                                    return (h_mid >= x0) and (v_mid >= top)
-                                    #return (h_mid >=x0) and (v_mid > x_top) and (v_mid < bottom)
-                                def obj_between_bbox(_bbox):
-                                    """See https://github.com/jsvine/pdfplumber/blob/stable/pdfplumber/table.py#L404"""
-                                    v_mid = (obj["top"] + obj["bottom"]) / 2
-                                    # h_mid = (obj["x0"] + obj["x1"]) / 2
-                                    x0, top, x1, bottom = _bbox
-                                    return (v_mid < last_table_bottom) or (v_mid >= top)
-
-                                # v_mid = (obj["top"] + obj["bottom"]) / 2
-                                # h_mid = (obj["x0"] + obj["x1"]) / 2
-                                if table_num == 0:
-                                    return not obj_above_bbox(table.bbox)
-                                else:
-                                    #(v_mid < by1) and (v_mid > x_top)
-                                    return not obj_between_bbox(table.bbox)
+                            bx0, by0, bx1, by1 = table["bbox"]
 
-                            # above_text = ""
-                            # above_text = table_page.filter(not_within_bboxes).extract_text()
-                            above_tb_lines = table_page.filter(not_within_bboxes).extract_text_lines()
+                            above_tb_lines = table["above_lines"]
                             for above_tb_line in above_tb_lines:
                                 # print(f"Text line;{above_tb_line['text']}")
                                 if above_tb_line["bottom"] > by0 or above_tb_line["bottom"] < 83:
                                     continue
                                 (ab_line_text, ab_format_per_line, ab_parent_title_list, ab_is_title, ab_title_coverage, current_line_meta) = (
-                                    self.tb_text_extraction(above_tb_line, height_list, title_list, page.width))
+                                    self.apply_title(above_tb_line["scan"], height_list, title_list))
                                 if ab_line_text:
 
                                     if ab_is_title:
@@ -996,7 +715,10 @@ class PDFLoader(TextLoader):
                                         last_parent_title = ab_parent_title_list
                                     last_line_meta = current_line_meta
 
-                            t_table = table_page.extract_tables()[table_num]
+                            t_table = table["rows"]
+                            if t_table is None:
+                                # 两种策略识别出的表格数量不一致，与逐页解析时一样放弃该页
+                                raise IndexError("list index out of range")
                             first_row = t_table[0] if t_table else []
                             empty_cells = sum(1 for cell in first_row if cell is None or cell == '')
                             if empty_cells < 20:
@@ -1018,28 +740,15 @@ class PDFLoader(TextLoader):
                             end_position = {"x0": bx0, "x1": bx1, "y0": by0, "y1": by1}
 
                             last_table_header = current_table_header
-                            def bottom_within_bboxes(obj):
-                                """Check if the object is in any of the table's bbox."""
-
-                                def bottom_above_bbox(_bbox):
-                                    """See https://github.com/jsvine/pdfplumber/blob/stable/pdfplumber/table.py#L404"""
-                                    v_mid = (obj["top"] + obj["bottom"]) / 2
-                                    # v_mid = (_bbox[1] + _bbox[3]) / 2
-                                    h_mid = (obj["x0"] + obj["x1"]) / 2
-                                    x0, top, x1, bottom = _bbox
-                                    return (h_mid < x1) and (v_mid < bottom)
-
-                                return not bottom_above_bbox(table.bbox)
-
                             # 表格底部文本的抽取限定在最后一个表格才抽取
-                            if table_num == len(tables) - 1:
+                            if table_num == parsed["table_count"] - 1:
 
-                                bottom_tb_lines = table_page.filter(bottom_within_bboxes).extract_text_lines()
+                                bottom_tb_lines = table["bottom_lines"]
                                 for bottom_tb_line in bottom_tb_lines:
                                     # print(f"Text line;{bottom_tb_line['text']}")
                                     if bottom_tb_line["bottom"] > 756 or bottom_tb_line["bottom"] < 83:
                                         continue
-                                    (bt_line_text, bt_format_per_line, bt_parent_title_list, bt_is_title, bt_title_coverage, current_line_meta) = (self.tb_text_extraction(bottom_tb_line, height_list, title_list, page.width))
+                                    (bt_line_text, bt_format_per_line, bt_parent_title_list, bt_is_title, bt_title_coverage, current_line_meta) = (self.apply_title(bottom_tb_line["scan"], height_list, title_list))
                                     if bt_line_text:
 
                                         if bt_is_title:
@@ -1108,31 +817,18 @@ class PDFLoader(TextLoader):
                                 table_parent_title_list = last_parent_title
 
                             table_num = table_num + 1
-                            # last_table_bottom = by1
-                            last_table_bottom = by1
 
                     else:
 
                         last_line_meta = {}
-                        page_elements = [(element.y1, element) for element in page._objs]
-
-                        page_elements.sort(key=lambda a: a[0], reverse=True)
                         image_dict = {}
                         image_labels = []
                         last_image_url = ""
-                        # 查找组成页面的元素
-                        for i, component in enumerate(page_elements):
-                            # 提取PDF中元素顶部的位置
-                            pos = component[0]
-                            # 排除页眉和页脚的内容
-                            if pos > 765 or pos < 83:
-                                continue
-                            # 提取页面布局的元素
-                            element = component[1]
-
+                        # 页面元素已按顶部位置从上到下排序，并排除了页眉和页脚的内容
+                        for element in parsed["elements"]:
                             # 检查该元素是否为文本元素
-                            if isinstance(element, LTTextContainer):
-                                (line_text, format_per_line, parent_title_list, is_title, title_coverage, current_line_meta) = self.text_extraction(element, height_list, title_list, page.width)
+                            if element["type"] == "text":
+                                (line_text, format_per_line, parent_title_list, is_title, title_coverage, current_line_meta) = self.apply_title(element["scan"], height_list, title_list, strip_newline=True)
                                 # 将每行的文本追加到页文本
                                 if line_text:
 
@@ -1200,12 +896,17 @@ class PDFLoader(TextLoader):
                                     # 将最新标题层级缓存至变量中
                                     if parent_title_list:
                                         last_parent_title = parent_title_list
-                            elif isinstance(element, LTFigure):
+                            elif element["type"] == "figure":
                                 # 从PDF中裁剪图像
                                 logger.info("-------图片解析--------")
+                                if pageObj is None:
+                                    if pdfReaded is None:
+                                        pdfFileObj = open(self.file_path, 'rb')
+                                        pdfReaded = PyPDF2.PdfReader(pdfFileObj)
+                                    pageObj = pdfReaded.pages[pagenum]
                                 unique_id = str(uuid.uuid4())
                                 image_file_name = "%s_%s" % (file_name, unique_id)
-                                image_file_path = self.crop_image(element, pageObj, directory, image_file_name)
+                                image_file_path = self.crop_image(element["bbox"], pageObj, directory, image_file_name)
                                 logger.info("------>image_file_path=%s" % image_file_path)
                                 if "ocr" in self.parser_choices:
                                     ocr_parser_data = ocr_utils.ocr_parser_native(image_file_path, self.ocr_model_id)
@@ -1227,9 +928,10 @@ class PDFLoader(TextLoader):
                                     # page_content.append(image_line_text)
                                     chunk_content.append(image_line_text)
                                     image_line_formats = []
+                                    x0, y0, x1, y1 = element["bbox"]
                                     image_format = {
                                         "text": image_download_link,
-                                        "bbox": (element.x0, element.y0, element.x1, element.y1),
+                                        "bbox": element["bbox"],
                                         "font_name": '',
                                         "size": 0
                                     }
@@ -1237,11 +939,11 @@ class PDFLoader(TextLoader):
                                     content_position.append(image_line_formats)
                                     # page_position.append(image_line_formats)
                                     if not start_position:
-                                        start_position = {"x0": element.x0, "x1": element.x1, "y0": element.y0, "y1": element.y1}
-                                    end_position = {"x0": element.x0, "x1": element.x1, "y0": element.y0, "y1": element.y1}
+                                        start_position = {"x0": x0, "x1": x1, "y0": y0, "y1": y1}
+                                    end_position = {"x0": x0, "x1": x1, "y0": y0, "y1": y1}
 
                         if len(chunk_content) == 0:
-                            chunk_content = table_page.extract_text()
+                            chunk_content = parsed["plain_text"] or ""
                         if len(chunk_content) > 0:
 
                             join_text = " ".join(chunk_content)
@@ -1266,7 +968,6 @@ class PDFLoader(TextLoader):
                         page_chunk["start_position"] = start_position
                         page_chunk["end_position"] = end_position
                         page_chunks.append(page_chunk)
-                        text += current_page_content + "\n"
                     elif "ocr" in self.parser_choices:
                         page_data, page_num = ocr_utils.get_page_data(pagenum, self.file_path, self.ocr_model_id)
                         if page_data is not None:
@@ -1288,8 +989,9 @@ class PDFLoader(TextLoader):
                 except Exception as error:
                     import traceback
                     logger.error("------> page_num:%s, error: %s" % (pagenum + 1, error))
-                    logger.error(traceback.format_exc())
-                    continue
+                    logger.error(parsed.get("traceback") or traceback.format_exc())
+                # 出错页中已完成的部分与逐页解析时一样保留
+                yield from page_chunks
 
         except Exception as e:
             import traceback
@@ -1297,10 +999,9 @@ class PDFLoader(TextLoader):
             logger.error(traceback.format_exc())
             # raise RuntimeError(f"Error loading {self.file_path}") from e
         finally:
-            pdfFileObj.close()
-            pdf.close()
+            if pdfFileObj is not None:
+                pdfFileObj.close()
 
-        return page_chunks
 
     def load(self) -> List[Document]:
 
@@ -0,0 +1,363 @@
+import os
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+from pdfminer.layout import LTTextContainer, LTChar, LTFigure, LTAnno
+
+from utils.constant import PDF_PARSE_WORKERS, PDF_PARSE_BATCH_PAGES, PDF_PARSE_POOL_MIN_PAGES
+
+# 页眉页脚范围：元素顶部 y1 在 [83, 765] 之外的不参与正文解析
+HEADER_Y = 765
+FOOTER_Y = 83
+TABLE_LINE_SETTINGS = {
+    "vertical_strategy": "lines",
+    "horizontal_strategy": "lines",
+}
+
+
+def has_table(page, min_rows=2, min_cols=2):
+    """
+    判断给定的 pdfplumber.Page 对象中是否包含实际的表格。
+
+    参数:
+        page (pdfplumber.page.Page): 由 pdfplumber 解析得到的页面对象。
+        min_rows (int): 考虑为表格的最小行数，默认为2。
+        min_cols (int): 考虑为表格的最小列数，默认为2。
+
+    返回:
+        bool: 如果页面包含表格则返回 True，否则返回 False。
+    """
+    tables = page.find_tables(table_settings={
+        "vertical_strategy": "lines_strict",
+        "horizontal_strategy": "lines_strict"
+    })
+
+    for table in tables:
+        # 检查表格是否至少有指定数量的行和列
+        if len(table.rows) >= min_rows and len(table.cells[0]) >= min_cols:
+            return True
+
+    return False
+
+
+def contains_figure(page_objs):
+    """
+    检查页面对象列表中是否存在正文范围内的 LTFigure 对象。
+    """
+    return any(isinstance(obj, LTFigure) and (FOOTER_Y < obj.y1 < 756) for obj in page_objs)
+
+
+def scan_text_element(element, page_width):
+    """
+    逐字符扫描 pdfminer 文本块，得到行文本与格式信息，不涉及跨页的标题状态
+    :return: (line_text, line_formats, line_size, width_full_line, char_sizes)
+    """
+    line_text = ""
+    line_size = 0
+    width_full_line = False
+    line_formats = []
+    char_sizes = set()
+    if len(element._objs) > 1:
+        objs_with_bbox = [obj for obj in element._objs if hasattr(obj, 'bbox')]
+        chars = sorted(objs_with_bbox, key=lambda char: (-char.bbox[1], char.bbox[0]))  # 排序有bbox的对象
+    else:
+        chars = element
+    for text_line in chars:
+        if isinstance(text_line, LTTextContainer):
+            text_line_format = []
+            line_size = round(text_line.height)
+            # 标题行不充满整行
+            width_full_line = True if text_line.width >= (page_width-10) else False
+            last_char_x1 = None
+            for character in text_line:
+                # 判断若为LTAnno对象添加原文本中的空格
+                if isinstance(character, LTAnno):
+                    line_text += character.get_text()
+                if isinstance(character, LTChar):
+                    char_size = round(character.size)
+                    char_sizes.add(char_size)
+                    char_dict = {
+                        "text": character.get_text(),
+                        "bbox": character.bbox,
+                        "font_name": character.fontname,
+                        "size": char_size
+                    }
+
+                    # 尝试在之前的行中找到相同文本的字符
+                    for prev_char_dict in reversed(text_line_format):  # 从后往前遍历，减少搜索量
+                        if (prev_char_dict["text"] == char_dict["text"] and
+                                prev_char_dict["font_name"] == char_dict["font_name"]
+                                and prev_char_dict["size"] == char_dict["size"]):
+                            # 计算x0的差值
+                            x0_diff = character.bbox[0] - prev_char_dict["bbox"][0]
+
+                            if x0_diff > 1 or x0_diff < -100:  # 如果差值大于1，则添加新的char_dict
+                                if last_char_x1 and (character.bbox[0] - last_char_x1 > 5):
+                                    line_text += " " + char_dict["text"]
+                                else:
+                                    line_text += char_dict["text"]
+                                line_formats.append(char_dict)
+                                text_line_format.append(char_dict)
+
+                            break  # 不需要继续搜索，因为相同的文本在同一行中只会出现一次
+
+                    else:  # 如果在line_formats中没有找到相同文本的字符
+                        if last_char_x1 and (character.bbox[0] - last_char_x1 > 5):
+                            line_text += " " + char_dict["text"]
+                        else:
+                            line_text += char_dict["text"]
+                        line_formats.append(char_dict)
+                        text_line_format.append(char_dict)
+                    last_char_x1 = character.bbox[2]
+    return line_text, line_formats, line_size, width_full_line, char_sizes
+
+
+def scan_text_line(text_line, page_width):
+    """
+    逐字符扫描 pdfplumber 文本行(表格上下方的文字)，不涉及跨页的标题状态
+    :return: (line_text, line_formats, line_size, width_full_line, char_sizes)
+    """
+    line_text = ""
+    line_formats = []
+    char_sizes = set()
+    line_size = round(text_line['bottom'] - text_line['top'])
+    # 标题行不充满整行
+    width_full_line = True if (text_line['x1'] - text_line['x0']) >= (page_width-10) else False
+    for i, character in enumerate(text_line['chars']):
+        # 判断标题条件1：单元行中字符的尺寸是否包含尺寸最小的字符信息，若包含则此行不是标题
+        if isinstance(character, dict) and (FOOTER_Y < character['y1'] < 756):
+            char_size = round(character['height'])
+            char_sizes.add(char_size)
+            char_dict = {
+                "text": character['text'],
+                "bbox": (character['x0'], character['y0'], character['x1'], character['y1']),
+                "font_name": character['fontname'],
+                "size": char_size
+            }
+
+            # 尝试在之前的行中找到相同文本的字符
+            for prev_char_dict in reversed(line_formats):  # 从后往前遍历，减少搜索量
+                if prev_char_dict["text"] == char_dict["text"] and prev_char_dict["font_name"] == char_dict["font_name"] and prev_char_dict["size"] == char_dict["size"]:
+                    # 计算x0的差值
+                    x0_diff = character['x0'] - prev_char_dict["bbox"][0]
+                    if x0_diff > 1 or x0_diff < -100:  # 如果差值大于1，则添加新的char_dict
+                        if i > 0 and (character['x0'] - text_line['chars'][i - 1]['x1'] > 5):
+                            line_text += " " + char_dict["text"]
+                        else:
+                            line_text += char_dict["text"]
+                        line_formats.append(char_dict)
+                    break  # 不需要继续搜索，因为相同的文本在同一行中只会出现一次
+            else:  # 如果在line_formats中没有找到相同文本的字符
+                # 若当前字符的x0坐标比上一个字符的x1坐标差值>5则说明有空格，需要补充空格
+                if i > 0 and (character['x0']-text_line['chars'][i-1]['x1'] > 5):
+                    line_text += " " + char_dict["text"]
+                else:
+                    line_text += char_dict["text"]
+                line_formats.append(char_dict)
+    return line_text, line_formats, line_size, width_full_line, char_sizes
+
+
+def _compact_scan(scan):
+    """进程间只传递后续用到的字段：格式信息只保留首字符"""
+    line_text, line_formats, line_size, width_full_line, char_sizes = scan
+    return line_text, line_formats[:1], line_size, width_full_line, char_sizes
+
+
+def _table_lines(plumber_page, keep, page_width):
+    return [{"bottom": line["bottom"], "scan": _compact_scan(scan_text_line(line, page_width))}
+            for line in plumber_page.filter(keep).extract_text_lines()]
+
+
+def _parse_tables(plumber_page, page_width, tables, extracted_tables):
+    """
+    按表格顺序提取表格内容及其上方、下方(仅最后一个表格)的文字行，
+    上方文字的范围只依赖本页前一个表格的位置
+    """
+    result = []
+    last_table_bottom = 0
+    for table_num, table in enumerate(plumber_page.find_tables(table_settings=TABLE_LINE_SETTINGS)):
+        bx0, by0, bx1, by1 = table.bbox
+
+        def not_within_bboxes(obj, table=table, table_num=table_num, last_table_bottom=last_table_bottom):
+            """Check if the object is in any of the table's bbox."""
+            v_mid = (obj["top"] + obj["bottom"]) / 2
+            h_mid = (obj["x0"] + obj["x1"]) / 2
+            x0, top, x1, bottom = table.bbox
+            if table_num == 0:
+                return not ((h_mid >= x0) and (v_mid >= top))
+            return not ((v_mid < last_table_bottom) or (v_mid >= top))
+
+        def bottom_within_bboxes(obj, table=table):
+            """Check if the object is in any of the table's bbox."""
+            v_mid = (obj["top"] + obj["bottom"]) / 2
+            h_mid = (obj["x0"] + obj["x1"]) / 2
+            x0, top, x1, bottom = table.bbox
+            return not ((h_mid < x1) and (v_mid < bottom))
+
+        item = {
+            "bbox": table.bbox,
+            "above_lines": _table_lines(plumber_page, not_within_bboxes, page_width),
+            # 与默认策略识别出的表格一一对应，数量不一致时由调用方按原逻辑处理
+            "rows": extracted_tables[table_num] if table_num < len(extracted_tables) else None,
+            "bottom_lines": None,
+        }
+        # 表格底部文本的抽取限定在最后一个表格才抽取
+        if item["rows"] is not None and table_num == len(tables) - 1:
+            item["bottom_lines"] = _table_lines(plumber_page, bottom_within_bboxes, page_width)
+        result.append(item)
+        if item["rows"] is None:
+            break
+        last_table_bottom = by1
+    return result
+
+
+def parse_page(plumber_page, pagenum: int) -> dict:
+    """
+    一次解析得到页面的版面、文字、表格信息，结果只包含可跨进程传递的简单数据，
+    供文档类型判断与按页切分共用
+    """
+    layout = plumber_page.layout
+    page_width = layout.width
+    tables = plumber_page.find_tables()
+    extracted_tables = plumber_page.extract_tables()
+
+    line_heights = []
+    for element in layout._objs:
+        if isinstance(element, LTTextContainer):
+            for text_line in element:
+                if isinstance(text_line, LTTextContainer):
+                    line_heights.append((round(text_line.height), len(text_line.get_text().replace("\n", ''))))
+
+    table_text = ""
+    for extract_table in extracted_tables:
+        for item_table in extract_table:
+            for item in item_table:
+                if item:
+                    item_content = item.strip().replace('　', '')
+                    if item_content:
+                        table_text += item_content
+
+    parsed = {
+        "pagenum": pagenum,
+        "width": page_width,
+        "table_count": len(tables),
+        "image_count": len(plumber_page.images),
+        "has_text": any(char["text"].strip().replace('　', '') for char in plumber_page.chars),
+        "line_heights": line_heights,
+        "table_mode": bool(has_table(plumber_page) and table_text and not contains_figure(layout._objs)),
+        "tables": [],
+        "elements": [],
+        "plain_text": None,
+    }
+    if parsed["table_mode"]:
+        parsed["tables"] = _parse_tables(plumber_page, page_width, tables, extracted_tables)
+        return parsed
+
+    page_elements = [(element.y1, element) for element in layout._objs]
+    page_elements.sort(key=lambda a: a[0], reverse=True)
+    has_line_text = False
+    for pos, element in page_elements:
+        # 排除页眉和页脚的内容
+        if pos > HEADER_Y or pos < FOOTER_Y:
+            continue
+        if isinstance(element, LTTextContainer):
+            scan = _compact_scan(scan_text_element(element, page_width))
+            has_line_text = has_line_text or bool(scan[0])
+            parsed["elements"].append({"type": "text", "scan": scan})
+        elif isinstance(element, LTFigure):
+            parsed["elements"].append({"type": "figure", "bbox": (element.x0, element.y0, element.x1, element.y1)})
+    if not has_line_text:
+        parsed["plain_text"] = plumber_page.extract_text()
+    return parsed
+
+
+def parse_pages(file_path: str, pagenums: list) -> list:
+    """
+    在一次打开的文档中解析一批页面(进程池任务)，单页失败只记录该页的错误
+    """
+    results = []
+    # laparams 与 pdfminer extract_pages 的默认版面分析参数一致
+    with pdfplumber.open(file_path, laparams={}) as pdf:
+        for pagenum in pagenums:
+            try:
+                plumber_page = pdf.pages[pagenum]
+                results.append(parse_page(plumber_page, pagenum))
+                if hasattr(plumber_page, "close"):
+                    plumber_page.close()  # 释放该页的版面缓存
+            except Exception as e:
+                import traceback
+                results.append({"pagenum": pagenum, "error": repr(e), "traceback": traceback.format_exc()})
+    return results
+
+
+def count_pages(file_path: str) -> int:
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """
+    进程内共享的页面解析进程池，使用 spawn 启动，避免在多线程的入库进程中 fork
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def iter_parsed_pages(file_path: str, start: int = 0, stop: int = None, logger=None):
+    """
+    按页码顺序逐页返回解析结果。页数较多时按批分发到进程池并行解析，
+    在途批次数有上限，调用方逐页消费，内存占用与总页数无关。
+    """
+    file_path = os.fspath(file_path)
+    total = count_pages(file_path)
+    stop = total if stop is None else min(stop, total)
+    pagenums = list(range(start, stop))
+    batches = [pagenums[i:i + PDF_PARSE_BATCH_PAGES] for i in range(0, len(pagenums), PDF_PARSE_BATCH_PAGES)]
+
+    if PDF_PARSE_WORKERS <= 1 or len(pagenums) < PDF_PARSE_POOL_MIN_PAGES:
+        for batch in batches:
+            yield from parse_pages(file_path, batch)
+        return
+
+    pool = _get_pool()
+    pending = deque()
+    next_batch = 0
+    try:
+        while next_batch < len(batches) or pending:
+            while next_batch < len(batches) and len(pending) < PDF_PARSE_WORKERS * 2:
+                batch = batches[next_batch]
+                pending.append((batch, pool.submit(parse_pages, file_path, batch)))
+                next_batch += 1
+            batch, future = pending.popleft()
+            try:
+                pages = future.result()
+            except Exception as e:
+                # 子进程异常退出等情况下，本批次回退到当前进程解析
+                if logger is not None:
+                    logger.error(f"pdf page pool failed, pages: {batch[0] + 1}-{batch[-1] + 1}, error: {e}")
+                _reset_pool()
+                pool = _get_pool()
+                pages = parse_pages(file_path, batch)
+            yield from pages
+    finally:
+        for _, future in pending:
+            future.cancel()
@@ -218,11 +218,23 @@ async def generate_community_reports(request: Request):
         config.construction.LLM_API_KEY = llm_api_key
 
         # =========== 生成社区报告 =============
-        file_path = f"./data/graph/{user_id}/{kb_name}.json"
-        new_graph = graph_processor.load_graph_from_json(file_path)
+        store = graph_processor.get_kb_graph_store(user_id, kb_name)
         reports = []
-        if os.path.exists(file_path):
-            reports = graph_processor.extract_community(new_graph, config)
+        if store.exists():
+            loop = asyncio.get_running_loop()
+            last_progress = [0]
+
+            def on_progress(done: int, total: int):
+                # 报告生成在线程池中执行，进度 1~9 经事件循环推送，10 表示完成
+                progress = 1 + done * 8 // total
+                if progress != last_progress[0]:
+                    last_progress[0] = progress
+                    asyncio.run_coroutine_threadsafe(send_progress_update(
+                        client_id, "generate_community_reports", progress,
+                        f"generate_community_reports: {done}/{total} communities"), loop)
+
+            reports = await loop.run_in_executor(None, graph_processor.extract_kb_community, user_id, kb_name,
+                                                 config, on_progress)
         await send_progress_update(client_id, "generate_community_reports", 10, "generate_community_reports completed successfully!")
 
         return CommunityReportsResponse(
@@ -310,7 +322,7 @@ async def get_kb_graph_data(request: Request):
         kb_id = json_request["kb_id"]
         client_id = json_request.get("client_id", "default")
 
-        file_path = f"./data/graph/{user_id}/{kb_name}.json"
+        store = graph_processor.get_kb_graph_store(user_id, kb_name)
         graph_data = {
             "graph": {
                 "directed": False,
@@ -320,8 +332,8 @@ async def get_kb_graph_data(request: Request):
             }
         }
 
-        if os.path.exists(file_path):
-            graph = graph_processor.load_graph(file_path)
+        if store.exists():
+            graph = store.get_graph()
             for node in graph.nodes(data=True):
                 if node[1]["label"] == "entity":
                     graph_data["graph"]["nodes"].append({
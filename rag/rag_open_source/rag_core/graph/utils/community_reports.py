@@ -1,7 +1,10 @@
 import copy
+import hashlib
 import json
 import re
 import os
+import threading
+from pathlib import Path
 from typing import Callable
 from dataclasses import dataclass
 import networkx as nx
@@ -14,6 +17,9 @@ from graph.utils import call_llm_api
 from concurrent import futures
 from graph.utils.logger import logger
 
+# 社区报告 LLM 调用的最大并发数
+COMMUNITY_REPORT_MAX_CONCURRENCY = int(os.getenv("COMMUNITY_REPORT_MAX_CONCURRENCY", 8))
+
 def perform_variable_replacements(
     input: str, history: list[dict] | None = None, variables: dict | None = None
 ) -> str:
@@ -60,6 +66,50 @@ class CommunityReportsResult:
     structured_output: list[dict]
 
 
+def membership_fingerprint(kind: str, members: list) -> str:
+    """社区成员(及其描述)的指纹，与顺序无关，成员或描述不变时报告可以直接复用"""
+    members = sorted(json.dumps(member, ensure_ascii=False, sort_keys=True, default=str) for member in members)
+    raw = json.dumps([kind, members], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class CommunityReportCache:
+    """
+    Persisted community detection results and reports of one knowledge base, keyed by membership fingerprint.
+
+    Only the communities seen in the latest run are written back, so reports of vanished communities are dropped.
+    """
+
+    def __init__(self, path: str | Path | None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._old = {}
+        self._new = {}
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._old = json.load(f).get("communities", {})
+            except Exception as e:
+                logger.warning(f"Failed to load community reports from {self.path}: {type(e).__name__}: {e}")
+
+    def get(self, fingerprint: str):
+        entry = self._old.get(fingerprint)
+        return entry["report"] if entry else None
+
+    def put(self, fingerprint: str, kind: str, nodes: list, report: dict):
+        with self._lock:
+            self._new[fingerprint] = {"kind": kind, "nodes": nodes, "report": report}
+
+    def save(self):
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"communities": self._new}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
 def is_valid_name(name: str) -> bool:
     """判断名称或属性是否有效：非空、非全标点、长度大于1且不是常见无效符号。"""
     if not name or not isinstance(name, str):
@@ -84,6 +134,8 @@ class CommunityReportsExtractor:
             self,
             max_report_length: int | None = None,
             config=None,
+            cache_path: str | Path | None = None,
+            progress_callback: Callable[[int, int], None] | None = None,
     ):
         if config is None:
             config = get_config()
@@ -94,18 +146,35 @@ class CommunityReportsExtractor:
         self._config = config
         self._extraction_prompt = COMMUNITY_REPORT_PROMPT
         self._max_report_length = max_report_length or 1500
+        self._cache_path = cache_path
+        self._progress_callback = progress_callback
 
     def __call__(self, graph: nx.MultiDiGraph):
         for node_degree in graph.degree:
             graph.nodes[str(node_degree[0])]["rank"] = int(node_degree[1])
 
-        max_workers = min(self._config.construction.max_workers, (os.cpu_count() or 1) + 4)
+        max_workers = min(self._config.construction.max_workers, COMMUNITY_REPORT_MAX_CONCURRENCY)
         communities: dict[str, dict[str, list]] = leiden.run(graph, {})
+        cache = CommunityReportCache(self._cache_path)
         res_str = []
         res_dict = []
-
-        def extract_report_from_response(response: str, entities: list):
-            nonlocal res_str, res_dict
+        stats = {"reused": 0, "generated": 0}
+
+        def add_report(report: dict, entities: list):
+            add_community_info2graph(graph, entities, report["title"])
+            res_str.append(self._get_text_output(report))
+            res_dict.append(report)
+
+        def reuse_report(fingerprint: str, kind: str, entities: list) -> bool:
+            report = cache.get(fingerprint)
+            if report is None:
+                return False
+            cache.put(fingerprint, kind, entities, report)
+            add_report(report, entities)
+            stats["reused"] += 1
+            return True
+
+        def extract_report_from_response(response: str, entities: list, fingerprint: str, kind: str):
             response = re.sub(r"^[^\{]*", "", response)
             response = re.sub(r"[^\}]*$", "", response)
             response = re.sub(r"\{\{", "{", response)
@@ -126,21 +195,23 @@ class CommunityReportsExtractor:
                     ]):
                 return
             response["entities"] = entities
-            add_community_info2graph(graph, entities, response["title"])
-            res_str.append(self._get_text_output(response))
-            res_dict.append(response)
+            cache.put(fingerprint, kind, entities, response)
+            add_report(response, entities)
+            stats["generated"] += 1
 
         def extract_community_report_by_attr(community):
             attribute, cm = community
             entities = cm["nodes"]
+            fingerprint = membership_fingerprint("attribute", [attribute] + entities)
+            if reuse_report(fingerprint, "attribute", entities):
+                return
             # 将 PROMPT 与具体输入合并为一个字符串
             user_content = ATTRIBUTE_PROMPT + "\n\n" + "输入：\n" + f"entities = {json.dumps(entities, ensure_ascii=False)}\n" + f'attribute = "{attribute}"'
 
             response = self._llm_client.call_api(user_content)
-            extract_report_from_response(response, entities)
+            extract_report_from_response(response, entities, fingerprint, "attribute")
 
         def extract_community_report(community):
-            nonlocal res_str, res_dict
             cm_id, cm = community
             ents = cm["nodes"]
             if len(ents) <= 2:
@@ -157,7 +228,6 @@ class CommunityReportsExtractor:
 
 
             ent_list = [{"entity": ent, "description": graph.nodes[ent]["description"]} for ent in ents]
-            ent_df = pd.DataFrame(ent_list)
 
             rela_list = []
             k = 0
@@ -172,6 +242,17 @@ class CommunityReportsExtractor:
                         continue
                     rela_list.append({"source": ents[i], "target": ents[j], "description": edge.values()})
                     k += 1
+
+            # 成员、描述与社区内关系都未变化时复用上次的报告
+            fingerprint = membership_fingerprint("leiden", [
+                [item["entity"], item["description"]] for item in ent_list
+            ] + [
+                [item["source"], item["target"], list(item["description"])] for item in rela_list
+            ])
+            if reuse_report(fingerprint, "leiden", ents):
+                return
+
+            ent_df = pd.DataFrame(ent_list)
             rela_df = pd.DataFrame(rela_list)
 
             prompt_variables = {
@@ -180,7 +261,7 @@ class CommunityReportsExtractor:
             }
             text = perform_variable_replacements(self._extraction_prompt, variables=prompt_variables)
             response = self._llm_client.call_api(text)
-            extract_report_from_response(response, ents)
+            extract_report_from_response(response, ents, fingerprint, "leiden")
 
         attribute_comm = {}
         for edge in graph.edges(data=True):
@@ -214,25 +295,30 @@ class CommunityReportsExtractor:
 
         logger.info(f"attribute_comm: {attribute_comm}")
 
+        tasks = [(extract_community_report_by_attr, community) for community in attribute_comm.items()]
+        for level, comm in communities.items():
+            if int(level) > 0:
+                continue
+            logger.info(f"Level {level}: Community: {len(comm.keys())}")
+            tasks.extend((extract_community_report, community) for community in comm.items())
+
+        # 属性社区与 leiden 社区共用一个有界线程池，完成进度通过 progress_callback 上报
         with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            all_futures = [executor.submit(extract_community_report_by_attr, community) for community in attribute_comm.items()]
+            all_futures = {executor.submit(func, community): func.__name__ for func, community in tasks}
             for i, future in enumerate(futures.as_completed(all_futures)):
                 try:
                     future.result()
                 except Exception as e:
-                    logger.info(f"extract_community_report_by_attr Failed, error: {e}")
-
-        for level, comm in communities.items():
-            if int(level) > 0:
-                continue
-            logger.info(f"Level {level}: Community: {len(comm.keys())}")
-            with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                all_futures = [executor.submit(extract_community_report, community) for community in comm.items()]
-                for i, future in enumerate(futures.as_completed(all_futures)):
+                    logger.info(f"{all_futures[future]} Failed, error: {e}")
+                if self._progress_callback is not None:
                     try:
-                        future.result()
+                        self._progress_callback(i + 1, len(all_futures))
                     except Exception as e:
-                        logger.info(f"extract_community_report Failed, error: {e}")
+                        logger.warning(f"community report progress callback failed: {e}")
+
+        cache.save()
+        logger.info(f"community reports, communities: {len(tasks)}, reused: {stats['reused']}, "
+                    f"generated: {stats['generated']}")
 
         return CommunityReportsResult(
             structured_output=res_dict,
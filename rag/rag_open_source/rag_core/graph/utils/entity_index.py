@@ -0,0 +1,91 @@
+import networkx as nx
+
+
+class EntityNameIndex:
+    """
+    Blocking index of entity names for entity resolution.
+
+    Nodes are grouped by (label, schema_type) and indexed by the characters of their lower-cased
+    name. ``candidates`` returns every node that can satisfy
+    ``levenshtein(a, b) <= min(len(a), len(b)) // 2`` without scanning the whole block.
+    """
+
+    def __init__(self):
+        self._postings = {}  # (label, schema_type) -> {char: set(node)}
+        self._nodes = {}     # node -> ((label, schema_type), lower-cased name, 加入顺序)
+        self._seq = 0
+
+    @classmethod
+    def from_graph(cls, graph: nx.Graph) -> "EntityNameIndex":
+        index = cls()
+        for node, attrs in graph.nodes(data=True):
+            index.add(node, attrs)
+        return index
+
+    @staticmethod
+    def block_key(attrs: dict) -> tuple:
+        return attrs.get("label"), attrs.get("properties", {}).get("schema_type", "")
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def add(self, node, attrs: dict):
+        key = self.block_key(attrs)
+        entry = self._nodes.get(node)
+        if entry is not None:
+            if entry[0] == key:
+                return
+            self.remove(node)
+        name = str(node).lower()
+        postings = self._postings.setdefault(key, {})
+        for ch in set(name):
+            postings.setdefault(ch, set()).add(node)
+        self._nodes[node] = (key, name, self._seq)
+        self._seq += 1
+
+    def remove(self, node):
+        entry = self._nodes.pop(node, None)
+        if entry is None:
+            return
+        key, name, _ = entry
+        postings = self._postings[key]
+        for ch in set(name):
+            nodes = postings.get(ch)
+            if nodes is not None:
+                nodes.discard(node)
+                if not nodes:
+                    del postings[ch]
+
+    def order(self, node) -> int:
+        return self._nodes[node][2]
+
+    def candidates(self, name: str, attrs: dict) -> list:
+        """
+        同一分块中可能与 name 相似的节点，按加入顺序返回，不会漏掉满足相似条件的节点：
+        编辑距离 <= k 的两个串至少共享 max(la, lb) - k 个字符(计重数)，而 k = min(la, lb) // 2，
+        故至少共享 la - la // 2 个，必然命中 name 中任意 la // 2 + 1 个字符位置之一，
+        只需探查倒排表最短的这部分字符
+        """
+        postings = self._postings.get(self.block_key(attrs))
+        name = str(name).lower()
+        if not postings or not name:
+            return []
+        la = len(name)
+        counts = {}
+        for ch in name:
+            counts[ch] = counts.get(ch, 0) + 1
+        probe_chars = []
+        covered = 0
+        for ch in sorted(counts, key=lambda c: len(postings.get(c, ()))):
+            probe_chars.append(ch)
+            covered += counts[ch]
+            if covered > la // 2:
+                break
+
+        result = set()
+        for ch in probe_chars:
+            for node in postings.get(ch, ()):
+                lb = len(self._nodes[node][1])
+                if abs(la - lb) <= min(la, lb) // 2:  # 长度过滤
+                    result.add(node)
+        return sorted(result, key=self.order)
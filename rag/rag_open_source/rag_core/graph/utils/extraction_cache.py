@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from graph.utils.logger import logger
+
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "./data/extraction_cache/extraction_cache.db")
+# 最多保留的抽取结果条数，超出后按最近访问时间淘汰，<= 0 时关闭缓存
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", 200000))
+# 每写入多少条检查一次是否需要淘汰
+EXTRACTION_CACHE_EVICT_EVERY = 500
+
+
+def extraction_key(prompt: str, model: str, temperature) -> str:
+    """格式化后的 prompt 已包含 chunk 原文、schema 与模板，再加上模型参数即可唯一确定抽取结果"""
+    raw = json.dumps([model, temperature, prompt], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Content-addressed cache of LLM extraction responses, shared by all workers on the host.
+
+    Backed by a local sqlite file so gunicorn processes see each other's results; entries are
+    evicted least-recently-used once the table exceeds ``max_entries``.
+    """
+
+    def __init__(self, path: str = EXTRACTION_CACHE_PATH, max_entries: int = EXTRACTION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.enabled = max_entries > 0
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.stats = {"hit": 0, "miss": 0}
+        if self.enabled:
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with closing(self._connect()) as conn, conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("CREATE TABLE IF NOT EXISTS extraction ("
+                                 "key TEXT PRIMARY KEY, response TEXT NOT NULL, accessed_at REAL NOT NULL)")
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_extraction_accessed ON extraction (accessed_at)")
+            except Exception as e:
+                logger.warning(f"extraction cache disabled, init {path} failed: {type(e).__name__}: {e}")
+                self.enabled = False
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute("SELECT response FROM extraction WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE extraction SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        except Exception as e:
+            logger.warning(f"extraction cache get failed: {type(e).__name__}: {e}")
+            return None
+        with self._lock:
+            self.stats["hit" if row is not None else "miss"] += 1
+        return row[0] if row is not None else None
+
+    def put(self, key: str, response: str):
+        if not self.enabled:
+            return
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("INSERT OR REPLACE INTO extraction (key, response, accessed_at) VALUES (?, ?, ?)",
+                             (key, response, time.time()))
+            with self._lock:
+                self._puts += 1
+                evict = self._puts % EXTRACTION_CACHE_EVICT_EVERY == 0
+            if evict:
+                self.evict()
+        except Exception as e:
+            logger.warning(f"extraction cache put failed: {type(e).__name__}: {e}")
+
+    def evict(self):
+        with closing(self._connect()) as conn, conn:
+            count = conn.execute("SELECT COUNT(*) FROM extraction").fetchone()[0]
+            if count <= self.max_entries:
+                return
+            conn.execute("DELETE FROM extraction WHERE key IN ("
+                         "SELECT key FROM extraction ORDER BY accessed_at LIMIT ?)", (count - self.max_entries,))
+        logger.info(f"extraction cache evicted {count - self.max_entries} entries, kept {self.max_entries}")
+
+
+extraction_cache = ExtractionCache()
@@ -6,6 +6,7 @@ import networkx as nx
 from graph.utils.logger import logger
 from graph.utils.community_reports import CommunityReportsExtractor
 from graph.utils.resolution import LLMEntityResolver
+from graph.utils.graph_store import GraphStore, get_graph_store, drop_graph_store
 
 
 GRAPH_FIELD_SEP = "<SEP>"
@@ -275,37 +276,21 @@ def save_graph_to_graphml(graph: nx.MultiDiGraph, output_path: str):
     nx.write_graphml(graph_copy, output_path)
 
 
-def delete_file(user_id: str, kb_name: str, file_name: str):
-    to_remove_nodes = []
-    graph = None
-
-    file_path = Path(file_name)
-    graph_path = f"./data/graph/{user_id}/{kb_name}.json"
-    if os.path.exists(graph_path):
-        graph = load_graph(graph_path)
-
-    if graph is not None:
-        for node_name, attr in graph.nodes(data=True):
-            file_names = attr['properties']['file_names']
-            file_names = [x for x in file_names if x != file_name]
-            attr['properties']['file_names'] = file_names
-            if not file_names:
-                to_remove_nodes.append(node_name)
-
-        for node_name in to_remove_nodes:
-            graph.remove_node(node_name)
-
-        for node_degree in graph.degree:
-            graph.nodes[str(node_degree[0])]["rank"] = int(node_degree[1])
+def get_kb_graph_store(user_id: str, kb_name: str) -> GraphStore:
+    """Incremental graph store of a knowledge base, snapshots keep the json format of save_graph_to_json"""
+    return get_graph_store(user_id, kb_name, load_graph_from_json, save_graph_to_json)
 
-        save_graph(graph, graph_path)
 
-    return graph
+def delete_file(user_id: str, kb_name: str, file_name: str):
+    store = get_kb_graph_store(user_id, kb_name)
+    if not store.exists():
+        return
+    # 只访问该文件涉及的节点，并以追加日志的方式落盘
+    store.delete_file(file_name)
 
 def delete_kb(user_id: str, kb_name: str):
-    graph_path = f"./data/graph/{user_id}/{kb_name}.json"
-    if os.path.exists(graph_path):
-        os.remove(graph_path)
+    get_kb_graph_store(user_id, kb_name).delete()
+    drop_graph_store(user_id, kb_name)
 
 
 def graph_merge(g1: nx.MultiDiGraph, g2: nx.MultiDiGraph):
@@ -331,29 +316,19 @@ def graph_merge(g1: nx.MultiDiGraph, g2: nx.MultiDiGraph):
 
 def merge_subgraph(
     subgraph: nx.MultiDiGraph,
-    old_graph_path: str
+    user_id: str,
+    kb_name: str
 ):
-    # 检查文件是否存在
-    if os.path.exists(old_graph_path):
-        old_graph = load_graph(old_graph_path)
-        if old_graph is not None:
-            logger.info("Merge with an exiting graph...................")
-            new_graph = graph_merge(old_graph, subgraph)
-        else:
-            new_graph = subgraph
-    else:
-        new_graph = subgraph
-    pr = nx.pagerank(new_graph)
-    for node_name, pagerank in pr.items():
-        new_graph.nodes[node_name]["pagerank"] = pagerank
-
-    save_graph(new_graph, old_graph_path)
+    # 增量合并到图谱存储，pagerank 由存储按间隔重算
+    get_kb_graph_store(user_id, kb_name).merge(subgraph)
 
-    return new_graph
 
-
-def extract_community(graph, config):
-    ext = CommunityReportsExtractor(config)
+def extract_community(graph, config, cache_path=None, progress_callback=None):
+    """
+    cache_path: 上次的社区划分与报告，成员及描述未变化的社区不再调用 LLM
+    progress_callback(done, total): 每完成一个社区回调一次
+    """
+    ext = CommunityReportsExtractor(config=config, cache_path=cache_path, progress_callback=progress_callback)
     cr = ext(graph)
     community_structure = cr.structured_output
     community_reports = cr.output
@@ -371,19 +346,32 @@ def extract_community(graph, config):
     return reports
 
 
+def extract_kb_community(user_id: str, kb_name: str, config, progress_callback=None):
+    """
+    在锁内取得的图谱副本上生成社区报告(耗时，可在线程池中执行)，期间写入与删除不受影响，
+    完成后将社区归属写回图谱存储
+    """
+    store = get_kb_graph_store(user_id, kb_name)
+    graph = store.get_graph()
+    reports = extract_community(graph, config, store.communities_path, progress_callback)
+    store.set_communities(graph)
+    return reports
+
+
 def update_graph(user_id:str, kb_name: str, file_name: str, relationships: list, config):
     # =========== 生成subgraph =============
     subgraph = generate_subgraph(relationships)
 
     # =========== 合并subgraph =============
-    old_file_path = f"./data/graph/{user_id}/{kb_name}.json"
+    store = get_kb_graph_store(user_id, kb_name)
 
-    if os.path.exists(old_file_path):
-        old_graph = load_graph(old_file_path)
+    if store.exists():
+        # 只复制与新实体名称相近的已有节点，LLM 判断在锁外进行
+        old_graph, old_index = store.get_candidate_graph(subgraph)
         if old_graph is not None:
             logger.info("resolution graph...................")
             resolver = LLMEntityResolver(config)
-            name_mapping = resolver.resolve_by_name_and_llm(old_graph, subgraph)
+            name_mapping = resolver.resolve_by_name_and_llm(old_graph, subgraph, old_index)
             logger.info(f"resolution graph, name mapping: {name_mapping}")
 
             for relationship in relationships:
@@ -395,9 +383,7 @@ def update_graph(user_id:str, kb_name: str, file_name: str, relationships: list,
                     relationship["end_node"]["properties"]["name"] = name_mapping[end_name]
 
     subgraph = generate_subgraph(relationships)
-    new_graph = merge_subgraph(subgraph, old_file_path)
-
-    return new_graph
+    merge_subgraph(subgraph, user_id, kb_name)
 
 if __name__ == "__main__":
     relationships = [{'start_node': {'label': 'entity',
@@ -0,0 +1,286 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import networkx as nx
+
+from graph.utils.entity_index import EntityNameIndex
+from graph.utils.logger import logger
+
+GRAPH_DATA_DIR = "./data/graph"
+# 日志中累计的操作数达到该值后合并为新的快照
+GRAPH_JOURNAL_COMPACT_OPS = int(os.getenv("GRAPH_JOURNAL_COMPACT_OPS", 50))
+# pagerank 最短重算间隔(秒)，写入只标记过期，不再逐文件全图重算
+GRAPH_PAGERANK_INTERVAL = int(os.getenv("GRAPH_PAGERANK_INTERVAL", 600))
+# 每个进程内常驻内存的知识库图谱数
+GRAPH_STORE_CACHE_SIZE = int(os.getenv("GRAPH_STORE_CACHE_SIZE", 4))
+
+
+class GraphStore:
+    """
+    Incremental storage of one knowledge base graph.
+
+    ``{kb_name}.json`` is the compacted snapshot (same format as ``save_graph_to_json``) and
+    ``{kb_name}.journal`` holds the operations appended since, one JSON object per line.
+    Writes take an exclusive flock on ``{kb_name}.lock`` and only append to the journal;
+    every access first replays what other processes appended, so all workers see the same graph.
+    """
+
+    def __init__(self, user_id: str, kb_name: str, load_func, save_func):
+        base_dir = Path(GRAPH_DATA_DIR) / user_id
+        self.snapshot_path = base_dir / f"{kb_name}.json"
+        self.journal_path = base_dir / f"{kb_name}.journal"
+        self.lock_path = base_dir / f"{kb_name}.lock"
+        self.communities_path = base_dir / f"{kb_name}.communities.json"  # 社区划分与报告，按成员指纹复用
+        self._load_func = load_func
+        self._save_func = save_func
+        self._mutex = threading.RLock()
+        self._reset(None)
+        self._pagerank_at = 0.0
+
+    def _reset(self, stamp):
+        self.graph = nx.MultiDiGraph()
+        self.file_nodes = {}  # file_name -> set(node)，按文件删除时只访问相关节点
+        self.name_index = EntityNameIndex()  # 实体消歧的候选分块索引，随节点增删维护
+        self._snapshot_stamp = stamp
+        self._journal_offset = 0
+        self._journal_ops = 0
+        self._pagerank_dirty = True
+
+    def exists(self) -> bool:
+        return self.snapshot_path.exists() or self.journal_path.exists()
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with self._mutex:
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    self._sync()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.snapshot_path)
+            return stat.st_ino, stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def _sync(self):
+        """快照被其他进程替换(合并/删除)时全量重新加载，否则只回放新追加的日志"""
+        stamp = self._stamp()
+        journal_size = self.journal_path.stat().st_size if self.journal_path.exists() else 0
+        if stamp != self._snapshot_stamp or journal_size < self._journal_offset:
+            self._reset(stamp)
+            if stamp is not None:
+                snapshot = self._load_func(str(self.snapshot_path))
+                self._merge_graph(snapshot)
+                logger.info(f"graph store loaded snapshot {self.snapshot_path}, nodes: {self.graph.number_of_nodes()}")
+        if journal_size > self._journal_offset:
+            with open(self.journal_path, "rb") as f:
+                f.seek(self._journal_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):  # 写入中的半行，等下次同步
+                        break
+                    self._apply(json.loads(line))
+                    self._journal_offset += len(line)
+                    self._journal_ops += 1
+
+    def _index_node(self, node):
+        for file_name in self.graph.nodes[node]["properties"].get("file_names", []):
+            self.file_nodes.setdefault(file_name, set()).add(node)
+
+    def _update_rank(self, nodes):
+        for node in nodes:
+            if self.graph.has_node(node):
+                self.graph.nodes[node]["rank"] = int(self.graph.degree(node))
+
+    def _merge_graph(self, subgraph: nx.MultiDiGraph):
+        """与 graph_merge 语义一致：新节点直接加入，已有节点合并 file_names，已有连边的节点对不再加边"""
+        graph = self.graph
+        for node, attr in subgraph.nodes(data=True):
+            if not graph.has_node(node):
+                graph.add_node(node, **attr)
+                self.name_index.add(node, attr)
+            else:
+                properties = graph.nodes[node]["properties"]
+                properties["file_names"] = list(set(properties["file_names"] + attr["properties"]["file_names"]))
+            self._index_node(node)
+        for source, target, attr in subgraph.edges(data=True):
+            if graph.get_edge_data(source, target) is None:
+                graph.add_edge(source, target, **attr)
+        self._update_rank(subgraph.nodes)
+        self._pagerank_dirty = True
+
+    def _delete_file(self, file_name: str):
+        graph = self.graph
+        affected = set()
+        for node in self.file_nodes.pop(file_name, set()):
+            if not graph.has_node(node):
+                continue
+            properties = graph.nodes[node]["properties"]
+            properties["file_names"] = [x for x in properties["file_names"] if x != file_name]
+            if not properties["file_names"]:
+                affected.update(graph.predecessors(node))
+                affected.update(graph.successors(node))
+                graph.remove_node(node)
+                self.name_index.remove(node)
+        # 快照只保存边，孤立节点在原先的整图保存后即丢失，这里同样移除
+        for node in list(affected):
+            if graph.has_node(node) and graph.degree(node) == 0:
+                for file_name in graph.nodes[node]["properties"].get("file_names", []):
+                    self.file_nodes.get(file_name, set()).discard(node)
+                graph.remove_node(node)
+                self.name_index.remove(node)
+        self._update_rank(affected)
+        self._pagerank_dirty = True
+
+    def _apply(self, record: dict):
+        if record["op"] == "merge":
+            subgraph = nx.MultiDiGraph()
+            subgraph.add_nodes_from((node, attr) for node, attr in record["nodes"])
+            subgraph.add_edges_from((source, target, attr) for source, target, attr in record["edges"])
+            self._merge_graph(subgraph)
+        elif record["op"] == "delete_file":
+            self._delete_file(record["file_name"])
+        else:
+            logger.warning(f"graph store unknown journal op: {record['op']}")
+
+    def _append(self, record: dict):
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.journal_path, "ab") as f:
+            f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            self._journal_offset = f.tell()
+        self._journal_ops += 1
+        self._apply(record)
+        if self._journal_ops >= GRAPH_JOURNAL_COMPACT_OPS:
+            self._compact()
+        self.refresh_pagerank()
+
+    def _compact(self):
+        """将当前图写为新快照(原子替换)并清空日志，需持有写锁"""
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        self._save_func(self.graph, str(tmp_path))
+        os.replace(tmp_path, self.snapshot_path)
+        if self.journal_path.exists():
+            os.remove(self.journal_path)
+        logger.info(f"graph store compacted {self.snapshot_path}, journal ops: {self._journal_ops}, "
+                    f"nodes: {self.graph.number_of_nodes()}")
+        self._snapshot_stamp = self._stamp()
+        self._journal_offset = 0
+        self._journal_ops = 0
+
+    def refresh_pagerank(self, force: bool = False):
+        """pagerank 过期且距上次计算超过 GRAPH_PAGERANK_INTERVAL 时重算"""
+        with self._mutex:
+            if not self._pagerank_dirty or self.graph.number_of_nodes() == 0:
+                return
+            if not force and time.monotonic() - self._pagerank_at < GRAPH_PAGERANK_INTERVAL:
+                return
+            start = time.monotonic()
+            for node, pagerank in nx.pagerank(self.graph).items():
+                self.graph.nodes[node]["pagerank"] = pagerank
+            self._pagerank_dirty = False
+            self._pagerank_at = time.monotonic()
+            logger.info(f"graph store pagerank refreshed {self.snapshot_path}, cost: {self._pagerank_at - start:.2f}s")
+
+    @staticmethod
+    def _copy_attrs(attr: dict):
+        """nx 的 copy 只新建属性字典，properties 等嵌套容器仍与存储共享，这里再复制一层"""
+        for key, value in attr.items():
+            if isinstance(value, (dict, list)):
+                attr[key] = value.copy()
+
+    def _copy_graph(self) -> nx.MultiDiGraph:
+        graph = self.graph.copy()
+        for _, attr in graph.nodes(data=True):
+            self._copy_attrs(attr)
+        return graph
+
+    def get_graph(self) -> nx.MultiDiGraph:
+        """返回与磁盘一致的当前图的副本，在锁内复制，调用方读写副本不影响存储"""
+        with self._locked(exclusive=False):
+            return self._copy_graph()
+
+    def get_candidate_graph(self, subgraph: nx.MultiDiGraph):
+        """
+        实体消歧只会用到与 subgraph 中名称相近的已有节点：在读锁内按分块索引取出候选节点，
+        复制为只含这些节点的小图，并按原加入顺序为其建立索引，开销与候选数而非图谱规模相关。
+        返回 (候选图, 候选索引)，图谱为空时返回 (None, None)
+        """
+        with self._locked(exclusive=False):
+            if self.graph.number_of_nodes() == 0:
+                return None, None
+            nodes = set()
+            for node, attrs in subgraph.nodes(data=True):
+                nodes.update(self.name_index.candidates(node, attrs))
+            graph = nx.MultiDiGraph()
+            for node in sorted(nodes, key=self.name_index.order):
+                graph.add_node(node, **self.graph.nodes[node])
+                self._copy_attrs(graph.nodes[node])
+        return graph, EntityNameIndex.from_graph(graph)
+
+    def set_communities(self, graph: nx.MultiDiGraph):
+        """将在副本上计算的社区归属写回仍存在的节点；社区信息只保存在内存中，不写入快照与日志"""
+        with self._mutex:
+            for node, attr in graph.nodes(data=True):
+                if "communities" in attr and self.graph.has_node(node):
+                    self.graph.nodes[node]["communities"] = list(attr["communities"])
+
+    def merge(self, subgraph: nx.MultiDiGraph):
+        record = {
+            "op": "merge",
+            "nodes": [[node, attr] for node, attr in subgraph.nodes(data=True)],
+            "edges": [[source, target, attr] for source, target, attr in subgraph.edges(data=True)],
+        }
+        with self._locked(exclusive=True):
+            self._append(record)
+
+    def delete_file(self, file_name: str):
+        with self._locked(exclusive=True):
+            if file_name in self.file_nodes:
+                self._append({"op": "delete_file", "file_name": file_name})
+
+    def compact(self):
+        with self._locked(exclusive=True):
+            if self._journal_ops:
+                self._compact()
+
+    def delete(self):
+        with self._locked(exclusive=True):
+            for path in (self.snapshot_path, self.journal_path, self.communities_path):
+                if path.exists():
+                    os.remove(path)
+            self._reset(None)
+
+
+_stores = OrderedDict()
+_stores_lock = threading.Lock()
+
+
+def get_graph_store(user_id: str, kb_name: str, load_func, save_func) -> GraphStore:
+    """进程内按 (user_id, kb_name) 复用图谱存储，最多常驻 GRAPH_STORE_CACHE_SIZE 个"""
+    key = (user_id, kb_name)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = GraphStore(user_id, kb_name, load_func, save_func)
+            while len(_stores) > GRAPH_STORE_CACHE_SIZE:
+                _stores.popitem(last=False)
+        _stores.move_to_end(key)
+        return store
+
+
+def drop_graph_store(user_id: str, kb_name: str):
+    with _stores_lock:
+        _stores.pop((user_id, kb_name), None)
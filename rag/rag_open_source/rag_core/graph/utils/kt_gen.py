@@ -13,6 +13,7 @@ import json_repair
 
 from graph.config import get_config
 from graph.utils import call_llm_api, graph_processor
+from graph.utils.extraction_cache import extraction_cache, extraction_key
 from graph.utils.logger import logger
 
 
@@ -37,6 +38,7 @@ class KTBuilder:
                                                          config.construction.LLM_API_KEY,
                                                          config.construction.TEMPERATURE)
         self.all_chunks = {}
+        self.entity_ids = {}  # entity name -> 图中第一个同名实体节点，替代逐节点扫描
         self.embedding_model = embedding_model
         self.mode = mode or config.construction.mode
 
@@ -156,6 +158,23 @@ class KTBuilder:
             prompt_type = prompt_type_map.get(self.dataset_name, "general")
         return self.config.get_prompt_formatted("construction", prompt_type, schema=recommend_schema, chunk=chunk_str)
 
+    def _extract_with_cache(self, prompt: str) -> dict:
+        """相同 prompt 与模型参数的抽取结果直接复用缓存，只缓存能解析出结果的响应"""
+        construction = self.config.construction
+        key = extraction_key(prompt, construction.LLM_MODEL, construction.TEMPERATURE)
+        cached = extraction_cache.get(key)
+        if cached is not None:
+            try:
+                return json_repair.loads(cached)
+            except Exception as e:
+                logger.warning(f"Failed to parse cached extraction {key}: {type(e).__name__}: {e}")
+
+        llm_response = self.extract_with_llm(prompt)
+        parsed_response = self._validate_and_parse_llm_response(prompt, llm_response)
+        if parsed_response:
+            extraction_cache.put(key, llm_response)
+        return parsed_response
+
     def _validate_and_parse_llm_response(self, prompt: str, llm_response: str) -> dict:
         """Validate and parse LLM response, returning None if invalid."""
         if llm_response is None:
@@ -172,14 +191,7 @@ class KTBuilder:
                                entity_type: str = None) -> str:
         """Find existing entity or create a new one, returning the entity node ID."""
         with self.lock:
-            entity_node_id = next(
-                (
-                    n
-                    for n, d in self.graph.nodes(data=True)
-                    if d.get("label") == "entity" and d["properties"]["name"] == entity_name
-                ),
-                None,
-            )
+            entity_node_id = self.entity_ids.get(entity_name)
 
             if not entity_node_id:
                 entity_node_id = f"entity_{self.node_counter}"
@@ -261,10 +273,7 @@ class KTBuilder:
     def process_level1_level2(self, chunk: str, id: int):
         """Process attributes (level 1) and triples (level 2) with optimized structure."""
         prompt = self._get_construction_prompt(chunk)
-        llm_response = self.extract_with_llm(prompt)
-
-        # Validate and parse response
-        parsed_response = self._validate_and_parse_llm_response(prompt, llm_response)
+        parsed_response = self._extract_with_cache(prompt)
         if not parsed_response:
             return
 
@@ -282,20 +291,15 @@ class KTBuilder:
         with self.lock:
             for node_id, node_data in all_nodes:
                 self.graph.add_node(node_id, **node_data)
+                if node_data["label"] == "entity":
+                    self.entity_ids.setdefault(node_data["properties"]["name"], node_id)
 
             for u, v, relation in all_edges:
                 self.graph.add_edge(u, v, relation=relation)
 
     def _find_or_create_entity_direct(self, entity_name: str, chunk_id: int, entity_type: str = None) -> str:
         """Find existing entity or create a new one directly in graph (for agent mode)."""
-        entity_node_id = next(
-            (
-                n
-                for n, d in self.graph.nodes(data=True)
-                if d.get("label") == "entity" and d["properties"]["name"] == entity_name
-            ),
-            None,
-        )
+        entity_node_id = self.entity_ids.get(entity_name)
 
         if not entity_node_id:
             entity_node_id = f"entity_{self.node_counter}"
@@ -309,6 +313,7 @@ class KTBuilder:
                 properties=properties,
                 level=2
             )
+            self.entity_ids[entity_name] = entity_node_id
             self.node_counter += 1
 
         return entity_node_id
@@ -355,10 +360,7 @@ class KTBuilder:
     def process_level1_level2_agent(self, chunk: str, id: int):
         """Process attributes (level 1) and triples (level 2) with agent mechanism for schema evolution."""
         prompt = self._get_construction_prompt(chunk)
-        llm_response = self.extract_with_llm(prompt)
-
-        # Validate and parse response (reuse helper method)
-        parsed_response = self._validate_and_parse_llm_response(prompt, llm_response)
+        parsed_response = self._extract_with_cache(prompt)
         if not parsed_response:
             return
 
@@ -449,13 +451,7 @@ class KTBuilder:
                 raise ValueError(
                     f"No valid chunks generated from document. Chunks: {len(chunks)}, Chunk2ID: {len(chunk2id)}")
 
-            for chunk in chunks:
-                try:
-                    id = next(key for key, value in chunk2id.items() if value == chunk)
-                except StopIteration:
-                    id = nanoid.generate(size=8)
-                    chunk2id[id] = chunk
-
+            for id, chunk in chunk2id.items():
                 if self.mode == "agent":
                     self.process_level1_level2_agent(chunk, id)
                 else:
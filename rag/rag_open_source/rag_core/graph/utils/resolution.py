@@ -3,6 +3,7 @@ import re
 from typing import List, Dict, Tuple
 from graph.config import get_config
 from graph.utils import call_llm_api
+from graph.utils.entity_index import EntityNameIndex
 from graph.utils.logger import logger
 
 def _levenshtein_distance(a: str, b: str) -> int:
@@ -33,6 +34,38 @@ def _levenshtein_distance(a: str, b: str) -> int:
     return previous_row[la]
 
 
+def _bounded_levenshtein_distance(a: str, b: str, max_dist: int) -> int:
+    """Levenshtein distance if it is <= max_dist, otherwise max_dist + 1 (only the diagonal band is computed)"""
+    over = max_dist + 1
+    la, lb = len(a), len(b)
+    if abs(la - lb) > max_dist:
+        return over
+    if la > lb:
+        a, b = b, a
+        la, lb = lb, la
+    if la == 0:
+        return lb
+
+    previous_row = [j if j <= max_dist else over for j in range(la + 1)]
+    for i in range(1, lb + 1):
+        c = b[i - 1]
+        current_row = [over] * (la + 1)
+        if i <= max_dist:
+            current_row[0] = i
+        row_min = current_row[0]
+        for j in range(max(1, i - max_dist), min(la, i + max_dist) + 1):
+            value = min(previous_row[j] + 1, current_row[j - 1] + 1, previous_row[j - 1] + (a[j - 1] != c))
+            if value > over:
+                value = over
+            current_row[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_dist:
+            return over
+        previous_row = current_row
+    return min(previous_row[la], over)
+
+
 class LLMEntityResolver:
     def __init__(self, config=None):
         if config is None:
@@ -45,15 +78,17 @@ class LLMEntityResolver:
     def resolve_by_name_and_llm(
             self,
             old_graph: nx.Graph,
-            new_graph: nx.Graph
+            new_graph: nx.Graph,
+            old_index: EntityNameIndex = None
     ) -> Dict[str, str]:
         """
         结合名称相似性和LLM判断进行实体解析
+        old_index: old_graph 的实体名分块索引(随图谱增量维护)，不传则临时构建
         返回映射关系: {new_entity_name: old_entity_name}
         """
         logger.info("开始解析实体映射关系...")
         # 1. 基于名称找到候选对
-        candidate_pairs = self._find_similar_entities(old_graph, new_graph)
+        candidate_pairs = self._find_similar_entities(old_graph, new_graph, old_index)
         logger.info(f"找到候选实体对: {len(candidate_pairs)}")
         # 2. 归一：每个node_i只保留最相似的目标
         best_pairs = self._select_best_match(candidate_pairs)
@@ -66,47 +101,35 @@ class LLMEntityResolver:
     def _find_similar_entities(
             self,
             old_graph: nx.Graph,
-            new_graph: nx.Graph
+            new_graph: nx.Graph,
+            old_index: EntityNameIndex = None
     ) -> List[Tuple[str, str]]:
-        """基于名称相似性找到候选实体对，包括new_graph内部归一"""
+        """
+        基于名称相似性找到候选实体对，包括new_graph内部归一。
+        只与 (label, schema_type) 相同的节点比较，候选由分块索引给出，编辑距离只对候选计算
+        """
+        if old_index is None:
+            old_index = EntityNameIndex.from_graph(old_graph)
         candidates = []
         # 1. old_graph vs new_graph
-        for new_node in new_graph.nodes():
-            new_attrs = new_graph.nodes[new_node]
-            new_type = new_attrs.get('label')
-            new_schema_type = new_attrs['properties'].get('schema_type', '')
-
-            for old_node in old_graph.nodes():
-                old_attrs = old_graph.nodes[old_node]
-                old_type = new_attrs.get('label')
-                old_schema_type = new_attrs['properties'].get('schema_type', '')
-
-                # 类型相同且名称相似
-                if new_type == old_type and new_schema_type == old_schema_type and self._is_name_similar(new_node, old_node):
+        for new_node, new_attrs in new_graph.nodes(data=True):
+            for old_node in old_index.candidates(new_node, new_attrs):
+                if self._is_name_similar(new_node, old_node):
                     candidates.append((new_node, old_node))
 
-        # 2. new_graph 内部归一（两两组合）
-        new_nodes = list(new_graph.nodes())
-        n = len(new_nodes)
-        for i in range(n):
-            node_i = new_nodes[i]
-            attrs_i = new_graph.nodes[node_i]
-            type_i = attrs_i.get('label')
-            schema_type_i = attrs_i['properties'].get('schema_type', '')
-            for j in range(i + 1, n):
-                node_j = new_nodes[j]
-                attrs_j = new_graph.nodes[node_j]
-                type_j = attrs_j.get('label')
-                schema_type_j = attrs_j['properties'].get('schema_type', '')
-                # 类型和schema_type相同且名称相似
-                if type_i == type_j and schema_type_i == schema_type_j and self._is_name_similar(node_i, node_j):
+        # 2. new_graph 内部归一（两两组合，node_j 在 node_i 之后）
+        new_index = EntityNameIndex.from_graph(new_graph)
+        for node_i, attrs_i in new_graph.nodes(data=True):
+            order_i = new_index.order(node_i)
+            for node_j in new_index.candidates(node_i, attrs_i):
+                if new_index.order(node_j) > order_i and self._is_name_similar(node_i, node_j):
                     candidates.append((node_i, node_j))
         return candidates
 
     def _is_name_similar(self, name1: str, name2: str) -> bool:
         """判断两个名称是否相似"""
-        distance = _levenshtein_distance(name1.lower(), name2.lower())
-        return distance <= min(len(name1), len(name2)) // 2
+        max_dist = min(len(name1), len(name2)) // 2
+        return _bounded_levenshtein_distance(name1.lower(), name2.lower(), max_dist) <= max_dist
         # 英文使用编辑距离
         # if self._is_english(name1) and self._is_english(name2):
         #     distance = _levenshtein_distance(name1.lower(), name2.lower())
@@ -231,7 +254,8 @@ class LLMEntityResolver:
         """对每个node_i只保留编辑距离最小的归一目标"""
         best_map = {}
         for node_i, node_j in candidate_pairs:
-            dist = _levenshtein_distance(node_i.lower(), node_j.lower())
+            # 候选对的编辑距离都不超过 min(len) // 2，带上界的计算结果即精确值
+            dist = _bounded_levenshtein_distance(node_i.lower(), node_j.lower(), min(len(node_i), len(node_j)) // 2)
             if node_i not in best_map or dist < best_map[node_i][1]:
                 best_map[node_i] = (node_j, dist)
         return [(node_i, node_j) for node_i, (node_j, _) in best_map.items()]
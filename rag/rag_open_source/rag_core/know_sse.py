@@ -3,7 +3,7 @@ import json
 import ssl
 import re
 import time
-from itertools import product
+from itertools import islice, product
 import shutil
 import requests
 import numpy as np
@@ -12,6 +12,8 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from sse_starlette.sse import ServerSentEvent, EventSourceResponse
+from starlette.concurrency import run_in_threadpool
+import anyio
 from model_manager import get_model_configure, LlmModelConfig
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -27,7 +29,8 @@ logger.info(logger_name+'---------LOG_FILE：'+repr(app_name))
 
 from pymongo import MongoClient
 from utils import redis_utils
-from utils.constant import CHUNK_SIZE
+from utils import async_http_utils
+from utils.constant import CHUNK_SIZE, SSE_THREADPOOL_SIZE, QUERY_REWRITE_MAX_COMBINATIONS
 import uuid
 import hashlib
 user_data_path = r'./user_data'
@@ -45,39 +48,66 @@ client = MongoClient(MONGO_URL, 0, connectTimeoutMS=5000, serverSelectionTimeout
 
 collection = client['rag']['rag_user_logs']
 redis_client = redis_utils.get_redis_connection()
+async_redis_client = redis_utils.get_async_redis_connection()
 
-def get_query_dict_cache(redis_client, user_id, knowledgebases):
-    """
-    根据 user_id,查询的知识库knowledgebase列表 查询 Redis 中的缓存，将哈希表字段的值解析为 query_dict。
-    :param user_id: 用户ID
-    :return: 完整的 query_dict 数据（列表形式），如果缓存不存在则返回 None。
-    """
-    all_query_dicts = []
-
-    redis_key_list = []
-    for knowledgebase in knowledgebases:
-        redis_key = f"query_dict:{user_id}:{knowledgebase}"
-        redis_key_list.append(redis_key)
-    for redis_key in redis_key_list:
-        # 获取整个哈希表，返回一个字典，字段是 id，值是对应的条目 JSON 字符串
-        term_dict_hash = redis_client.hgetall(redis_key)
-        if term_dict_hash:
-            # 将每个字段的 JSON 字符串转换为 Python 对象（字典）
-            term_dict = [json.loads(value) for value in term_dict_hash.values()]
-            all_query_dicts.extend(term_dict)
-    # 此处请将all_query_dicts相同元素去重
-    # 去重：将所有字典转换为 JSON 字符串，存入集合中，集合自动去重
-    unique_query_dicts = {json.dumps(query_dict, sort_keys=True): query_dict for query_dict in all_query_dicts}
-    # 返回去重后的字典列表
-    return list(unique_query_dicts.values())
-
-def query_rewrite(question, term_dict):
+
+@app.on_event("startup")
+async def init_threadpool_limiter():
+    # 召回、模型配置、mongo 等同步调用经线程池执行，放宽默认 40 的并发上限以支撑大量并发流
+    anyio.to_thread.current_default_thread_limiter().total_tokens = SSE_THREADPOOL_SIZE
+
+
+@app.on_event("shutdown")
+async def close_async_clients():
+    await async_http_utils.close_async_clients()
+    await async_redis_client.close()
+
+# 流式返回协议：full 每个token返回完整帧(兼容旧客户端)；delta 首帧返回元数据，之后只返回增量token，末帧返回汇总
+STREAM_PROTOCOL_FULL = "full"
+STREAM_PROTOCOL_DELTA = "delta"
+
+
+def dump_compact(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def delta_header_event(code, message, msg_id, search_list, score):
+    """delta 协议首帧：searchList、score 等元数据只发送一次"""
+    header = {
+        "code": code,
+        "message": message,
+        "msg_id": msg_id,
+        "protocol": STREAM_PROTOCOL_DELTA,
+        "data": {"searchList": search_list},
+    }
+    if score != -1:  # 如果允许返回得分
+        header["data"]["score"] = score
+    return ServerSentEvent(data=dump_compact(header), event="header")
+
+
+def delta_summary_event(code, message, msg_id, question, answer, history, finish):
+    """delta 协议末帧：完整答案及追加本轮问答后的 history"""
+    history_tmp = history.copy()
+    history_tmp.append({"query": question, "response": answer, "needHistory": True})
+    summary = {
+        "code": code,
+        "message": message,
+        "msg_id": msg_id,
+        "data": {"output": answer},
+        "history": history_tmp,
+        "finish": finish,
+    }
+    return ServerSentEvent(data=dump_compact(summary), event="summary")
+
+
+def query_rewrite(question, term_dict, max_rewrites=QUERY_REWRITE_MAX_COMBINATIONS):
     """
     根据专名同义词表改写用户问题，支持生成多个改写结果（针对多个别名）。
 
     参数:
     - question (str): 用户输入问题。
     - term_dict (list): 专名同义词表，每项为字典，包含 'name' 和 'alias'。
+    - max_rewrites (int): 最多生成的改写数，按别名组合顺序截断，避免命中多个专名时组合数指数增长。
 
     返回:
     - list: 改写后的用户问题列表，每个改写对应一种组合方式。
@@ -97,8 +127,8 @@ def query_rewrite(question, term_dict):
     if not replacements:
         return [question]
 
-    # 使用笛卡尔积计算所有可能的替换组合
-    combinations = product(*replacements)
+    # 使用笛卡尔积按顺序生成替换组合，最多取 max_rewrites 个
+    combinations = islice(product(*replacements), max_rewrites)
 
     rewritten_questions = []
     for combo in combinations:
@@ -119,48 +149,54 @@ async def search(request: Request):
     prompt = ''
     history = []
     search_list = []
-    async def stream_generate(prompt, history, search_list,question,top_p,repetition_penalty,temperature,custom_model_info,do_sample,score,msg_id):
+    async def stream_generate(prompt, history, search_list,question,top_p,repetition_penalty,temperature,custom_model_info,do_sample,score,msg_id,
+                              stream_protocol=STREAM_PROTOCOL_FULL):
 
         answer = ''
+        jsonarr = ''
         start_time = time.time()
-        # llm_url = custom_model_info["model_url"]
-        # model_name = custom_model_info["model_name"]
-        model_id = custom_model_info["llm_model_id"]
-        llm_config = get_model_configure(model_id)
-        model_name = llm_config.model_name
         llm_url = ""
-        api_key = ""
-        if isinstance(llm_config, LlmModelConfig):
-            llm_url = llm_config.endpoint_url + "/chat/completions"
-            api_key = llm_config.api_key
-
-        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
-        messages = []
-        for item in history:
-            messages.append({"role": "user", "content": item["query"]})
-            messages.append({"role": "assistant", "content": item["response"]})
-        messages.append({"role": "user", "content": prompt})
-        llm_data = {
-            "model": model_name,
-            # "pad_token_id": 0,
-            # "bos_token_id": 1,
-            # "eos_token_id": 2,
-            "temperature": temperature,
-            # "top_k": 5,
-            # "top_p": top_p,
-            "repetition_penalty": repetition_penalty,
-            "do_sample": do_sample,
-            "stream": True,
-            "messages": messages,
-        }
-        response = requests.post(llm_url, json=llm_data, headers=headers, verify=False, stream=True)
-        logger.info(f'{llm_url} ====== 大模型开始流式输出，发送到大模型参数：'+repr(llm_data))
         waitting_response = ""
         time_i = 0
         finish = 0
+        header_sent = False
         try:
+            # llm_url = custom_model_info["model_url"]
+            # model_name = custom_model_info["model_name"]
+            model_id = custom_model_info["llm_model_id"]
+            llm_config = await run_in_threadpool(get_model_configure, model_id)
+            model_name = llm_config.model_name
+            api_key = ""
+            if isinstance(llm_config, LlmModelConfig):
+                llm_url = llm_config.endpoint_url + "/chat/completions"
+                api_key = llm_config.api_key
+
+            headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+            messages = []
+            for item in history:
+                messages.append({"role": "user", "content": item["query"]})
+                messages.append({"role": "assistant", "content": item["response"]})
+            messages.append({"role": "user", "content": prompt})
+            llm_data = {
+                "model": model_name,
+                # "pad_token_id": 0,
+                # "bos_token_id": 1,
+                # "eos_token_id": 2,
+                "temperature": temperature,
+                # "top_k": 5,
+                # "top_p": top_p,
+                "repetition_penalty": repetition_penalty,
+                "do_sample": do_sample,
+                "stream": True,
+                "messages": messages,
+            }
+            logger.info(f'{llm_url} ====== 大模型开始流式输出，发送到大模型参数：'+repr(llm_data))
+            if stream_protocol == STREAM_PROTOCOL_DELTA:
+                yield delta_header_event(0, "success", msg_id, search_list, score)
+                header_sent = True
             id = 0
-            for line in response.iter_lines(decode_unicode=True):
+            # 复用进程内的异步连接池逐行转发，不阻塞事件循环中的其他流
+            async for line in async_http_utils.stream_post_lines(llm_url, llm_data, headers=headers, client_name="llm"):
                 if line.startswith("data:"):
                     line = line[5:]
                     datajson = json.loads(line)
@@ -190,28 +226,32 @@ async def search(request: Request):
                             finish = 0
                     answer += content
                     waitting_response += content
-                    history_tmp = history.copy()
-                    subjson = {}
-                    subjson["query"] = question
-                    subjson["response"] = answer
-                    subjson["needHistory"] = True
-                    history_tmp.append(subjson)
-                    response_info = {
-                        'code': int(0),
-                        "message": "success",
-                        "msg_id": msg_id,
-                        "data":{"output": content,
-                                "searchList": search_list,
-                            },
-                        "history":history_tmp,
-                        "finish": finish
-                    }
-                    if score != -1:  # 如果允许返回得分
-                        response_info["data"]["score"] = score
-                    jsonarr = json.dumps(response_info, ensure_ascii=False)
-                    id += 1
-                    str_out = f'{jsonarr}'
-                    yield str_out
+                    if stream_protocol == STREAM_PROTOCOL_DELTA:  # 增量协议只下发本次的token
+                        jsonarr = dump_compact({"msg_id": msg_id, "output": content, "finish": finish})
+                        yield ServerSentEvent(data=jsonarr, event="delta")
+                    else:
+                        history_tmp = history.copy()
+                        subjson = {}
+                        subjson["query"] = question
+                        subjson["response"] = answer
+                        subjson["needHistory"] = True
+                        history_tmp.append(subjson)
+                        response_info = {
+                            'code': int(0),
+                            "message": "success",
+                            "msg_id": msg_id,
+                            "data":{"output": content,
+                                    "searchList": search_list,
+                                },
+                            "history":history_tmp,
+                            "finish": finish
+                        }
+                        if score != -1:  # 如果允许返回得分
+                            response_info["data"]["score"] = score
+                        jsonarr = json.dumps(response_info, ensure_ascii=False)
+                        id += 1
+                        str_out = f'{jsonarr}'
+                        yield str_out
                     if time_i == 0:
                         end_time = time.time()
                         logger.info(f"question:{question}。开始流式第一个词返回时间：{end_time - start_time}秒")
@@ -239,28 +279,32 @@ async def search(request: Request):
                                 finish = 0
                         answer += content
                         waitting_response += content
-                        history_tmp = history.copy()
-                        subjson = {}
-                        subjson["query"] = question
-                        subjson["response"] = answer
-                        subjson["needHistory"] = True
-                        history_tmp.append(subjson)
-                        response_info = {
-                            'code': int(0),
-                            "message": "success",
-                            "msg_id": msg_id,
-                            "data": {"output": content,
-                                     "searchList": search_list,
-                                     },
-                            "history": history_tmp,
-                            "finish": finish
-                        }
-                        if score != -1:  # 如果允许返回得分
-                            response_info["data"]["score"] = score
-                        jsonarr = json.dumps(response_info, ensure_ascii=False)
-                        id += 1
-                        str_out = f'{jsonarr}'
-                        yield str_out
+                        if stream_protocol == STREAM_PROTOCOL_DELTA:  # 增量协议只下发本次的token
+                            jsonarr = dump_compact({"msg_id": msg_id, "output": content, "finish": finish})
+                            yield ServerSentEvent(data=jsonarr, event="delta")
+                        else:
+                            history_tmp = history.copy()
+                            subjson = {}
+                            subjson["query"] = question
+                            subjson["response"] = answer
+                            subjson["needHistory"] = True
+                            history_tmp.append(subjson)
+                            response_info = {
+                                'code': int(0),
+                                "message": "success",
+                                "msg_id": msg_id,
+                                "data": {"output": content,
+                                         "searchList": search_list,
+                                         },
+                                "history": history_tmp,
+                                "finish": finish
+                            }
+                            if score != -1:  # 如果允许返回得分
+                                response_info["data"]["score"] = score
+                            jsonarr = json.dumps(response_info, ensure_ascii=False)
+                            id += 1
+                            str_out = f'{jsonarr}'
+                            yield str_out
                         if time_i == 0:
                             end_time = time.time()
                             logger.info(f"question:{question}。开始流式第一个词返回时间：{end_time - start_time}秒")
@@ -270,15 +314,28 @@ async def search(request: Request):
         except Exception as e:  # 如果发生异常，返回错误信息
             logger.error(f"LLM Error url:{llm_url}, err: {e}")
             if finish not in [1, 4]:  # 如果模型没有停止输出，则返回错误信息
+                if stream_protocol == STREAM_PROTOCOL_DELTA:
+                    if not header_sent:  # 模型配置获取失败等情况下首帧尚未下发
+                        yield delta_header_event(1, f"LLM Error:{e}", msg_id, search_list, score)
+                    yield delta_summary_event(1, f"LLM Error:{e}", msg_id, question, answer, history, finish)
+                    return
                 response_info = {
                     'code': 1,
                     "message": f"LLM Error:{e}",
                 }
                 yield json.dumps(response_info, ensure_ascii=False)
+        if stream_protocol == STREAM_PROTOCOL_DELTA:
+            yield delta_summary_event(0, "success", msg_id, question, answer, history, finish)
         # ========== 最终流式返回完成后 动作 ===========
         end_time = time.time()
         logger.info(f"question:{question}。流式最后一个词返回时间：{end_time - start_time}秒,返回json:{jsonarr}")
-    async def no_search_list(return_answer, history, question, code, msg, score, msg_id):
+    async def no_search_list(return_answer, history, question, code, msg, score, msg_id,
+                             stream_protocol=STREAM_PROTOCOL_FULL):
+        if stream_protocol == STREAM_PROTOCOL_DELTA:  # 兜底话术一次性下发
+            yield delta_header_event(code, msg, msg_id, [], [] if score != -1 else -1)
+            yield ServerSentEvent(data=dump_compact({"msg_id": msg_id, "output": return_answer, "finish": 0}), event="delta")
+            yield delta_summary_event(code, msg, msg_id, question, return_answer, history, 1)
+            return
         answer = ''
         for char in return_answer:
             answer = answer + char
@@ -377,6 +434,10 @@ async def search(request: Request):
     weights = json_request.get("weights", None)
     retrieve_method = json_request.get("retrieve_method", "hybrid_search")
     use_graph = json_request.get("use_graph", False)
+    # 流式返回协议，默认 full 兼容旧客户端，delta 为增量协议
+    stream_protocol = json_request.get("stream_protocol", STREAM_PROTOCOL_FULL)
+    if stream_protocol not in (STREAM_PROTOCOL_FULL, STREAM_PROTOCOL_DELTA):
+        stream_protocol = STREAM_PROTOCOL_FULL
 
     # metadata filtering params
     metadata_filtering = json_request.get("metadata_filtering", False)
@@ -396,7 +457,8 @@ async def search(request: Request):
         }
         logger.error(error_msg)
         if json_request.get("stream"):
-            return EventSourceResponse(no_search_list(default_answer, history, question, 1, error_msg, -1, ''))
+            return EventSourceResponse(no_search_list(default_answer, history, question, 1, error_msg, -1, '',
+                                                      stream_protocol=stream_protocol))
         else:
             return JSONResponse(content=response_info)
 
@@ -438,11 +500,12 @@ async def search(request: Request):
         history = []
     for user_id, kb_info_list in knowledge_base_info.items():
         kb_names = [kb_info['kb_name'] for kb_info in kb_info_list]
-        kb_ids = [kb_info['kb_id'] if kb_info.get('kb_id') else get_kb_name_id(user_id, kb_info['kb_name']) for kb_info in kb_info_list]
+        kb_ids = [kb_info['kb_id'] if kb_info.get('kb_id') else await run_in_threadpool(get_kb_name_id, user_id, kb_info['kb_name'])
+                  for kb_info in kb_info_list]
         if rewrite_query:
-            query_dict_list = get_query_dict_cache(redis_client,user_id, kb_ids)
-            if query_dict_list:
-                rewritten_queries = query_rewrite(question, query_dict_list)
+            query_indexes = await redis_utils.aget_query_rewrite_indexes(async_redis_client, user_id, kb_ids)
+            if query_indexes:
+                rewritten_queries = query_rewrite(question, redis_utils.match_query_dict(query_indexes, question))
                 logger.info("对query进行改写,原问题:%s 改写后问题:%s" % (question, ",".join(rewritten_queries)))
                 if len(rewritten_queries) > 0:
                     question = rewritten_queries[0]
@@ -461,11 +524,11 @@ async def search(request: Request):
             if data_flywheel:
                 # 要存储的数据
                 cache_key = "%s^%s^%s" % (knowledge_base_info, top_k, question)
-                exists = redis_client.exists(cache_key)
+                exists = await async_redis_client.exists(cache_key)
                 if exists:
                     use_cache_flag = True
                     logger.info("=========>命中缓存,cache_key=%s" % cache_key)
-                    cache_result = redis_client.get(cache_key)
+                    cache_result = await async_redis_client.get(cache_key)
                     # 将字符串转换为 JSON 对象
                     cache_result_json = json.loads(cache_result)
                     if cache_result_json and 'data' in cache_result_json:
@@ -475,7 +538,7 @@ async def search(request: Request):
                 if has_effective_cache:
                     rerank_result = cache_result_json
                 else:
-                    rerank_result = get_knowledge_based_answer(knowledge_base_info, question, rate, top_k, chunk_conent,
+                    rerank_result = await run_in_threadpool(get_knowledge_based_answer, knowledge_base_info, question, rate, top_k, chunk_conent,
                                                                chunk_size, return_meta, prompt_template, search_field,
                                                                default_answer, auto_citation, retrieve_method,
                                                                rerank_model_id=rerank_model_id, rerank_mod=rerank_mod,
@@ -484,7 +547,7 @@ async def search(request: Request):
                                                                use_graph=use_graph
                                                                )
             else:
-                rerank_result = get_knowledge_based_answer(knowledge_base_info, question, rate, top_k, chunk_conent,
+                rerank_result = await run_in_threadpool(get_knowledge_based_answer, knowledge_base_info, question, rate, top_k, chunk_conent,
                                                            chunk_size, return_meta, prompt_template, search_field,
                                                            default_answer, auto_citation, retrieve_method,
                                                            rerank_model_id=rerank_model_id, rerank_mod=rerank_mod,
@@ -558,7 +621,7 @@ async def search(request: Request):
                 }
                 # collection.insert_one(message)
                 # collection.update_one(u_condition, message, upsert=True)
-                collection.update_one(u_condition, {'$set': message}, upsert=True)
+                await run_in_threadpool(collection.update_one, u_condition, {'$set': message}, upsert=True)
                 if "_id" in message:
                     del message["_id"]
                 logger.info("=======>user log已存储至mongoDB,id=%s,data=%s" % (msg_id, json.dumps(message, ensure_ascii=False)))
@@ -582,13 +645,16 @@ async def search(request: Request):
             logger.info(f"======save mongoDB 使用时间：{temp_end_time - temp_start_time}秒")
         if stream:
             if response_info['code'] !=0:
-                return EventSourceResponse(no_search_list(default_answer,history,question,response_info['code'],response_info['message'], score, msg_id))
+                return EventSourceResponse(no_search_list(default_answer,history,question,response_info['code'],response_info['message'], score, msg_id,
+                                                          stream_protocol=stream_protocol))
             # 需要大模型输出
             if len(search_list)>0 or chichat:
-                return EventSourceResponse(stream_generate(prompt, history, search_list,question,top_p,repetition_penalty,temperature,custom_model_info,do_sample,score,msg_id))
+                return EventSourceResponse(stream_generate(prompt, history, search_list,question,top_p,repetition_penalty,temperature,custom_model_info,do_sample,score,msg_id,
+                                                           stream_protocol=stream_protocol))
              # 知识召回为空，并且使用兜底话术返回，不需要大模型输出
             else:
-                return EventSourceResponse(no_search_list(default_answer,history,question,0,'success', score, msg_id))
+                return EventSourceResponse(no_search_list(default_answer,history,question,0,'success', score, msg_id,
+                                                          stream_protocol=stream_protocol))
 
         else:  # 非stream返回
             # if response_info['code'] != 0:
@@ -3,7 +3,9 @@ import os
 
 from enum import Enum
 from logging_config import setup_logging
+from model_config_registry import ModelConfigRegistry
 from settings import MODEL_PROVIDER_URL, MODEL_PROVIDER_ACCESS_TOKEN
+from utils.redis_utils import get_redis_connection
 
 logger_name = 'model_manager'
 app_name = os.getenv("LOG_FILE")
@@ -196,9 +198,9 @@ class OcrModelConfig(ModelConfigure):
         )
 
 
-def get_model_configure(model_id: str) -> ModelConfigure:
+def _fetch_model_configure(model_id: str) -> ModelConfigure:
     """
-    Get model configuration by model id.
+    Fetch model configuration from the model provider by model id.
     """
 
     header = {
@@ -228,3 +230,33 @@ def get_model_configure(model_id: str) -> ModelConfigure:
     except Exception as e:
         logger.error("模型参数请求异常：" + repr(e))
         raise RuntimeError(f"Failed to get model configuration: {e}")
+
+
+# 模型配置全局版本号，调用 invalidate_model_configure 时递增，所有进程据此清空本地缓存
+MODEL_CONFIG_VERSION_KEY = "model_config_version"
+redis_client = get_redis_connection()
+
+
+def _get_model_config_version():
+    return redis_client.get(MODEL_CONFIG_VERSION_KEY)
+
+
+_model_config_registry = ModelConfigRegistry(_fetch_model_configure, version_loader=_get_model_config_version,
+                                             logger=logger)
+
+
+def get_model_configure(model_id: str) -> ModelConfigure:
+    """
+    Get model configuration by model id, served from the process-wide cache.
+    """
+    return _model_config_registry.get(model_id)
+
+
+def invalidate_model_configure(model_id: str = None):
+    """
+    Drop cached configuration of model_id, or of all models when model_id is None.
+    Other processes drop their caches within MODEL_CONFIG_CHECK_INTERVAL seconds.
+    """
+    _model_config_registry.invalidate(model_id)
+    redis_client.incr(MODEL_CONFIG_VERSION_KEY)
+    logger.info(f"模型配置缓存已失效, model_id: {model_id}")
@@ -23,18 +23,30 @@ def search_qa_base(question, top_k, threshold=0.0, return_meta=False, retrieve_m
         qa_result_list = []
         search_list_infos = {}
 
-        for user_id, qa_base_name_id_list in qa_base_info.items():
-            search_result = None
-            qa_base_names = [qa_base_name_id["QABase"] for qa_base_name_id in qa_base_name_id_list]
-            if retrieve_method in {"semantic_search", "hybrid_search"}:
-                search_result = es_utils.vector_search(user_id, qa_base_names, question, top_k, threshold=threshold,
-                                                       metadata_filtering_conditions = metadata_filtering_conditions)
-
-            if retrieve_method in {"full_text_search", "hybrid_search"}:
-                search_result = es_utils.full_text_search(user_id, qa_base_names, question, top_k,threshold=threshold, metadata_filtering_conditions=metadata_filtering_conditions)
+        if retrieve_method == "hybrid_search":
+            # 所有用户的问答库在 ES 服务端一次检索、统一融合排序，加权模式直接使用融合后的分数
+            user_base_names = {user_id: [qa_base_name_id["QABase"] for qa_base_name_id in qa_base_name_id_list]
+                               for user_id, qa_base_name_id_list in qa_base_info.items()}
+            search_result = es_utils.hybrid_search(user_base_names, question, top_k, threshold=threshold,
+                                                   metadata_filtering_conditions=metadata_filtering_conditions,
+                                                   weights=weights if rerank_mod == "weighted_score" else None)
+            search_results = [(user_base_names, search_result)]
+        else:
+            search_results = []
+            for user_id, qa_base_name_id_list in qa_base_info.items():
+                qa_base_names = [qa_base_name_id["QABase"] for qa_base_name_id in qa_base_name_id_list]
+                if retrieve_method == "semantic_search":
+                    search_result = es_utils.vector_search(user_id, qa_base_names, question, top_k, threshold=threshold,
+                                                           metadata_filtering_conditions = metadata_filtering_conditions)
+                elif retrieve_method == "full_text_search":
+                    search_result = es_utils.full_text_search(user_id, qa_base_names, question, top_k,threshold=threshold, metadata_filtering_conditions=metadata_filtering_conditions)
+                else:
+                    raise Exception("retrieve_method is not valid")
+                search_results.append(({user_id: qa_base_names}, search_result))
 
+        for user_base_names, search_result in search_results:
             search_result_str = json.dumps(search_result, ensure_ascii=False)
-            logger.info(f"问题问答库查询结果：查询类型：{retrieve_method}, user_id: {user_id}, qa_base_name_id_list: {qa_base_name_id_list}, question: {question}, search_result: {search_result_str}")
+            logger.info(f"问题问答库查询结果：查询类型：{retrieve_method}, user_base_names: {user_base_names}, question: {question}, search_result: {search_result_str}")
             if search_result['code'] != 0:
                 raise RuntimeError(search_result['message'])
 
@@ -48,10 +60,12 @@ def search_qa_base(question, top_k, threshold=0.0, return_meta=False, retrieve_m
                 qa_info["content_type"] = "qa"
                 qa_result_list.append(qa_info)
 
-            search_list_infos[user_id] = {
-                "base_names": qa_base_names,
-                "search_list": search_list
-            }
+            if retrieve_method != "hybrid_search":
+                for user_id, qa_base_names in user_base_names.items():
+                    search_list_infos[user_id] = {
+                        "base_names": qa_base_names,
+                        "search_list": search_list
+                    }
 
         # reank重排
         if not qa_result_list:
@@ -61,6 +75,11 @@ def search_qa_base(question, top_k, threshold=0.0, return_meta=False, retrieve_m
             documents = [{"text": qa_info["question"]} for qa_info in qa_result_list]
             rerank_result = rerank_utils.get_model_rerank(question, top_k, documents,
                                                           qa_result_list, rerank_model_id)
+        elif rerank_mod == "weighted_score" and retrieve_method == "hybrid_search":
+            qa_result_list.sort(key=lambda qa_info: qa_info["score"], reverse=True)
+            qa_result_list = qa_result_list[:top_k]
+            rerank_result = {"code": 0, "data": {"sorted_scores": [qa_info["score"] for qa_info in qa_result_list],
+                                                 "sorted_search_list": qa_result_list}}
         elif rerank_mod == "weighted_score":
             rerank_result = es_utils.qa_weighted_rerank(question, weights, top_k, search_list_infos)
         else:
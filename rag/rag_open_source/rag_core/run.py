@@ -16,14 +16,16 @@ from utils import file_utils
 from utils import kafka_utils
 from utils import chunk_utils
 from utils import graph_utils
+from utils import es_utils
 import utils.knowledge_base_utils as kb_utils
 from utils.constant import CHUNK_SIZE
 import urllib.parse
 import urllib3
-from know_sse import get_query_dict_cache, query_rewrite
+from know_sse import query_rewrite
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 from logging_config import setup_logging
 from settings import MONGO_URL, USE_DATA_FLYWHEEL
+from model_manager import invalidate_model_configure
 from qa import index as qa_index
 from qa import search as qa_search
 
@@ -447,9 +449,9 @@ def search_knowledge_base():
             for user_id, kb_info_list in knowledge_base_info.items():
                 kb_names = [kb_info['kb_name'] for kb_info in kb_info_list]
                 kb_ids = [kb_info['kb_id'] if kb_info.get('kb_id') else kb_utils.get_kb_name_id(user_id, kb_info['kb_name']) for kb_info in kb_info_list]
-                query_dict_list = get_query_dict_cache(redis_client, user_id, kb_ids)
-                if query_dict_list:
-                    rewritten_queries = query_rewrite(question, query_dict_list)
+                query_indexes = redis_utils.get_query_rewrite_indexes(redis_client, user_id, kb_ids)
+                if query_indexes:
+                    rewritten_queries = query_rewrite(question, redis_utils.match_query_dict(query_indexes, question))
                     logger.info("对query进行改写,原问题:%s 改写后问题:%s" % (question, ",".join(rewritten_queries)))
                     if len(rewritten_queries) > 0:
                         question = rewritten_queries[0]
@@ -955,6 +957,25 @@ def del_knowledge_cache():
         response = make_response(json.dumps(response_info, ensure_ascii=False), headers)
     return response
 
+@app.route("/rag/invalidate-model-config", methods=["POST"])
+def invalidate_model_config():
+    """ 模型配置修改后调用，失效 rag 与 es 服务的模型配置缓存，不传 modelId 则失效全部模型 """
+    logger.info('---------------失效模型配置缓存---------------')
+    try:
+        init_info = json.loads(request.get_data() or "{}")
+        model_id = init_info.get("modelId")
+        logger.info(repr(init_info))
+
+        invalidate_model_configure(model_id)
+        es_utils.invalidate_model_configure(model_id)
+        response_info = {'code': 0, "message": "成功"}
+    except Exception as e:
+        logger.error(repr(e))
+        response_info = {'code': 1, "message": repr(e)}
+    headers = {'Access-Control-Allow-Origin': '*'}
+    response = make_response(json.dumps(response_info, ensure_ascii=False), headers)
+    return response
+
 def truncate_filename(filename, max_length=200):
     """
     从后往前截取文件名，确保其长度不超过 max_length 并保留扩展名
@@ -1590,9 +1611,9 @@ def search_qa_base():
             for user_id, qa_info_list in qa_base_info.items():
                 qa_base_names = [qa_info['QABase'] for qa_info in qa_info_list]
                 qa_base_ids = [qa_info['QAId']  for qa_info in qa_info_list]
-                query_dict_list = get_query_dict_cache(redis_client, user_id, qa_base_ids)
-                if query_dict_list:
-                    rewritten_queries = query_rewrite(question, query_dict_list)
+                query_indexes = redis_utils.get_query_rewrite_indexes(redis_client, user_id, qa_base_ids)
+                if query_indexes:
+                    rewritten_queries = query_rewrite(question, redis_utils.match_query_dict(query_indexes, question))
                     logger.info("对query进行改写,原问题:%s 改写后问题:%s" % (question, ",".join(rewritten_queries)))
                     if len(rewritten_queries) > 0:
                         question = rewritten_queries[0]
@@ -1,10 +1,13 @@
 import argparse
+from multiprocessing import freeze_support
 
 import gunicorn_server
-from run import app  # 替换为你的Flask应用导入路径
 
 
 def main():
+    # 在 main 中导入应用，PDF 页面解析进程池的 spawn 子进程重新导入本文件时不会初始化整个应用
+    from run import app  # 替换为你的Flask应用导入路径
+
     parser = argparse.ArgumentParser(description='run Flask应用入口点')
     parser.add_argument('--port', type=int, default=5000, help='服务端口号')
     parser.add_argument('--host', type=str, default='0.0.0.0', help='服务主机')
@@ -34,4 +37,5 @@ def main():
 
 
 if __name__ == "__main__":
+    freeze_support()
     main()
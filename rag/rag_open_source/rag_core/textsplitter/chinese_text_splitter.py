@@ -4,6 +4,7 @@ import os
 from typing import List
 
 from logging_config import setup_logging
+from textsplitter.span_splitter import split_by_sentence, split_by_separators
 
 logger_name='rag_chinesesplit_utils'
 app_name = os.getenv("LOG_FILE")
@@ -90,6 +91,29 @@ class ChineseTextSplitter(CharacterTextSplitter):
 
     def split_text1(self, text: str) -> List[str]:
         # logger.info('走到通用切分')
+        chunks = split_by_sentence(text, self.separators, self.sentence_size, self.overlap_size,
+                                   self._split_long_sentence)
+        if chunks is None:
+            chunks = self._split_text1_by_regex(text)
+        return chunks
+
+    def _split_long_sentence(self, ele: str) -> List[str]:
+        ele1 = re.sub(r'([.]["’”」』]{0,2})([^,，.])', r'\1\n\2', ele)
+        ele1_ls = ele1.split("\n")
+        for ele_ele1 in ele1_ls:
+            if len(ele_ele1) > self.sentence_size:
+                ele_ele2 = re.sub(r'([\n]{1,}| {2,}["’”」』]{0,2})([^\s])', r'\1\n\2', ele_ele1)
+                ele2_ls = ele_ele2.split("\n")
+                for ele_ele2 in ele2_ls:
+                    if len(ele_ele2) > self.sentence_size:
+                        ele_ele3 = re.sub(r'( ["’”」』]{0,2})([^ ])', r'\1\n\2', ele_ele2)
+                        ele2_id = ele2_ls.index(ele_ele2)
+                        ele2_ls = ele2_ls[:ele2_id] + [i for i in ele_ele3.split("\n") if i] + ele2_ls[ele2_id + 1:]
+                ele_id = ele1_ls.index(ele_ele1)
+                ele1_ls = ele1_ls[:ele_id] + [i for i in ele2_ls if i] + ele1_ls[ele_id + 1:]
+        return [i for i in ele1_ls if i]
+
+    def _split_text1_by_regex(self, text: str) -> List[str]:
         punctuation_list = self.separators
         def generate_regex(punc_list):
             escaped_punc = [re.escape(p) for p in punc_list]
@@ -107,20 +131,7 @@ class ChineseTextSplitter(CharacterTextSplitter):
         result_sentences = []
         for ele in sentences:
             if len(ele) > self.sentence_size:
-                ele1 = re.sub(r'([.]["’”」』]{0,2})([^,，.])', r'\1\n\2', ele)
-                ele1_ls = ele1.split("\n")
-                for ele_ele1 in ele1_ls:
-                    if len(ele_ele1) > self.sentence_size:
-                        ele_ele2 = re.sub(r'([\n]{1,}| {2,}["’”」』]{0,2})([^\s])', r'\1\n\2', ele_ele1)
-                        ele2_ls = ele_ele2.split("\n")
-                        for ele_ele2 in ele2_ls:
-                            if len(ele_ele2) > self.sentence_size:
-                                ele_ele3 = re.sub(r'( ["’”」』]{0,2})([^ ])', r'\1\n\2', ele_ele2)
-                                ele2_id = ele2_ls.index(ele_ele2)
-                                ele2_ls = ele2_ls[:ele2_id] + [i for i in ele_ele3.split("\n") if i] + ele2_ls[ele2_id + 1:]
-                        ele_id = ele1_ls.index(ele_ele1)
-                        ele1_ls = ele1_ls[:ele_id] + [i for i in ele2_ls if i] + ele1_ls[ele_id + 1:]
-                result_sentences.extend([i for i in ele1_ls if i])
+                result_sentences.extend(self._split_long_sentence(ele))
             else:
                 result_sentences.append(ele)
     
@@ -158,18 +169,16 @@ class ChineseTextSplitter(CharacterTextSplitter):
                 overlap_count = int(self.overlap_size * (j - i))
                 if overlap_count < 1:
                     overlap_count = 1
-                print('overlap_count',overlap_count)
                 
                 # 更新索引 i
                 i = j - overlap_count if j - overlap_count > i else i + 1
-            if len(result) == 0:
-                print("列表为空")
-            elif len(result[-1]) < self.sentence_size and len(result) > 1:
+            if len(result) > 1 and len(result[-1]) < self.sentence_size:
                 result[-2] += result[-1]
                 result = result[:-1]
     
         return result
 
+
     def split_text2(self, text: str) -> List[str]:
         # logger.info('走到自定义切分')
         punctuation_list = self.separators
@@ -380,6 +389,13 @@ class ChineseTextSplitter(CharacterTextSplitter):
 
 
     def split_text_by_custom_separators(self, text: str) -> list[str]:
+        chunks = split_by_separators(text, self.separators, self.default_separators, self.sentence_size,
+                                     self.overlap_size)
+        if chunks is None:
+            chunks = self._split_by_custom_separators_by_regex(text)
+        return chunks
+
+    def _split_by_custom_separators_by_regex(self, text: str) -> list[str]:
         new_separators = []
         for separator in self.separators:
             separator, text = replace_k_consecutive_nl(separator, text)
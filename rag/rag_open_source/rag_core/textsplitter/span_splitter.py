@@ -0,0 +1,325 @@
+"""
+基于偏移量的切分核心。
+
+分隔符只在原文上扫描一次，句子与分块都以原文中的 (start, end) 区间表示，
+只在产出最终分块时才拼接字符串，结果与 ChineseTextSplitter 原有的按正则插入换行再切分的实现一致。
+无法保证与原实现一致的少数输入(返回 None)由调用方回退到原实现。
+"""
+import re
+from bisect import bisect_right
+from collections import deque
+from functools import lru_cache
+from typing import List, Optional
+
+# 原实现中 replace(r'\u3000', ' ') 替换的是字面量 "\u3000"(6个字符)，出现时会改变文本长度
+LITERAL_U3000 = r'\u3000'
+# 自定义分隔符切分时原实现使用的换行占位符
+NEWLINE_MARKER_CHARS = set("<NLS>\n")
+
+# 长句进一步切分的三级规则，与原实现一致
+LONG_SENTENCE_PATTERNS = (
+    re.compile(r'([.]["’”」』]{0,2})([^,，.])'),
+    re.compile(r'([\n]{1,}| {2,}["’”」』]{0,2})([^\s])'),
+    re.compile(r'( ["’”」』]{0,2})([^ ])'),
+)
+WORD_PATTERN = re.compile(r'\S+')
+
+
+@lru_cache(maxsize=64)
+def _sentence_break_pattern(separators: tuple):
+    escaped_punc = [re.escape(p) for p in separators]
+    return re.compile(r'([' + ''.join(escaped_punc) + r'])([^”’])')
+
+
+@lru_cache(maxsize=64)
+def _separator_pattern(separators: tuple):
+    return re.compile('(' + '|'.join(re.escape(p) for p in separators) + ')')
+
+
+def _rstrip_end(text: str, keep_newline: bool = False) -> int:
+    """text.rstrip() 后的长度；keep_newline 时换行视为非空白(原实现中已替换为占位符)"""
+    end = len(text)
+    while end > 0 and text[end - 1].isspace() and not (keep_newline and text[end - 1] == "\n"):
+        end -= 1
+    return end
+
+
+def _cut(pattern, text: str, start: int, end: int) -> List[tuple]:
+    """等价于 re.sub(pattern, r'\1\n\2', text[start:end]).split("\n")，在第二个分组前切开"""
+    cuts = [m.start(2) for m in pattern.finditer(text, start, end)]
+    return list(zip([start] + cuts, cuts + [end]))
+
+
+def _join(text: str, spans) -> str:
+    return "".join([text[span[0]:span[1]] for span in spans])
+
+
+def _split_long_sentence(text: str, start: int, end: int, sentence_size: int) -> Optional[List[tuple]]:
+    """
+    超长句按三级规则继续切分。原实现用 list.index 按值定位待替换的片段，
+    当前面已产生同值的超长片段时会替换到前面的片段上，此时返回 None 交由原实现处理
+    """
+    level1, level2, level3 = LONG_SENTENCE_PATTERNS
+    result = []
+    produced = set()
+    for s1, e1 in _cut(level1, text, start, end):
+        if e1 - s1 <= sentence_size:
+            result.append((s1, e1))
+            continue
+        if text[s1:e1] in produced:
+            return None
+        pieces = []
+        produced_inner = set()
+        for s2, e2 in _cut(level2, text, s1, e1):
+            if e2 - s2 <= sentence_size:
+                pieces.append((s2, e2))
+                continue
+            if text[s2:e2] in produced_inner:
+                return None
+            for s3, e3 in _cut(level3, text, s2, e2):
+                if e3 - s3 > sentence_size:
+                    produced_inner.add(text[s3:e3])
+                pieces.append((s3, e3))
+        for s, e in pieces:
+            if e - s > sentence_size:
+                produced.add(text[s:e])
+        result.extend(pieces)
+    return result
+
+
+def split_by_sentence(text: str, separators: List[str], sentence_size: int, overlap_size: float,
+                      legacy_long_sentence=None) -> Optional[List[str]]:
+    """
+    split_by_default 切分：句末标点(其后不是右引号)处断句，超长句按规则继续切分，再按长度合并为分块
+    :param legacy_long_sentence: 原实现的超长句切分函数，遇到 list.index 按值定位的特殊情况时调用
+    :return: 分块列表，需要回退到原实现时返回 None
+    """
+    if LITERAL_U3000 in text:
+        return None
+    pattern = _sentence_break_pattern(tuple(separators))
+    if pattern.groups != 2:
+        # 分隔符为空串等情况下字符类吞掉了分组，原实现会报错
+        return None
+    end = _rstrip_end(text)
+    cuts = [m.start(2) for m in pattern.finditer(text, 0, end)]
+    newline = text.find("\n", 0, end)
+    if newline >= 0:
+        newlines = [m.start() for m in re.finditer("\n", text[:end])]
+        cuts = sorted(cuts + newlines)
+
+    # 句子：被插入的换行与原文换行分隔的非空区间
+    sentences = []
+    start = 0
+    for cut in cuts:
+        if cut > start:
+            sentences.append((start, cut))
+        start = cut + 1 if text[cut] == "\n" else cut
+    if end > start:
+        sentences.append((start, end))
+
+    spans = []
+    for s, e in sentences:
+        if e - s <= sentence_size:
+            spans.append((s, e))
+            continue
+        pieces = _split_long_sentence(text, s, e, sentence_size)
+        if pieces is None:
+            if legacy_long_sentence is None:
+                return None
+            pieces = []
+            for piece in legacy_long_sentence(text[s:e]):
+                pieces.append((s, s + len(piece)))
+                s += len(piece)
+        spans.extend(pieces)
+
+    result = []
+    if overlap_size <= 0:
+        group_start = None
+        group_len = 0
+        for idx, (s, e) in enumerate(spans):
+            if e - s < sentence_size:
+                if group_start is None:
+                    group_start = idx
+                group_len += e - s
+            else:
+                if group_start is not None:
+                    result.append(_join(text, spans[group_start:idx]))
+                    group_start = None
+                    group_len = 0
+                result.append(text[s:e])
+                continue
+            if group_len > sentence_size:
+                result.append(_join(text, spans[group_start:idx + 1]))
+                group_start = None
+                group_len = 0
+        if group_start is not None:
+            result.append(_join(text, spans[group_start:]))
+    else:
+        # 句子长度前缀和，窗口右端点用二分查找
+        prefix = [0]
+        for s, e in spans:
+            prefix.append(prefix[-1] + e - s)
+        n = len(spans)
+        i = 0
+        while i < n:
+            j = max(i + 1, min(n, bisect_right(prefix, prefix[i] + sentence_size) - 1))
+            result.append(_join(text, spans[i:j]))
+            # 计算重叠句子数量
+            overlap_count = int(overlap_size * (j - i))
+            if overlap_count < 1:
+                overlap_count = 1
+            i = j - overlap_count if j - overlap_count > i else i + 1
+        if len(result) > 1 and len(result[-1]) < sentence_size:
+            result[-2] += result[-1]
+            result = result[:-1]
+    return result
+
+
+def _recursive_spans(text: str, start: int, end: int, separators: List[str], sentence_size: int, out: list):
+    """
+    等价于 ChineseTextSplitter.split_text_recursive，片段为 (start, end, is_chars)。
+    分隔符用尽后原实现逐字切分，这里把不含换行的连续字符记为一个 is_chars 区间，由合并时按字处理
+    """
+    if not separators:
+        pos = start
+        while pos < end:
+            newline = text.find("\n", pos, end)
+            stop = end if newline < 0 else newline
+            if stop > pos:
+                out.append((pos, stop, True))
+            pos = stop + 1
+        return
+    separator = separators[0]
+    if separator == " ":
+        items = [m.span() for m in WORD_PATTERN.finditer(text, start, end)]
+    else:
+        items = []
+        step = len(separator)
+        pos = start
+        while True:
+            idx = text.find(separator, pos, end)
+            if idx < 0:
+                break
+            items.append((pos, idx + step))
+            pos = idx + step
+        items.append((pos, end))
+    for s, e in items:
+        if s == e or (e - s == 1 and text[s] == "\n"):
+            continue
+        if e - s < sentence_size:
+            out.append((s, e, False))
+        else:
+            _recursive_spans(text, s, e, separators[1:], sentence_size, out)
+
+
+def _drop_front(window: deque, total: int, length: int, sentence_size: int, overlap_chars: int) -> int:
+    """merge_splits 中输出分块后从窗口头部丢弃片段的循环，返回更新后的 total(与原实现一样可能与窗口实际长度不一致)"""
+    while total > overlap_chars or (total + length > sentence_size and total > 0):
+        first_start, first_end, is_chars = window[0]
+        if is_chars:
+            # 逐字丢弃，直到 total 不再大于 overlap_chars；此后单字的后缀即其本身，total 置为 overlap_chars
+            drop = min(first_end - first_start, total - overlap_chars) if total > overlap_chars else 0
+            total -= drop
+            if drop < first_end - first_start:
+                window[0] = (first_start + drop, first_end, True)
+                total = overlap_chars
+                break
+            window.popleft()
+            continue
+        first_len = first_end - first_start
+        if total - first_len < overlap_chars and overlap_chars > 0:
+            need = overlap_chars - (total - first_len)
+            need_int = max(0, min(first_len, int(need)))
+            if need_int:
+                window[0] = (first_end - need_int, first_end, False)
+            total = overlap_chars
+            break
+        else:
+            total -= first_len
+            window.popleft()
+    return total
+
+
+def _merge_spans(text: str, spans: List[tuple], sentence_size: int, overlap_chars: int, out: list):
+    """等价于 ChineseTextSplitter.merge_splits，窗口只保存区间，逐字片段整段处理"""
+    window = deque()
+    total = 0
+    for s, e, is_chars in spans:
+        if not is_chars:
+            length = e - s
+            if window and total + length > sentence_size:
+                chunk = _join(text, window).strip()
+                if chunk:
+                    out.append(chunk)
+                total = _drop_front(window, total, length, sentence_size, overlap_chars)
+            window.append((s, e, False))
+            total += length
+            continue
+        while s < e:
+            if window and total + 1 > sentence_size:
+                chunk = _join(text, window).strip()
+                if chunk:
+                    out.append(chunk)
+                total = _drop_front(window, total, 1, sentence_size, overlap_chars)
+            # 第一个字之后，total 达到 sentence_size 前都不会触发输出
+            step = 1 + min(e - s - 1, max(0, sentence_size - total - 1))
+            window.append((s, s + step, True))
+            total += step
+            s += step
+    chunk = _join(text, window).strip()
+    if chunk:
+        out.append(chunk)
+
+
+def split_by_separators(text: str, separators: List[str], default_separators: List[str], sentence_size: int,
+                        overlap_size: float) -> Optional[List[str]]:
+    """
+    split_by_design 切分：按自定义分隔符(含连续换行)断句，超长片段按默认标点递归切分后再合并
+    :return: 分块列表，需要回退到原实现时返回 None
+    """
+    if LITERAL_U3000 in text or "<NL" in text:
+        return None
+    newline_runs = []  # 连续换行分隔符的换行个数，按配置顺序
+    plain = []
+    for separator in separators:
+        normalized = separator.replace('\\n', '\n')
+        if re.fullmatch(r'\n+', normalized):
+            newline_runs.append(len(normalized))
+        elif not separator or NEWLINE_MARKER_CHARS & set(separator):
+            return None
+        elif separator not in plain:
+            plain.append(separator)
+
+    # 每个分隔符匹配的结束位置即片段边界；换行分隔符本身不计入片段内容
+    end = _rstrip_end(text, keep_newline=True)
+    cuts = []
+    if plain:
+        cuts = [(m.end(), m.end()) for m in _separator_pattern(tuple(plain)).finditer(text)]
+    if newline_runs and "\n" in text:
+        newline_cuts = []
+        for m in re.finditer(r'\n+', text):
+            pos, remaining = m.start(), m.end() - m.start()
+            for k in newline_runs:
+                count = remaining // k
+                for _ in range(count):
+                    newline_cuts.append((pos + k, pos))
+                    pos += k
+                remaining -= count * k
+        cuts = sorted(cuts + newline_cuts)
+
+    final_chunks = []
+    overlap_chars = int(overlap_size * sentence_size)
+    start = 0
+    for cut, content_end in cuts + [(end, end)]:
+        if start >= end:
+            break
+        content_end = min(content_end, end)
+        if cut > start or content_end > start:
+            if content_end - start < sentence_size:
+                final_chunks.append(text[start:content_end])
+            else:
+                spans = []
+                _recursive_spans(text, start, content_end, default_separators, sentence_size, spans)
+                _merge_spans(text, spans, sentence_size, overlap_chars, final_chunks)
+        start = cut
+    return final_chunks
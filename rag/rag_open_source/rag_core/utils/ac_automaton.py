@@ -0,0 +1,63 @@
+from collections import deque
+
+
+class AhoCorasickAutomaton:
+    """
+    Aho-Corasick 多模式匹配自动机，构建后一次扫描即可找出文本中出现的全部词，
+    复杂度 O(len(text) + 命中数)，与词表大小无关
+    """
+
+    def __init__(self, words=()):
+        self._goto = [{}]   # 状态转移表，状态 0 为根
+        self._fail = [0]
+        self._output = [()]  # 每个状态上结束的词(含经 fail 链继承的词)
+        self.size = 0
+        for word in set(words):
+            if word:
+                self._add(word)
+        self._build()
+
+    def _add(self, word: str):
+        state = 0
+        for ch in word:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] = (word,)
+        self.size += 1
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[next_state] = fail
+                if self._output[fail]:
+                    self._output[next_state] = self._output[next_state] + self._output[fail]
+
+    def iter_matches(self, text: str):
+        """逐个返回 (结束位置, 词)，包含重叠命中"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for word in output[state]:
+                yield i, word
+
+    def find_all(self, text: str) -> set:
+        """返回文本中出现过的词集合"""
+        if not self.size or not text:
+            return set()
+        return {word for _, word in self.iter_matches(text)}
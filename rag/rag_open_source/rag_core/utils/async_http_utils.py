@@ -0,0 +1,51 @@
+import os
+
+import httpx
+
+from logging_config import setup_logging
+from settings import TIME_OUT
+
+logger_name = 'rag_async_http_utils'
+app_name = os.getenv("LOG_FILE")
+logger = setup_logging(app_name, logger_name)
+logger.info(logger_name + '---------LOG_FILE：' + repr(app_name))
+
+# 每个 worker 进程内按用途共享的异步连接池，例如 "llm"、"es"、"rerank"
+ASYNC_CLIENT_LIMITS = httpx.Limits(max_connections=500, max_keepalive_connections=100, keepalive_expiry=60)
+_async_clients = {}
+
+
+def get_async_client(name: str = "default") -> httpx.AsyncClient:
+    """
+    获取进程内共享的异步 http 客户端，连接在同名用途下复用
+    :param name: 连接池名称
+    """
+    client = _async_clients.get(name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=ASYNC_CLIENT_LIMITS,
+                                   timeout=httpx.Timeout(TIME_OUT, connect=10),
+                                   verify=False)
+        _async_clients[name] = client
+        logger.info(f"async http client created: {name}")
+    return client
+
+
+async def stream_post_lines(url: str, json_data: dict, headers: dict = None, client_name: str = "default"):
+    """
+    以流式 POST 请求并逐行异步返回响应内容，不阻塞事件循环
+    """
+    client = get_async_client(client_name)
+    async with client.stream("POST", url, json=json_data, headers=headers) as response:
+        if response.status_code != 200:
+            body = await response.aread()
+            raise RuntimeError(f"{url} status_code: {response.status_code}, response: {body.decode('utf-8', 'ignore')}")
+        async for line in response.aiter_lines():
+            yield line
+
+
+async def close_async_clients():
+    """关闭所有异步连接池，进程退出时调用"""
+    for name, client in list(_async_clients.items()):
+        await client.aclose()
+        _async_clients.pop(name, None)
+        logger.info(f"async http client closed: {name}")
@@ -102,9 +102,54 @@ MAX_SENTENCE_SIZE = 4048
 MIN_SENTENCE_SIZE = 100
 
 OCR_MAX_WORKERS = 1
+#单个文档OCR同时在途的页数
+OCR_INFLIGHT_WINDOW = int(os.getenv("OCR_INFLIGHT_WINDOW", OCR_MAX_WORKERS))
 #模型解析服务
 MODEL_PARSER_MAX_WORKERS = 1
 
 #add file
 USER_DATA_PATH = "./user_data"
-CONVERT_DIR = "/model_extend/convert"
\ No newline at end of file
+CONVERT_DIR = "/model_extend/convert"
+#检索通道并发
+RETRIEVAL_MAX_WORKERS = 32
+# 各检索通道的截止时间(秒)，超时或异常的通道降级为空结果
+RETRIEVAL_CHANNEL_TIMEOUT = {
+    "milvus": 60,
+    "es": 60,
+    "label": 30,
+    "post_filter": 30,
+    "graph": 120,
+}
+
+#sse 服务同步调用线程池上限
+SSE_THREADPOOL_SIZE = 200
+
+#chunk 标签匹配器跨进程版本检查间隔(秒)，本进程内的标签更新立即生效
+CHUNK_LABEL_CHECK_INTERVAL = 5
+
+#图谱实体词表匹配器跨进程版本检查间隔(秒)
+GRAPH_VOCABULARY_CHECK_INTERVAL = 5
+
+#专名改写索引跨进程版本检查间隔(秒)，本进程内 /rag/proper_noun 的增删改立即生效
+QUERY_DICT_CHECK_INTERVAL = 5
+#专名改写最多生成的改写问题数，多个专名命中时按别名组合顺序截断
+QUERY_REWRITE_MAX_COMBINATIONS = int(os.getenv("QUERY_REWRITE_MAX_COMBINATIONS", 16))
+
+#文档入库调度：工作线程数、在途文件上限(排队+运行)、大文件并发上限
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", min(os.cpu_count() or 1, 8)))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", INGEST_MAX_WORKERS * 4))
+INGEST_MAX_LARGE_RUNNING = int(os.getenv("INGEST_MAX_LARGE_RUNNING", max(1, INGEST_MAX_WORKERS // 2)))
+# 小于该大小(字节)的文件优先处理，大小未知的文件按大文件处理
+INGEST_SMALL_FILE_SIZE = 5 * 1024 * 1024
+# 大文件排队超过该时间(秒)后不再让位于小文件，避免饿死
+INGEST_LARGE_FILE_MAX_WAIT = 300
+#kafka 每次拉取的消息条数
+KAFKA_MAX_POLL_RECORDS = 20
+#向量库分批写入时同时在途的批次数
+MILVUS_ADD_MAX_CONCURRENCY = 4
+#PDF 逐页解析进程池：进程数、每个任务的页数、启用进程池的最小页数
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", min(os.cpu_count() or 1, 4)))
+PDF_PARSE_BATCH_PAGES = 8
+PDF_PARSE_POOL_MIN_PAGES = 16
+#判断PDF文档类型时解析的页数
+PDF_PROBE_PAGES = 12
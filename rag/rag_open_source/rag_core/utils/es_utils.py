@@ -203,32 +203,34 @@ def get_weighted_rerank(query, weights, search_list, top_k):
         return {"code": 1, "message": str(e)}
 
 
+def multi_search_es(user_id, kb_names, es_data, search_name="es"):
+    """所有知识库的检索合并为一次 /api/v1/rag/es/multi_search 请求，返回按知识库顺序拼接的检索结果"""
+    es_data['user_id'] = user_id
+    es_data['kb_names'] = kb_names
+    es_url = ES_BASE_URL + "/api/v1/rag/es/multi_search"
+    headers = {'Content-Type': 'application/json'}
+    try:
+        response = requests.post(es_url, headers=headers, json=es_data, timeout=TIME_OUT)
+        if response.status_code == 200:
+            search_list = json.loads(response.text)['result']['search_list']
+            logger.info("知识库：" + repr(kb_names) + search_name + "检索请求成功")
+            return search_list
+        else:
+            logger.error("知识库：" + repr(kb_names) + search_name + "检索请求失败：" + repr(response.text))
+    except Exception as e:
+        logger.error("知识库：" + repr(kb_names) + search_name + "检索请求异常：" + repr(e))
+    return []
+
+
 def search_es(user_id, kb_names, query, top_k, kb_ids=[], filter_file_name_list=[], metadata_filtering_conditions = []):
-    search_list = []
-    for kb_name in kb_names:
-        es_data = {}
-        es_data['user_id'] = user_id
-        es_data['kb_name'] = kb_name
-        es_data['query'] = query
-        es_data['top_k'] = top_k
-        es_data['min_score'] = 0
-        es_data['filter_file_name_list'] = filter_file_name_list
-        es_data['metadata_filtering_conditions'] = metadata_filtering_conditions
-        es_url = ES_BASE_URL + "/api/v1/rag/es/search"
-        headers = {'Content-Type': 'application/json'}
-        try:
-            response = requests.post(es_url, headers=headers, json=es_data, timeout=TIME_OUT)
-            if response.status_code == 200:
-                tmp_sl = json.loads(response.text)['result']['search_list']
-                for x in range(len(tmp_sl)):
-                    tmp_sl[x]['kb_name'] = kb_name
-                search_list = search_list + tmp_sl
-                logger.info("知识库：" + repr(kb_name) + "es检索请求成功")
-            else:
-                logger.error("知识库：" + repr(kb_name) + "es检索请求失败：" + repr(response.text))
-        except Exception as e:
-            logger.error("知识库：" + repr(kb_name) + "es检索请求异常：" + repr(e))
-    return search_list
+    es_data = {}
+    es_data['search_type'] = "text"
+    es_data['query'] = query
+    es_data['top_k'] = top_k
+    es_data['min_score'] = 0
+    es_data['filter_file_name_list'] = filter_file_name_list
+    es_data['metadata_filtering_conditions'] = metadata_filtering_conditions
+    return multi_search_es(user_id, kb_names, es_data, search_name="es")
 
 
 def search_graph_es(user_id, kb_names, query, top_k, kb_ids=[], filter_file_name_list=[]):
@@ -260,31 +262,14 @@ def search_graph_es(user_id, kb_names, query, top_k, kb_ids=[], filter_file_name
 
 
 def search_keyword(user_id, kb_names, keywords, top_k, kb_ids=[], filter_file_name_list=[], metadata_filtering_conditions = []):
-    search_list = []
-    for kb_name in kb_names:
-        es_data = {}
-        es_data['user_id'] = user_id
-        es_data['kb_name'] = kb_name
-        es_data['keywords'] = keywords
-        es_data['top_k'] = top_k
-        es_data['min_score'] = 0
-        es_data['filter_file_name_list'] = filter_file_name_list
-        es_data['metadata_filtering_conditions'] = metadata_filtering_conditions
-        es_url = ES_BASE_URL + "/api/v1/rag/es/keyword_search"
-        headers = {'Content-Type': 'application/json'}
-        try:
-            response = requests.post(es_url, headers=headers, json=es_data, timeout=TIME_OUT)
-            if response.status_code == 200:
-                tmp_sl = json.loads(response.text)['result']['search_list']
-                for x in range(len(tmp_sl)):
-                    tmp_sl[x]['kb_name'] = kb_name
-                search_list = search_list + tmp_sl
-                logger.info("知识库：" + repr(kb_name) + "es keyword 检索请求成功")
-            else:
-                logger.error("知识库：" + repr(kb_name) + "es keyword检索请求失败：" + repr(response.text))
-        except Exception as e:
-            logger.error("知识库：" + repr(kb_name) + "es keyword检索请求异常：" + repr(e))
-    return search_list
+    es_data = {}
+    es_data['search_type'] = "keyword"
+    es_data['keywords'] = keywords
+    es_data['top_k'] = top_k
+    es_data['min_score'] = 0
+    es_data['filter_file_name_list'] = filter_file_name_list
+    es_data['metadata_filtering_conditions'] = metadata_filtering_conditions
+    return multi_search_es(user_id, kb_names, es_data, search_name="es keyword")
 
 
 def del_es_file(user_id, kb_name, file_name, kb_id=""):
@@ -714,6 +699,47 @@ def full_text_search(user_id, base_names, question, top_k, search_by = "question
         logger.error(f"问答对全文检索请求异常, user_id: {user_id}, base_names: {base_names}, exception: {repr(e)}")
         return response_info
 
+def hybrid_search(user_base_names, question, top_k, threshold=0.0, metadata_filtering_conditions=[], weights=None,
+                  base_type="qa"):
+    """
+    问答库混合检索，所有用户的问答库在 ES 服务端一次请求完成检索并统一融合；weights 为空时按 RRF 融合
+    :param user_base_names: {user_id: [问答库名称]}
+    """
+    response_info = {'code': 0, "message": "成功", "data": {}}
+    url = ES_BASE_URL + '/api/v1/rag/es/hybrid_search'
+    headers = {'Content-Type': 'application/json'}
+
+    data = {
+        "user_base_names": user_base_names,
+        "topk": top_k,
+        "question": question,
+        "threshold": threshold,
+        "metadata_filtering_conditions": metadata_filtering_conditions,
+        "weights": weights,
+        "base_type": base_type
+    }
+    try:
+        response = requests.post(url, headers=headers, data=json.dumps(data, ensure_ascii=False).encode('utf-8'),
+                                 timeout=TIME_OUT)
+        if response.status_code != 200:
+            logger.error(
+                f"问答对混合检索请求失败, user_base_names: {user_base_names}, response: {repr(response.text)}")
+            raise RuntimeError(str(response.text))
+
+        result_data = json.loads(response.text)
+        if result_data['code'] != 0:
+            logger.error(
+                f"问答对混合检索请求失败, user_base_names: {user_base_names}, response: {result_data}")
+            raise RuntimeError(result_data['message'])
+
+        logger.info(f"问答对混合检索请求成功, user_base_names: {user_base_names}")
+        return result_data
+    except Exception as e:
+        response_info['code'] = 1
+        response_info['message'] = str(e)
+        logger.error(f"问答对混合检索请求异常, user_base_names: {user_base_names}, exception: {repr(e)}")
+        return response_info
+
 def qa_weighted_rerank(query, weights, top_k, search_list_infos):
     response_info = {'code': 0, "message": "成功", "data": {"search_list":[], "scores": []}}
     es_data = {
@@ -743,6 +769,21 @@ def qa_weighted_rerank(query, weights, top_k, search_list_infos):
     return sorted_scores, sorted_search_list
 
 
+def invalidate_model_configure(model_id=None):
+    es_url = ES_BASE_URL + "/api/v1/rag/es/model_config/invalidate"
+    headers = {'Content-Type': 'application/json'}
+    response = requests.post(es_url, headers=headers, json={"model_id": model_id}, timeout=TIME_OUT)
+    if response.status_code != 200:
+        logger.error(f"es模型配置缓存失效请求失败, model_id: {model_id}, response: {repr(response.text)}")
+        raise RuntimeError(str(response.text))
+
+    result_data = json.loads(response.text)
+    if result_data['code'] != 0:
+        logger.error(f"es模型配置缓存失效请求失败, model_id: {model_id}, response: {result_data}")
+        raise RuntimeError(result_data['message'])
+    logger.info(f"es模型配置缓存失效请求成功, model_id: {model_id}")
+
+
 
 if __name__ == '__main__':
     keywords = {"商飞测试": 100,"杭州": 10}
@@ -334,10 +334,11 @@ def split_file_adapter(add_file_path: str, download_link: str, config: SplitConf
         else:
             loader = PDFLoader(file_path=add_file_path, parser_choices=config.parser_choices, ocr_model_id = config.ocr_model_id, autodetect_encoding=True)
             chunk_type, height_list = loader.get_chunk_type()
-            logger.info("------>load_file,chunk_type=%s" % str(loader.get_chunk_type()))
+            logger.info("------>load_file,chunk_type=%s" % str((chunk_type, height_list)))
             if chunk_type == 2:
                 logger.info("-----定制化pdf解析+切分：处理文字版（含表格、标题）-------")
-                chunks = loader.load_and_split_doc(height_list)
+                # 按页流式产出，边解析边转换
+                chunks = loader.iter_split_doc(height_list)
             elif chunk_type == 3:
                 logger.info("-----定制化pdf解析+切分：OCR影印版PDF解析-------")
                 chunks = ocr_utils.ocr_parser(add_file_path, config.ocr_model_id)
@@ -348,7 +349,7 @@ def split_file_adapter(add_file_path: str, download_link: str, config: SplitConf
     elif file_name.lower().endswith(".xlsx"):
         logger.info("-----定制化xlsx解析+切分：支持多sheet页-------")
         loader = ExcelLoader(add_file_path, autodetect_encoding=True)
-        chunks = loader.load_and_split_doc()
+        chunks = loader.iter_split_doc()
     elif file_name.lower().endswith(".xls"):
         logger.info("-----定制化xls解析+切分：支持多sheet页-------")
         loader = ExcelLoader(add_file_path, autodetect_encoding=True)
@@ -358,42 +359,43 @@ def split_file_adapter(add_file_path: str, download_link: str, config: SplitConf
         loader = DOCXLoader(add_file_path, autodetect_encoding=True)
         chunks = loader.custom_load_and_split_doc()
 
-    status = True if len(chunks) > 0 else False
-    if status:
-        new_chunks = []
-        for chunk in chunks:
-            text = chunk["text"][:MAX_SENTENCE_SIZE]
-            row_num = 0
-            if len(text) > 0:
-                chunk_type = chunk.get('type', 'text')
-                page_num = chunk.get('page_num', [])
-                parent_title = chunk.get('parent_title', [])
-                embedding_chunks = chunk.get('embedding_chunks', [])
-
-                if "meta_data" in chunk:
-                    chunk_download_link = chunk["meta_data"]["download_link"] if "download_link" in chunk["meta_data"] else ""
-                    if chunk_download_link == "":
-                        chunk_download_link = download_link
-                    chunk_file_name = chunk["meta_data"]["file_name"] if "file_name" in chunk["meta_data"] else file_name
-                    row_num = chunk["meta_data"]["row_num"] if "row_num" in chunk["meta_data"] else 0
-                else:
+    new_chunks = []
+    for chunk in chunks:
+        # 原始切分结果非空即视为解析成功
+        status = True
+        text = chunk["text"][:MAX_SENTENCE_SIZE]
+        row_num = 0
+        if len(text) > 0:
+            chunk_type = chunk.get('type', 'text')
+            page_num = chunk.get('page_num', [])
+            parent_title = chunk.get('parent_title', [])
+            embedding_chunks = chunk.get('embedding_chunks', [])
+
+            if "meta_data" in chunk:
+                chunk_download_link = chunk["meta_data"]["download_link"] if "download_link" in chunk["meta_data"] else ""
+                if chunk_download_link == "":
                     chunk_download_link = download_link
-                    chunk_file_name = file_name
-
-                doc_dict = {
-                    "type": chunk_type,
-                    "text": text,
-                    "embedding_chunks": embedding_chunks,
-                    "meta_data": {
-                        "page_num": page_num,
-                        "parent_title": parent_title,
-                        "file_name": chunk_file_name,
-                        "download_link": chunk_download_link,
-                        "row_num": row_num
-                    }
+                chunk_file_name = chunk["meta_data"]["file_name"] if "file_name" in chunk["meta_data"] else file_name
+                row_num = chunk["meta_data"]["row_num"] if "row_num" in chunk["meta_data"] else 0
+            else:
+                chunk_download_link = download_link
+                chunk_file_name = file_name
+
+            doc_dict = {
+                "type": chunk_type,
+                "text": text,
+                "embedding_chunks": embedding_chunks,
+                "meta_data": {
+                    "page_num": page_num,
+                    "parent_title": parent_title,
+                    "file_name": chunk_file_name,
+                    "download_link": chunk_download_link,
+                    "row_num": row_num
                 }
-                new_chunks.append(doc_dict)
-        chunks = new_chunks
+            }
+            new_chunks.append(doc_dict)
+    chunks = new_chunks
+    if status:
         init_chunk_num(chunks)
         sub_chunk = split_short_doc(add_file_path, download_link, chunks, config.sentence_size)
     return status, sub_chunk, chunks
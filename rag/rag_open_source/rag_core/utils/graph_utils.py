@@ -22,6 +22,9 @@ app_name = os.getenv("LOG_FILE")
 logger = setup_logging(app_name, logger_name)
 logger.info(logger_name + '---------LOG_FILE：' + repr(app_name))
 
+# 进程内共享的 redis 客户端(自带连接池)，避免每次查询新建连接池
+graph_redis_client = redis_utils.get_redis_connection()
+
 
 def parse_excel_to_schema_json(file_path):
     """
@@ -261,17 +264,12 @@ def get_kb_graph_data(user_id, kb_name, kb_id):
         raise Exception("get_kb_graph_data 发生异常：" + str(e))
 
 
-def get_graph_vocabulary_set(kb_ids: list):
-    """处理获取知识图谱实体词表数据"""
-    graph_redis_client = redis_utils.get_redis_connection()
-    kb_graph_vocabulary_list = []
-    for kb_id in kb_ids:
-        kb_graph_vocabulary_set = redis_utils.query_graph_vocabulary_set(graph_redis_client, kb_id)
-        res_vocabulary_list = [v.split("|||schema_type:")[0] for v in kb_graph_vocabulary_set]
-        res_vocabulary_type_list = [v.split("|||schema_type:")[1] for v in kb_graph_vocabulary_set]
-        kb_graph_vocabulary_list.append((res_vocabulary_list, res_vocabulary_type_list))
-    # 处理返回结果
-    return kb_graph_vocabulary_list
+def match_graph_vocabulary(kb_ids: list, question: str):
+    """
+    识别问题中出现的各知识库图谱实体，使用按版本号缓存的实体匹配自动机，不再逐次拉取整个词表
+    :return: 每个知识库一个 {实体名: [schema_type]}，与 kb_ids 顺序一致
+    """
+    return [redis_utils.get_graph_vocabulary_matcher(graph_redis_client, kb_id).match(question) for kb_id in kb_ids]
 
 
 def get_all_extrac_graph_chunks(user_id, kb_name, file_name, kb_id=""):
@@ -478,16 +476,14 @@ def get_graph_search_list(user_id, kb_names, question, top_k, kb_ids=[], filter_
         if not kb_ids:
             for kb_n in kb_names:
                 kb_ids.append(milvus_utils.get_milvus_kb_name_id(user_id, kb_n))  # 获取kb_id
-        kb_graph_vocabulary_list = get_graph_vocabulary_set(kb_ids)
         graph_node_query = ""
         entities = []
-        for kb_vocabulary_list, kb_vocabulary_type_list in kb_graph_vocabulary_list:
+        for kb_matched in match_graph_vocabulary(kb_ids, question):
             kb_entities = []
-            for vocabulary in kb_vocabulary_list:
-                if vocabulary in question:
-                    if len(vocabulary) > 3:
-                        kb_entities.append(vocabulary)
-                    graph_node_query += vocabulary
+            for vocabulary in kb_matched:
+                if len(vocabulary) > 3:
+                    kb_entities.append(vocabulary)
+                graph_node_query += vocabulary
             entities.append(kb_entities)
         if not graph_node_query:
             graph_node_query = question
@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+
+from logging_config import setup_logging
+from utils.constant import INGEST_MAX_WORKERS, INGEST_MAX_PENDING, INGEST_MAX_LARGE_RUNNING
+from utils.constant import INGEST_SMALL_FILE_SIZE, INGEST_LARGE_FILE_MAX_WAIT
+
+logger_name = 'rag_ingest_scheduler'
+app_name = os.getenv("LOG_FILE")
+logger = setup_logging(app_name, logger_name)
+logger.info(logger_name + '---------LOG_FILE：' + repr(app_name))
+
+
+class IngestTask:
+    def __init__(self, tenant, size, fn, args, kwargs, on_done=None):
+        self.tenant = tenant
+        self.size = size
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.on_done = on_done
+        # 大小未知(使用 OSS 或查询失败)时按小文件计，不占大文件并发槽位，但也不享受小文件优先
+        self.is_large = bool(size) and size > INGEST_SMALL_FILE_SIZE
+        self.prefer = bool(size) and not self.is_large
+        self.enqueued_at = time.monotonic()
+
+
+class IngestScheduler:
+    """
+    文档入库调度器：
+    1. 固定数量的工作线程，同时解析的文件数有上限，大文件(OCR、格式转换)另有并发上限
+    2. 按租户轮转出队，单个租户的批量上传不会阻塞其他租户
+    3. 同一租户内小文件优先，大文件排队超过 INGEST_LARGE_FILE_MAX_WAIT 后不再让位；大小未知的文件与大文件同队排队，但不受大文件并发上限约束
+    4. 在途文件数达到 max_pending 时 is_full() 为真，由调用方暂停拉取消息形成背压
+    """
+
+    def __init__(self, max_workers=INGEST_MAX_WORKERS, max_pending=INGEST_MAX_PENDING,
+                 max_large_running=INGEST_MAX_LARGE_RUNNING):
+        self.max_pending = max(max_pending, max_workers)
+        self.max_large_running = max(1, min(max_large_running, max_workers))
+        self._queues = OrderedDict()  # tenant -> {"small": deque, "large": deque}
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._large_running = 0
+        self._workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"ingest scheduler started, workers: {max_workers}, max_pending: {self.max_pending}, "
+                    f"max_large_running: {self.max_large_running}")
+
+    def submit(self, tenant, size, fn, *args, on_done=None, **kwargs):
+        """
+        提交一个入库任务
+        :param tenant: 租户标识(user_id)，用于公平调度
+        :param size: 文件大小(字节)，未知传 0
+        :param on_done: 任务结束回调 on_done(ok: bool)，在工作线程中调用
+        """
+        task = IngestTask(tenant, size, fn, args, kwargs, on_done)
+        with self._cond:
+            queues = self._queues.setdefault(tenant, {"small": deque(), "large": deque()})
+            queues["small" if task.prefer else "large"].append(task)
+            self._pending += 1
+            self._cond.notify()
+
+    def is_full(self) -> bool:
+        return self._pending >= self.max_pending
+
+    def pending_count(self) -> int:
+        return self._pending
+
+    def _pick_from(self, queues, now):
+        small, large = queues["small"], queues["large"]
+        large_allowed = large and (not large[0].is_large or self._large_running < self.max_large_running)
+        if large_allowed and (not small or now - large[0].enqueued_at > INGEST_LARGE_FILE_MAX_WAIT):
+            return large.popleft()
+        if small:
+            return small.popleft()
+        if large_allowed:
+            return large.popleft()
+        return None
+
+    def _next_task(self):
+        """按租户轮转取下一个可运行的任务，需持有 self._cond"""
+        now = time.monotonic()
+        for tenant in list(self._queues):
+            queues = self._queues[tenant]
+            task = self._pick_from(queues, now)
+            if task is None:
+                continue
+            # 被调度过的租户移到队尾
+            self._queues.pop(tenant)
+            if queues["small"] or queues["large"]:
+                self._queues[tenant] = queues
+            return task
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    self._cond.wait()
+                    task = self._next_task()
+                if task.is_large:
+                    self._large_running += 1
+            ok = False
+            try:
+                task.fn(*task.args, **task.kwargs)
+                ok = True
+            except Exception as e:
+                import traceback
+                logger.error(f"ingest task failed, tenant: {task.tenant}, error: {e}")
+                logger.error(traceback.format_exc())
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    if task.is_large:
+                        self._large_running -= 1
+                    # 大文件槽位释放后可能有等待中的大文件可以运行
+                    self._cond.notify_all()
+                if task.on_done is not None:
+                    try:
+                        task.on_done(ok)
+                    except Exception as e:
+                        logger.error(f"ingest task on_done failed: {e}")
+
+
+class OffsetTracker:
+    """
+    并发消费时的 offset 跟踪：每个分区只提交连续完成的最大前缀，
+    未完成的消息在进程退出或重平衡后会被重新投递
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}   # partition -> deque[offset]，按拉取顺序递增
+        self._done = {}       # partition -> set(offset)
+        self._next = {}       # partition -> 下一个待提交的 offset
+        self._committed = {}  # partition -> 已提交的 offset
+
+    def track(self, partition, offset):
+        with self._lock:
+            self._inflight.setdefault(partition, deque()).append(offset)
+            self._done.setdefault(partition, set())
+
+    def done(self, partition, offset):
+        with self._lock:
+            if partition not in self._inflight:  # 分区已被回收
+                return
+            inflight, done = self._inflight[partition], self._done[partition]
+            done.add(offset)
+            while inflight and inflight[0] in done:
+                finished = inflight.popleft()
+                done.discard(finished)
+                self._next[partition] = finished + 1
+
+    def committable(self) -> dict:
+        """返回自上次提交以来前进了的分区及其待提交 offset"""
+        with self._lock:
+            return {partition: offset for partition, offset in self._next.items()
+                    if self._committed.get(partition) != offset}
+
+    def mark_committed(self, offsets: dict):
+        with self._lock:
+            self._committed.update(offsets)
+
+    def forget(self, partitions):
+        """分区被回收后丢弃其跟踪状态，未完成的消息由新的消费者重新处理"""
+        with self._lock:
+            for partition in partitions:
+                self._inflight.pop(partition, None)
+                self._done.pop(partition, None)
+                self._next.pop(partition, None)
+                self._committed.pop(partition, None)
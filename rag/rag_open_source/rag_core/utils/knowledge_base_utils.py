@@ -41,6 +41,7 @@ from utils import rerank_utils
 from utils import minio_utils
 from utils import redis_utils
 from utils import graph_utils
+from utils import retrieval_utils
 from utils import timing
 import time
 
@@ -515,6 +516,23 @@ def update_kb_name(user_id: str, old_kb_name: str, new_kb_name: str):
     return response_info
 
 
+def label_recall(user_id, kb_names, question, top_k, metadata_filtering_conditions=[]):
+    """
+    标签召回通道：匹配问题中出现的chunk标签并按标签检索
+    :return: (label_counts, label_search_list)
+    """
+    kb_ids = [get_kb_name_id(user_id, kb_name) for kb_name in kb_names]  # 获取kb_id
+    # 用各知识库缓存的标签自动机一次扫描问题，统计命中标签词的出现次数
+    label_counts = redis_utils.match_chunk_labels(chunk_label_redis_client, kb_ids, question)
+
+    # 开始调用标签召回
+    label_search_list = []
+    if label_counts:
+        label_search_list = es_utils.search_keyword(user_id, kb_names, label_counts, top_k,
+                                                    metadata_filtering_conditions=metadata_filtering_conditions)
+    return label_counts, label_search_list
+
+
 def get_knowledge_based_answer(knowledge_base_info, question, rate, top_k, chunk_conent, chunk_size, return_meta=False,
                                prompt_template='', search_field='content', default_answer='根据已知信息，无法回答您的问题。',
                                auto_citation=False, retrieve_method="hybrid_search",
@@ -538,16 +556,44 @@ def get_knowledge_based_answer(knowledge_base_info, question, rate, top_k, chunk
         vector_text_search_list = []
         label_useful_list = []  # 后过滤有效的知识片段
         graph_data_list = []  # SPO及社区报告置顶片段
+
+        # ========== 所有用户的各路召回通道同时发起 ==========
+        executor = retrieval_utils.RetrievalExecutor()
+        user_kb_names = {}
         for user_id, base_info_list in knowledge_base_info.items():
-            temp_duplicate_set = set()
-            user_search_list = []
             kb_names = [kb_info["kb_name"] for kb_info in base_info_list]
             kb_ids = [kb_info["kb_id"] for kb_info in base_info_list]
+            user_kb_names[user_id] = kb_names
+            if retrieve_method in {"semantic_search", "hybrid_search"}:
+                executor.submit((user_id, "milvus"), "milvus", milvus_utils.search_milvus,
+                                user_id, kb_names, top_k, question, threshold=rate,
+                                search_field=search_field, kb_ids=kb_ids,
+                                filter_file_name_list=filter_file_name_list,
+                                metadata_filtering_conditions=metadata_filtering_conditions)
+            if retrieve_method in {"full_text_search", "hybrid_search"}:
+                executor.submit((user_id, "es"), "es", es_utils.search_es,
+                                user_id, kb_names, question, top_k, kb_ids=[],
+                                filter_file_name_list=filter_file_name_list,
+                                metadata_filtering_conditions=metadata_filtering_conditions)
+            executor.submit((user_id, "label"), "label", label_recall,
+                            user_id, kb_names, question, top_k,
+                            metadata_filtering_conditions=metadata_filtering_conditions)
+            if use_graph:  # 如果使用图检索
+                executor.submit((user_id, "graph"), "graph", graph_utils.get_graph_search_list,
+                                user_id, kb_names, question, top_k, kb_ids=[], threshold=rate,
+                                filter_file_name_list=filter_file_name_list)
+
+        user_search_lists = {}
+        user_label_search_lists = {}
+        user_label_counts = {}
+        user_content_status = {}
+        for user_id, kb_names in user_kb_names.items():
+            temp_duplicate_set = set()
+            user_search_list = []
             if retrieve_method in {"semantic_search", "hybrid_search"}:
-                search_result = milvus_utils.search_milvus(user_id, kb_names, top_k, question, threshold=rate,
-                                                           search_field=search_field, kb_ids=kb_ids,
-                                                           filter_file_name_list=filter_file_name_list,
-                                                           metadata_filtering_conditions = metadata_filtering_conditions)
+                search_result = executor.result((user_id, "milvus"),
+                                                default={'code': 0, "message": "降级",
+                                                         "data": {"prompt": "", "search_list": []}})
 
                 logger.info(repr(user_id) + repr(kb_names) + repr(question) + '问题向量库查询结果：' + json.dumps(repr(search_result), ensure_ascii=False))
 
@@ -574,9 +620,7 @@ def get_knowledge_based_answer(knowledge_base_info, question, rate, top_k, chunk
 
             if retrieve_method in {"full_text_search", "hybrid_search"}:
                 # es召回
-                es_search_list = es_utils.search_es(user_id, kb_names, question, top_k, kb_ids=[],
-                                                    filter_file_name_list=filter_file_name_list,
-                                                    metadata_filtering_conditions=metadata_filtering_conditions)
+                es_search_list = executor.result((user_id, "es"), default=[])
                 logger.info(repr(user_id) + repr(kb_names) + repr(question) + '问题es库查询结果：' + json.dumps(repr(es_search_list), ensure_ascii=False))
                 for item in es_search_list:
                     if item["snippet"] in temp_duplicate_set: continue
@@ -584,27 +628,13 @@ def get_knowledge_based_answer(knowledge_base_info, question, rate, top_k, chunk
                     user_search_list.append(item)
                     temp_duplicate_set.add(item["snippet"])
 
-            # ========== 标签召回通道判断及调用==========
-            unique_labels = set()   # 获取到所有的chunk标签
-            for kb_name in kb_names:
-                kb_id = get_kb_name_id(user_id, kb_name)  # 获取kb_id
-                unique_labels.update(redis_utils.get_all_chunk_labels(chunk_label_redis_client, kb_id))
-            unique_labels_list = list(unique_labels)
-            # 初始化一个字典来存储每个标签词的出现次数
-            label_counts = {}
-            # 遍历每个标签词，统计其在查询字符串中的出现次数
-            for label in unique_labels_list:
-                if label in question:
-                    label_counts[label] = question.count(label)
-
-            # 开始调用标签召回
-            label_search_list = []
-            if label_counts:
-                label_search_list = es_utils.search_keyword(user_id, kb_names, label_counts, top_k,
-                                                            metadata_filtering_conditions=metadata_filtering_conditions)
-
-            # 后过滤 status
-            user_post_search_list = []
+            # ========== 标签召回通道结果 ==========
+            label_counts, label_search_list = executor.result((user_id, "label"), default=({}, []))
+            user_search_lists[user_id] = user_search_list
+            user_label_search_lists[user_id] = label_search_list
+            user_label_counts[user_id] = label_counts
+
+            # 后过滤 status，每个知识库的状态查询同样并发发起
             if USE_POST_FILTER:
                 logger.info(f"user_id: {user_id}, kb_names: {kb_names}, question: {question}, 后过滤start")
                 # 向量召回和es召回做启停用后过滤,注意多个kb_names时，需要做区分
@@ -616,7 +646,21 @@ def get_knowledge_based_answer(knowledge_base_info, question, rate, top_k, chunk
                         if i['content_id'] not in content_status_json[i["kb_name"]]:
                             content_status_json[i["kb_name"]].append(i['content_id'])
                 for kb_name in content_status_json:  # 多个kb_names时，需要做区分
-                    useful_content_id_list = milvus_utils.get_milvus_content_status(user_id, kb_name, content_status_json[kb_name])
+                    executor.submit((user_id, "post_filter", kb_name), "post_filter",
+                                    milvus_utils.get_milvus_content_status,
+                                    user_id, kb_name, content_status_json[kb_name])
+                user_content_status[user_id] = content_status_json
+
+        for user_id, kb_names in user_kb_names.items():
+            label_search_list = user_label_search_lists[user_id]
+            label_counts = user_label_counts[user_id]
+            user_search_list = user_search_lists[user_id]
+            user_post_search_list = []
+            if USE_POST_FILTER:
+                content_status_json = user_content_status[user_id]
+                for kb_name in content_status_json:
+                    # 后过滤决定片段是否可用，不做降级，失败时整体报错
+                    useful_content_id_list = executor.result((user_id, "post_filter", kb_name), degrade=False)
                     logger.info(
                         repr(user_id) + repr(kb_name) + repr(content_status_json[kb_name]) + '======== get_milvus_content_status：' + repr(
                             useful_content_id_list))
@@ -641,9 +685,7 @@ def get_knowledge_based_answer(knowledge_base_info, question, rate, top_k, chunk
             # ========= 图谱召回---增强关联片段以及三元组以及社区报告 start =========
             if use_graph:  # 如果使用图检索
                 # ======== 将graph检索的结果 和 两路检索的结果进行融合，并重新再过一遍rerank ========
-                temp_graph_search_list, temp_graph_dat_list = graph_utils.get_graph_search_list(user_id, kb_names, question, top_k,
-                                                                             kb_ids=[], threshold=rate,
-                                                                             filter_file_name_list=filter_file_name_list)
+                temp_graph_search_list, temp_graph_dat_list = executor.result((user_id, "graph"), default=([], []))
                 graph_data_list.extend(temp_graph_dat_list)  # 社区报告等直接放进去先
                 # 根据 duplicate_set 去重，将图谱关联出来的chunk 再加入 vector_text_search_list
                 for item in temp_graph_search_list:
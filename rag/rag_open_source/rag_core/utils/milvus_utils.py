@@ -5,9 +5,11 @@ import uuid
 import os
 import threading
 from threading import Thread
+from concurrent import futures
 
 from logging_config import setup_logging
 from settings import MILVUS_BASE_URL, TIME_OUT
+from utils.constant import MILVUS_ADD_MAX_CONCURRENCY
 
 logger_name = 'rag_milvus_utils'
 app_name = os.getenv("LOG_FILE")
@@ -51,7 +53,6 @@ def generate_chunks_bacth(chunks: list, batch_size=1000):
         aggregated_data[chunk_current_num].append(item)
     # 将聚合后的数据转换为普通字典，以便查看
     aggregated_data = dict(aggregated_data)
-    print(aggregated_data)
     for key, value in aggregated_data.items():
         batch_data.extend(value)
         if len(batch_data) >= batch_size:
@@ -263,80 +264,96 @@ def search_milvus(user_id, kb_names, top_k, question, threshold, search_field, e
 ADD_URL = MILVUS_BASE_URL + '/rag/kn/add'
 ADD_COMMUNItY_REPORT_URL = MILVUS_BASE_URL + '/rag/kn/add_community_reports'
 
-def add_milvus(user_id, kb_name, sub_chunk, add_file_name, add_file_path, kb_id="", milvus_url = ADD_URL):
+def build_milvus_insert_data(user_id, kb_name, kb_id, batch, add_file_name, add_file_path):
+    insert_data = {}
+    insert_data['userId'] = user_id
+    insert_data['kb_name'] = kb_name
+    insert_data['kb_id'] = kb_id
+    chunks_data = []
+    for chunk in batch:
+        chunk_dict = {
+            "content": chunk['content'],
+            "embedding_content": chunk['embedding_content'],
+            "chunk_id": str(uuid.uuid4()),
+            "file_name": add_file_name,
+            "oss_path": add_file_path,
+            "meta_data": chunk['meta_data']
+        }
+
+        if "title" in chunk:
+            chunk_dict["title"] = chunk["title"]
+
+        if "create_time" in chunk:
+            chunk_dict["create_time"] = chunk["create_time"]
+
+        if "is_parent" in chunk:
+            chunk_dict["is_parent"] = chunk["is_parent"]
+
+        if 'labels' in chunk:
+            chunk_dict['labels'] = chunk['labels']
+        chunks_data.append(chunk_dict)
+    insert_data['data'] = chunks_data
+    return insert_data
+
+
+def post_milvus_batch(milvus_url, insert_data, add_file_name, batch_count):
+    """ 写入一个批次，成功返回空字符串，失败返回错误原因 """
+    headers = {"Content-Type": "application/json"}
+    try:
+        response = requests.post(milvus_url, headers=headers, json=insert_data, timeout=TIME_OUT)
+        logger.info(repr(add_file_name) + '批量写入milvus请求结果:' + repr(batch_count) + repr(response.text))
+        if response.status_code != 200:
+            logger.error(repr(add_file_name) + repr(batch_count) + '批量写入milvus请求失败')
+            return str(response.text)
+
+        result_data = json.loads(response.text)
+        if result_data['code'] != 0:
+            logger.error(repr(add_file_name) + repr(batch_count) + '批量写入milvus请求失败')
+            return str(result_data['message'])
+        logger.info(repr(add_file_name) + repr(batch_count) + '批量写入milvus请求成功')
+        return ""
+    except Exception as e:
+        logger.error(repr(add_file_name) + repr(batch_count) + '批量写入milvus请求异常：' + repr(e))
+        return repr(e)
+
+
+def add_milvus(user_id, kb_name, sub_chunk, add_file_name, add_file_path, kb_id="", milvus_url = ADD_URL,
+               max_concurrency=MILVUS_ADD_MAX_CONCURRENCY):
+    """
+    分批写入向量库，最多 max_concurrency 个批次同时在途；批次按需生成，在途批次满时暂停生成。
+    任一批次失败后不再提交新批次，已在途的批次执行完后返回失败
+    """
     batch_size = 200
     response_info = {'code': 0, "message": "成功"}
     batch_count = 0
     success_count = 0
     fail_count = 0
     error_reason = []
-    # sub_chunk 批次生成器,按 按chunk_current_num分组并生成批次数据
-    chunk_gen = generate_chunks_bacth(sub_chunk, batch_size=batch_size)
-    for batch in chunk_gen:
-        insert_data = {}
-        insert_data['userId'] = user_id
-        insert_data['kb_name'] = kb_name
-        insert_data['kb_id'] = kb_id
-        chunks_data = []
-        for chunk in batch:
-            chunk_dict = {
-                "content": chunk['content'],
-                "embedding_content": chunk['embedding_content'],
-                "chunk_id": str(uuid.uuid4()),
-                "file_name": add_file_name,
-                "oss_path": add_file_path,
-                "meta_data": chunk['meta_data']
-            }
-
-            if "title" in chunk:
-                chunk_dict["title"] = chunk["title"]
-
-            if "create_time" in chunk:
-                chunk_dict["create_time"] = chunk["create_time"]
-
-            if "is_parent" in chunk:
-                chunk_dict["is_parent"] = chunk["is_parent"]
-
-            if 'labels' in chunk:
-                chunk_dict['labels'] = chunk['labels']
-            chunks_data.append(chunk_dict)
-        insert_data['data'] = chunks_data
-        headers = {"Content-Type": "application/json"}
-        batch_count = batch_count + 1
-        try:
-            response = requests.post(milvus_url, headers=headers, json=insert_data, timeout=TIME_OUT)
-            logger.info(repr(add_file_name) + '批量写入milvus请求结果:' + repr(batch_count) + repr(response.text))
-            if response.status_code != 200:
-                logger.error(repr(add_file_name) + repr(batch_count) + '批量写入milvus请求失败')
-                fail_count = fail_count + 1
-                if str(response.text) not in error_reason: error_reason.append(str(response.text))
-                # ========= 报错直接返回结束 =======
-                response_info['code'] = 1
-                response_info['message'] = '部分文件添加milvus失败: ' + '/t'.join(error_reason)
-                return response_info
 
-            result_data = json.loads(response.text)
-            if result_data['code'] != 0:
+    def collect(done_futures):
+        nonlocal success_count, fail_count
+        for future in done_futures:
+            error = future.result()
+            if error:
                 fail_count = fail_count + 1
-                if str(result_data['message']) not in error_reason: error_reason.append(str(result_data['message']))
-                logger.error(repr(add_file_name) + repr(batch_count) + '批量写入milvus请求失败')
-                # ========= 报错直接返回结束 =======
-                response_info['code'] = 1
-                response_info['message'] = '部分文件添加milvus失败: ' + '/t'.join(error_reason)
-                return response_info
+                if error not in error_reason: error_reason.append(error)
             else:
                 success_count = success_count + 1
-                logger.info(repr(add_file_name) + repr(batch_count) + '批量写入milvus请求成功')
-
-        except Exception as e:
-            logger.error(repr(add_file_name) + repr(batch_count) + '批量写入milvus请求异常：' + repr(e))
-            fail_count = fail_count + 1
-            if repr(e) not in error_reason: error_reason.append(repr(e))
-            # ========= 报错直接返回结束 =======
-            response_info['code'] = 1
-            response_info['message'] = '部分文件添加milvus失败: ' + '/t'.join(error_reason)
-            return response_info
 
+    # sub_chunk 批次生成器,按 按chunk_current_num分组并生成批次数据
+    chunk_gen = generate_chunks_bacth(sub_chunk, batch_size=batch_size)
+    with futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        pending = set()
+        for batch in chunk_gen:
+            if error_reason:  # ========= 报错后不再提交 =======
+                break
+            batch_count = batch_count + 1
+            insert_data = build_milvus_insert_data(user_id, kb_name, kb_id, batch, add_file_name, add_file_path)
+            pending.add(executor.submit(post_milvus_batch, milvus_url, insert_data, add_file_name, batch_count))
+            if len(pending) >= max_concurrency:
+                done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                collect(done)
+        collect(futures.wait(pending).done)
 
     # print('add_milvus方法调用接口批量建库，总批次:%s次，成功:%s次,失败:%s次' % (batch_count, success_count, fail_count))
     logger.info('add_milvus方法调用接口批量建库')
@@ -136,3 +136,32 @@ def get_file_from_minio(object_name, download_path):
                 time.sleep(3)
         return stat, download_link
 
+
+
+_stat_client = None
+
+
+def _get_stat_client():
+    """每条入库消息都要查询大小，复用同一个 MinIO 客户端(线程安全)"""
+    global _stat_client
+    if _stat_client is None:
+        _stat_client = Minio(
+            MINIO_ADDRESS,
+            access_key=MINIO_ACCESS_KEY,
+            secret_key=MINIO_SECRET_KEY,
+            secure=SECURE
+        )
+    return _stat_client
+
+
+def get_file_size(object_name):
+    """
+    查询对象大小(字节)，仅用于入库调度排序，查询失败或使用 OSS 时返回 0 表示未知
+    """
+    if USE_OSS:
+        return 0
+    try:
+        return _get_stat_client().stat_object(BUCKET_NAME, object_name).size
+    except Exception as err:
+        logger.info(repr(object_name) + ' minio查询文件大小失败：' + repr(err))
+        return 0
@@ -21,7 +21,7 @@ logger_name='rag_ocr_utils'
 app_name = os.getenv("LOG_FILE")
 logger = setup_logging(app_name,logger_name)
 logger.info(logger_name+'---------LOG_FILE：'+repr(app_name))
-from utils.constant import MAX_SENTENCE_SIZE, OCR_MAX_WORKERS
+from utils.constant import MAX_SENTENCE_SIZE, OCR_INFLIGHT_WINDOW
 from model_manager import get_model_configure, OcrModelConfig
 
 hl2txt = html2text.HTML2Text()
@@ -31,7 +31,8 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from collections import defaultdict
+from collections import defaultdict, deque
+import threading
 import fitz
 from pathlib import Path
 
@@ -171,100 +172,150 @@ def ocr_parser_native(add_file_path, ocr_model_id):
 
 
 
-def get_page_data(page_num, add_file_path, ocr_model_id):
+_ocr_session = None
+_ocr_session_lock = threading.Lock()
+
+
+def get_ocr_session():
     """
-    获取单页的数据并调用OCR服务
-    :param page_num: 页码
-    :param add_file_path: 文件路径
-    :return: OCR结果
+    进程内共享的 OCR 请求会话，连接池大小与在途窗口一致，并带失败重试
     """
-    # file_name = os.path.split(add_file_path)[-1]
-    directory = os.path.dirname(add_file_path)
-    path_obj = Path(add_file_path)
+    global _ocr_session
+    if _ocr_session is None:
+        with _ocr_session_lock:
+            if _ocr_session is None:
+                session = requests.Session()
+                retry_strategy = Retry(
+                    total=3,
+                    backoff_factor=1,
+                    status_forcelist=[500, 502, 503, 504],
+                    allowed_methods=["POST"]
+                )
+                adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=OCR_INFLIGHT_WINDOW,
+                                      pool_maxsize=OCR_INFLIGHT_WINDOW)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _ocr_session = session
+    return _ocr_session
+
+
+def get_ocr_endpoint(ocr_model_id):
+    """
+    解析 OCR 模型配置，返回 (请求地址, 请求头)，整篇文档只需解析一次
+    """
+    model_config = get_model_configure(ocr_model_id)
+    wanwu_ocr_url = ""
+    api_key = ""
+    if isinstance(model_config, OcrModelConfig):
+        wanwu_ocr_url = model_config.endpoint_url + "/ocr"
+        api_key = model_config.api_key
+    return wanwu_ocr_url, {"Authorization": f"Bearer {api_key}"}
 
-    file_name = path_obj.stem
-    full_file_name = path_obj.name  # 带扩展名的完整文件名（用于formData的fileName）
 
+def extract_page_pdf(pdf_document, page_num):
+    """
+    在内存中将指定页(从1开始)导出为单页 PDF
+    """
+    new_pdf = fitz.open()  # 新建一个空的PDF文档
     try:
-        # 打开PDF文件
-        pdf_document = fitz.open(add_file_path)
-
-        if page_num > len(pdf_document) or page_num < 1:
-            logger.error(f"Page number {page_num} is out of range.")
-            return None, page_num
-
-        # 创建一个新的PDF文档并将指定页添加到其中
-
-        page_pdf_path = f"{file_name}_page_{page_num}.pdf"
-        # 组合成新的文件路径
-        output_pdf_path = os.path.join(directory, page_pdf_path)
-        logger.info("======>ocr_utils,get_page_data=%s" % output_pdf_path)
-        new_pdf = fitz.open()  # 新建一个空的PDF文档
         new_pdf.insert_pdf(pdf_document, from_page=page_num - 1, to_page=page_num - 1)
-        new_pdf.save(output_pdf_path)
+        return new_pdf.tobytes()
+    finally:
         new_pdf.close()
 
-        # 构造请求参数（符合formData要求）
-        files = {"file": (page_pdf_path, open(output_pdf_path, 'rb').read(), "application/pdf")}
-        data = {"fileName": full_file_name}  # 显式传递原始文件名
 
-        if ocr_model_id == "":
-            logger.error("ocr_model_id为空")
+def post_page_data(page_num, page_bytes, full_file_name, wanwu_ocr_url, headers):
+    """
+    调用OCR服务识别单页
+    :return: (OCR结果, 页码)，失败时OCR结果为None
+    """
+    file_name = Path(full_file_name).stem
+    # 构造请求参数（符合formData要求）
+    files = {"file": (f"{file_name}_page_{page_num}.pdf", page_bytes, "application/pdf")}
+    data = {"fileName": full_file_name}  # 显式传递原始文件名
+    try:
+        r = get_ocr_session().post(wanwu_ocr_url, files=files, headers=headers, data=data, timeout=60)
+        r.raise_for_status()  # 触发HTTP错误状态码的异常
+        ret_json = r.json()
+        # 解析返回结果（符合新的JSON结构）
+        if ret_json.get("code") == 0:
+            page_data = ret_json.get("data", [])
+            # 补充当前页码到返回数据中（若接口返回的page_num不正确）
+            for item in page_data:
+                item["page_num"] = [page_num]  # 确保page_num字段为列表格式
+            return page_data, page_num
+        else:
+            logger.error(f"页 {page_num} OCR失败：{ret_json.get('message', '未知错误')}")
             return None, page_num
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"页 {page_num} HTTP错误：{e}")
+        return None, page_num
+    except requests.exceptions.Timeout:
+        logger.error(f"页 {page_num} 请求超时")
+        return None, page_num
+    except requests.exceptions.RequestException as e:
+        logger.error(f"页 {page_num} 请求异常：{e}")
+        return None, page_num
+    except Exception as e:
+        logger.error(f"处理页 {page_num} 失败：{e}")
+        logger.error(traceback.format_exc())
+        return None, page_num
 
-        model_config = get_model_configure(ocr_model_id)
-        wanwu_ocr_url = ""
-        api_key = ""
-        if isinstance(model_config, OcrModelConfig):
-            wanwu_ocr_url = model_config.endpoint_url + "/ocr"
-            api_key = model_config.api_key
-        headers = {"Authorization": f"Bearer {api_key}"}
-
-        # 使用重试机制
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[500, 502, 503, 504],
-            method_whitelist=["POST"]
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-
-        try:
-            r = session.post(wanwu_ocr_url, files=files, headers=headers, data=data, timeout=60)
-            r.raise_for_status()  # 触发HTTP错误状态码的异常
-            ret_json = r.json()
-            # logger.info("page_num:%s,ocr_result:%s" % (page_num, json.dumps(ret_json, ensure_ascii=False)))
-            # 解析返回结果（符合新的JSON结构）
-            if ret_json.get("code") == 0:
-                page_data = ret_json.get("data", [])
-                # 补充当前页码到返回数据中（若接口返回的page_num不正确）
-                for item in page_data:
-                    item["page_num"] = [page_num]  # 确保page_num字段为列表格式
-                return page_data, page_num
-            else:
-                logger.error(f"页 {page_num} OCR失败：{ret_json.get('message', '未知错误')}")
-                return None, page_num
-        except requests.exceptions.HTTPError as e:
-            logger.error(f"页 {page_num} HTTP错误：{e}")
-            return None, page_num
-        except requests.exceptions.Timeout:
-            logger.error(f"页 {page_num} 请求超时")
-            return None, page_num
-        except requests.exceptions.RequestException as e:
-            logger.error(f"页 {page_num} 请求异常：{e}")
-            return None, page_num
-        finally:
-            # 清理临时文件
-            if os.path.exists(output_pdf_path):
-                os.remove(output_pdf_path)
-            time.sleep(0.1)
 
+def get_page_data(page_num, add_file_path, ocr_model_id):
+    """
+    获取单页的数据并调用OCR服务
+    :param page_num: 页码
+    :param add_file_path: 文件路径
+    :return: OCR结果
+    """
+    if ocr_model_id == "":
+        logger.error("ocr_model_id为空")
+        return None, page_num
+    try:
+        with fitz.open(add_file_path) as pdf_document:
+            if page_num > len(pdf_document) or page_num < 1:
+                logger.error(f"Page number {page_num} is out of range.")
+                return None, page_num
+            page_bytes = extract_page_pdf(pdf_document, page_num)
     except Exception as e:
         logger.error(f"处理页 {page_num} 失败：{e}")
         logger.error(traceback.format_exc())
         return None, page_num
+    wanwu_ocr_url, headers = get_ocr_endpoint(ocr_model_id)
+    return post_page_data(page_num, page_bytes, Path(add_file_path).name, wanwu_ocr_url, headers)
+
+
+def iter_ocr_pages(add_file_path, ocr_model_id, window=OCR_INFLIGHT_WINDOW):
+    """
+    按页并发OCR整个PDF，按页码顺序逐页返回 (OCR结果, 页码)
+    PDF只打开一次，单页PDF在内存中生成；最多 window 页同时在途，前面的页完成即可返回，无需等待整篇
+    """
+    if ocr_model_id == "":
+        logger.error("ocr_model_id为空")
+        return
+    wanwu_ocr_url, headers = get_ocr_endpoint(ocr_model_id)
+    full_file_name = Path(add_file_path).name
+    window = max(1, window)
+    with fitz.open(add_file_path) as pdf_document, ThreadPoolExecutor(max_workers=window) as executor:
+        num_pages = len(pdf_document)
+        logger.info(f"ocr pages start, file: {full_file_name}, pages: {num_pages}, window: {window}")
+        pending = deque()
+        next_page = 1
+        while next_page <= num_pages or pending:
+            # 页面导出在当前线程完成(fitz 文档对象不跨线程共享)，请求交给线程池
+            while next_page <= num_pages and len(pending) < window:
+                try:
+                    page_bytes = extract_page_pdf(pdf_document, next_page)
+                    pending.append(executor.submit(post_page_data, next_page, page_bytes, full_file_name,
+                                                   wanwu_ocr_url, headers))
+                except Exception as e:
+                    logger.error(f"处理页 {next_page} 失败：{e}")
+                    logger.error(traceback.format_exc())
+                next_page += 1
+            if pending:
+                yield pending.popleft().result()
+
 
 def ocr_parser(add_file_path, ocr_model_id):
     """
@@ -277,34 +328,24 @@ def ocr_parser(add_file_path, ocr_model_id):
     sorted_result = []
 
     try:
-        # 使用fitz打开PDF文件并获取总页数
-        pdf_document = fitz.open(add_file_path)
-        num_pages = len(pdf_document)
-        pdf_document.close()  # 提前关闭，避免文件占用
-
-        with ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS) as executor:  # 调整max_workers以适应你的需求
-            futures = {executor.submit(get_page_data, page_num, add_file_path, ocr_model_id): page_num for page_num in
-                       range(1, num_pages + 1)}
-
-            for future in as_completed(futures):
-                page_data, page_num = future.result()
-                if page_data is not None:
-                    for item in page_data:
-                        if item["type"] == 'table':
-                            md_text = hl2txt.handle(item["text"])  # 将html_string转换为markdown
-                            item["text"] = md_text
-                        if item["type"] not in ['page-header', 'page-footer']:
-                            if len(merged_data[page_num]['text'] + item["text"]) < MAX_SENTENCE_SIZE:
-                                merged_data[page_num]["text"] += item["text"]  # 拼接文本
-                                merged_data[page_num]['page_num'].append(page_num)
-                                merged_data[page_num]['length'] = len(merged_data[page_num]['text'])
-                            else:
-                                merged_list.append({
-                                    "type": item["type"],
-                                    "text": item["text"],
-                                    "page_num": [page_num],
-                                    "length": len(item["text"])
-                                })
+        for page_data, page_num in iter_ocr_pages(add_file_path, ocr_model_id):
+            if page_data is not None:
+                for item in page_data:
+                    if item["type"] == 'table':
+                        md_text = hl2txt.handle(item["text"])  # 将html_string转换为markdown
+                        item["text"] = md_text
+                    if item["type"] not in ['page-header', 'page-footer']:
+                        if len(merged_data[page_num]['text'] + item["text"]) < MAX_SENTENCE_SIZE:
+                            merged_data[page_num]["text"] += item["text"]  # 拼接文本
+                            merged_data[page_num]['page_num'].append(page_num)
+                            merged_data[page_num]['length'] = len(merged_data[page_num]['text'])
+                        else:
+                            merged_list.append({
+                                "type": item["type"],
+                                "text": item["text"],
+                                "page_num": [page_num],
+                                "length": len(item["text"])
+                            })
 
         # 将merged_data中的值添加到merged_list
         merged_list.extend(merged_data.values())
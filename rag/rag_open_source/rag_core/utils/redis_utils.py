@@ -1,13 +1,18 @@
 import redis
+import redis.asyncio
 import json
 import os
 import hashlib
+import threading
+import time
 from logging_config import setup_logging
 logger_name='rag_redis_utils'
 app_name = os.getenv("LOG_FILE")
 logger = setup_logging(app_name,logger_name)
 logger.info(logger_name+'---------LOG_FILE：'+repr(app_name))
 from settings import REDIS_ADDRESS, REDIS_PORT, REDIS_PASSWD, REDIS_DB
+from utils.ac_automaton import AhoCorasickAutomaton
+from utils.constant import CHUNK_LABEL_CHECK_INTERVAL, GRAPH_VOCABULARY_CHECK_INTERVAL, QUERY_DICT_CHECK_INTERVAL
 
 
 
@@ -38,6 +43,22 @@ def get_redis_connection(redis_db=REDIS_DB):
         logger.error("====> conn redis error %s" % e)
         logger.error(traceback.format_exc())
 
+def get_async_redis_connection(redis_db=REDIS_DB):
+    """
+    获取异步 Redis 连接，供 async 接口使用，避免阻塞事件循环
+    :return: redis.asyncio 客户端实例
+    """
+    try:
+        pool = redis.asyncio.ConnectionPool(host=REDIS_ADDRESS, port=REDIS_PORT, password=REDIS_PASSWD,
+                                            decode_responses=True, db=int(redis_db))
+        r = redis.asyncio.Redis(connection_pool=pool)
+        logger.info("Created async Redis client successfully!")
+        return r
+    except Exception as e:
+        import traceback
+        logger.error("====> conn async redis error %s" % e)
+        logger.error(traceback.format_exc())
+
 def set_cache(redis_client, key, value):
     """
     设置缓存
@@ -142,6 +163,7 @@ def add_query_dict_entry(redis_client, user_id, term_entry, knowledgebase):
         value = json.dumps(term_entry)  # 将条目转为 JSON 字符串
         # 添加到 Redis 哈希表
         redis_client.hset(redis_key, field, value)
+        _bump_query_dict_version(redis_client, user_id, kb)
         print(f"已添加条目：{term_entry}")
         logger.info(f"已添加条目：{term_entry}")
 
@@ -160,6 +182,7 @@ def delete_query_dict_entry(redis_client, user_id, term_entry_id, knowledgebase)
 
         # 从 Redis 哈希表中删除指定字段
         redis_client.hdel(redis_key, field)
+        _bump_query_dict_version(redis_client, user_id, kb)
         print(f"已删除条目 id: {term_entry_id}")
         logger.info(f"已删除条目 id: {term_entry_id}")
 
@@ -180,33 +203,214 @@ def update_query_dict_entry(redis_client, user_id, term_entry_id, new_term_entry
 
         # 更新 Redis 哈希表中的字段
         redis_client.hset(redis_key, field, value)
+        _bump_query_dict_version(redis_client, user_id, kb)
         print(f"已修改条目 id: {term_entry_id} 为：{new_term_entry}")
         logger.info(f"已修改条目 id: {term_entry_id} 为：{new_term_entry}")
 
-def get_query_dict_cache(redis_client, user_id, knowledgebases):
+# 专名词表 query_dict:{user_id}:{kb_id} 的版本号，随 /rag/proper_noun 的增删改递增，
+# 查询进程按版本号缓存每个知识库编译好的专名改写索引
+QUERY_DICT_VERSION_KEY = "query_dict_version:{user_id}:{kb_id}"
+
+_query_rewrite_indexes = {}  # (user_id, kb_id) -> {"version", "checked_at", "index"}
+_query_rewrite_indexes_lock = threading.Lock()
+
+
+class QueryRewriteIndex:
+    """ 知识库专名词表的改写索引：专名匹配自动机，命中条目按词表顺序返回 """
+
+    def __init__(self, term_dicts=()):
+        self.terms = []  # [(去重 key, 条目)]，顺序与 hgetall 一致
+        self.name_terms = {}  # 专名 -> 条目下标
+        self.always = []  # 空专名与原先的 re.search 一样总是命中
+        for term in term_dicts:
+            idx = len(self.terms)
+            self.terms.append((json.dumps(term, sort_keys=True), term))
+            if term["name"]:
+                self.name_terms.setdefault(term["name"], []).append(idx)
+            else:
+                self.always.append(idx)
+        self.automaton = AhoCorasickAutomaton(self.name_terms)
+
+    @property
+    def size(self):
+        return len(self.terms)
+
+    def match(self, question) -> list:
+        """ 一次扫描找出问题中出现的专名，返回 [(去重 key, 条目)] """
+        matched = list(self.always)
+        for name in self.automaton.find_all(question):
+            matched.extend(self.name_terms[name])
+        return [self.terms[idx] for idx in sorted(matched)]
+
+
+def match_query_dict(indexes, question) -> list:
     """
-    根据 user_id,查询的知识库knowledgebase列表 查询 Redis 中的缓存，将哈希表字段的值解析为 query_dict。
-    :param user_id: 用户ID
-    :return: 完整的 query_dict 数据（列表形式），如果缓存不存在则返回 None。
-    """
-    all_query_dicts = []
-
-    redis_key_list = []
-    for knowledgebase in knowledgebases:
-        redis_key = f"query_dict:{user_id}:{knowledgebase}"
-        redis_key_list.append(redis_key)
-    for redis_key in redis_key_list:
-        # 获取整个哈希表，返回一个字典，字段是 id，值是对应的条目 JSON 字符串
-        term_dict_hash = redis_client.hgetall(redis_key)
-        if term_dict_hash:
-            # 将每个字段的 JSON 字符串转换为 Python 对象（字典）
-            term_dict = [json.loads(value) for value in term_dict_hash.values()]
-            all_query_dicts.extend(term_dict)
-    # 此处请将all_query_dicts相同元素去重
-    # 去重：将所有字典转换为 JSON 字符串，存入集合中，集合自动去重
-    unique_query_dicts = {json.dumps(query_dict, sort_keys=True): query_dict for query_dict in all_query_dicts}
-    # 返回去重后的字典列表
-    return list(unique_query_dicts.values())
+    返回问题命中的专名条目，多个知识库间去重，按知识库顺序及各词表 hgetall 的顺序返回
+    :param indexes: 各知识库的 QueryRewriteIndex
+    """
+    matched = {}
+    for index in indexes:
+        for key, term in index.match(question):
+            matched.setdefault(key, term)
+    return list(matched.values())
+
+
+def _bump_query_dict_version(redis_client, user_id, kb_id):
+    redis_client.incr(QUERY_DICT_VERSION_KEY.format(user_id=user_id, kb_id=kb_id))
+    invalidate_query_rewrite_index(user_id, kb_id)
+
+
+def invalidate_query_rewrite_index(user_id, kb_id):
+    """ 本进程内的专名词表更新后立即丢弃缓存的改写索引 """
+    with _query_rewrite_indexes_lock:
+        _query_rewrite_indexes.pop((user_id, kb_id), None)
+
+
+def _store_query_rewrite_index(user_id, kb_id, now, version, term_dict_hash) -> QueryRewriteIndex:
+    # 记录构建前读到的版本号，构建期间发生的更新会在下次检查时触发重建
+    index = QueryRewriteIndex(json.loads(value) for value in (term_dict_hash or {}).values())
+    with _query_rewrite_indexes_lock:
+        _query_rewrite_indexes[(user_id, kb_id)] = {"version": version, "checked_at": now, "index": index}
+    logger.info(f"Built query rewrite index: {user_id}:{kb_id}, terms: {index.size}")
+    return index
+
+
+def get_query_rewrite_index(redis_client, user_id, kb_id) -> QueryRewriteIndex:
+    """
+    获取知识库的专名改写索引，仅在版本号变化时从 query_dict 哈希表重建；
+    其他进程的更新通过每 QUERY_DICT_CHECK_INTERVAL 秒一次的版本号检查感知
+    """
+    now = time.monotonic()
+    entry = _query_rewrite_indexes.get((user_id, kb_id))
+    if entry and now - entry["checked_at"] < QUERY_DICT_CHECK_INTERVAL:
+        return entry["index"]
+    try:
+        version_key = QUERY_DICT_VERSION_KEY.format(user_id=user_id, kb_id=kb_id)
+        version = redis_client.get(version_key)
+        if version is None:  # 早于版本号引入的词表，初始化后即可按版本号缓存
+            redis_client.set(version_key, 0, nx=True)
+            version = redis_client.get(version_key)
+        if entry and entry["version"] == version:
+            entry["checked_at"] = now
+            return entry["index"]
+        term_dict_hash = redis_client.hgetall(f"query_dict:{user_id}:{kb_id}")
+        return _store_query_rewrite_index(user_id, kb_id, now, version, term_dict_hash)
+    except Exception as e:
+        logger.error(f"Failed to build {user_id}:{kb_id} query rewrite index: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return entry["index"] if entry else QueryRewriteIndex()
+
+
+async def aget_query_rewrite_index(async_redis_client, user_id, kb_id) -> QueryRewriteIndex:
+    """
+    get_query_rewrite_index 的异步版本，使用 redis.asyncio 客户端
+    """
+    now = time.monotonic()
+    entry = _query_rewrite_indexes.get((user_id, kb_id))
+    if entry and now - entry["checked_at"] < QUERY_DICT_CHECK_INTERVAL:
+        return entry["index"]
+    try:
+        version_key = QUERY_DICT_VERSION_KEY.format(user_id=user_id, kb_id=kb_id)
+        version = await async_redis_client.get(version_key)
+        if version is None:  # 早于版本号引入的词表，初始化后即可按版本号缓存
+            await async_redis_client.set(version_key, 0, nx=True)
+            version = await async_redis_client.get(version_key)
+        if entry and entry["version"] == version:
+            entry["checked_at"] = now
+            return entry["index"]
+        term_dict_hash = await async_redis_client.hgetall(f"query_dict:{user_id}:{kb_id}")
+        return _store_query_rewrite_index(user_id, kb_id, now, version, term_dict_hash)
+    except Exception as e:
+        logger.error(f"Failed to build {user_id}:{kb_id} query rewrite index: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return entry["index"] if entry else QueryRewriteIndex()
+
+
+def get_query_rewrite_indexes(redis_client, user_id, knowledgebases) -> list:
+    """ 返回各知识库非空的专名改写索引，均为空表示未维护专名词表 """
+    indexes = [get_query_rewrite_index(redis_client, user_id, kb_id) for kb_id in knowledgebases]
+    return [index for index in indexes if index.size]
+
+
+async def aget_query_rewrite_indexes(async_redis_client, user_id, knowledgebases) -> list:
+    """ get_query_rewrite_indexes 的异步版本 """
+    indexes = [await aget_query_rewrite_index(async_redis_client, user_id, kb_id) for kb_id in knowledgebases]
+    return [index for index in indexes if index.size]
+
+
+# 每个知识库维护一个标签索引 hash(标签 -> 引用该标签的 chunk 数)和一个版本号，
+# 查询时无需 SCAN 全部 chunk key，本进程内按版本号缓存标签匹配自动机
+CHUNK_LABEL_INDEX_KEY = "chunk_label_index:{kb_id}"
+CHUNK_LABEL_VERSION_KEY = "chunk_label_version:{kb_id}"
+
+# 原子地替换一个 chunk 的标签并维护索引引用计数，ARGV[1] 为空串时表示删除该 chunk
+_REPLACE_CHUNK_LABELS_LUA = """
+local old = redis.call('GET', KEYS[1])
+if old then
+    local old_labels = cjson.decode(old)['labels'] or {}
+    for _, label in ipairs(old_labels) do
+        if redis.call('HINCRBY', KEYS[2], label, -1) <= 0 then
+            redis.call('HDEL', KEYS[2], label)
+        end
+    end
+end
+if ARGV[1] == '' then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], ARGV[1])
+    for _, label in ipairs(cjson.decode(ARGV[1])['labels']) do
+        redis.call('HINCRBY', KEYS[2], label, 1)
+    end
+end
+return redis.call('INCR', KEYS[3])
+"""
+
+_chunk_label_matchers = {}  # kb_id -> {"version", "checked_at", "matcher"}
+_chunk_label_matchers_lock = threading.Lock()
+
+
+def _scan_chunk_label_keys(redis_client, prefix):
+    cursor = "0"
+    while cursor != 0:
+        cursor, keys = redis_client.scan(cursor=cursor, match=f"{prefix}*", count=1000)
+        yield from keys
+
+
+def _ensure_chunk_label_index(redis_client, kb_id):
+    """
+    旧数据没有标签索引时，扫描一次该知识库的全部 chunk key 重建索引
+    """
+    version_key = CHUNK_LABEL_VERSION_KEY.format(kb_id=kb_id)
+    if redis_client.exists(version_key):
+        return
+    label_counts = {}
+    for key in _scan_chunk_label_keys(redis_client, kb_id):
+        value = redis_client.get(key)
+        if value:
+            for label in json.loads(value).get("labels", []):
+                label_counts[label] = label_counts.get(label, 0) + 1
+    index_key = CHUNK_LABEL_INDEX_KEY.format(kb_id=kb_id)
+    pipe = redis_client.pipeline()
+    pipe.delete(index_key)
+    if label_counts:
+        pipe.hset(index_key, mapping=label_counts)
+    pipe.incr(version_key)
+    pipe.execute()
+    logger.info(f"Rebuilt chunk label index: {kb_id}, labels: {len(label_counts)}")
+
+
+def _replace_chunk_labels(redis_client, kb_id, keys, value=""):
+    _ensure_chunk_label_index(redis_client, kb_id)
+    script = redis_client.register_script(_REPLACE_CHUNK_LABELS_LUA)
+    index_key = CHUNK_LABEL_INDEX_KEY.format(kb_id=kb_id)
+    version_key = CHUNK_LABEL_VERSION_KEY.format(kb_id=kb_id)
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        script(keys=[key, index_key, version_key], args=[value], client=pipe)
+    pipe.execute()
+    invalidate_chunk_label_matcher(kb_id)
 
 
 def update_chunk_labels(redis_client, kb_id, file_name, chunk_id, labels):
@@ -219,15 +423,13 @@ def update_chunk_labels(redis_client, kb_id, file_name, chunk_id, labels):
     :param labels: 标签列表，类型为list
     """
     try:
-        # 获取Redis连接
-        # redis_client = get_redis_connection(redis_db=5)  # 使用固定DB 5
         # 构造key
         hash_file_name = hashlib.md5(file_name.encode('utf-8')).hexdigest()  # 规避特殊字符
         key = f"{kb_id}{hash_file_name}{chunk_id}"
         # 将标签列表转换为JSON字符串存储
         value = json.dumps({"labels": labels})
-        # 更新或新增记录
-        redis_client.set(key, value)
+        # 更新或新增记录，同时维护知识库标签索引
+        _replace_chunk_labels(redis_client, kb_id, [key], value)
         logger.info(f"Updated chunk labels successfully: {key}")
     except Exception as e:
         logger.error(f"Failed to update chunk labels: {e}")
@@ -243,20 +445,19 @@ def delete_chunk_labels(redis_client, kb_id, file_name=""):
         :param file_name: 文件名，如果指定了文件名，则删除该文件名对应的缓存
     """
     try:
-        # # 获取Redis连接
-        # redis_client = get_redis_connection(redis_db=5)  # 使用固定DB 5
-        # 使用scan命令查找所有匹配的key
-        if file_name:  # 如果指定了文件名，则使用文件名生成前缀
+        if file_name:  # 如果指定了文件名，则使用文件名生成前缀，并逐个扣减标签索引
             hash_file_name = hashlib.md5(file_name.encode('utf-8')).hexdigest()  # 规避特殊字符
             prefix = f"{kb_id}{hash_file_name}"
-        else:
-            prefix = f"{kb_id}"
-        cursor = "0"
-        while cursor != 0:
-            cursor, keys = redis_client.scan(cursor=cursor, match=f"{prefix}*")
+            keys = list(_scan_chunk_label_keys(redis_client, prefix))
             if keys:
-                # 删除找到的所有key
-                redis_client.delete(*keys)
+                _replace_chunk_labels(redis_client, kb_id, keys)
+        else:  # 删除整个知识库，标签索引一并删除
+            prefix = f"{kb_id}"
+            for key in _scan_chunk_label_keys(redis_client, prefix):
+                redis_client.delete(key)
+            redis_client.delete(CHUNK_LABEL_INDEX_KEY.format(kb_id=kb_id))
+            redis_client.incr(CHUNK_LABEL_VERSION_KEY.format(kb_id=kb_id))
+            invalidate_chunk_label_matcher(kb_id)
         logger.info(f"Deleted prefix chunk labels successfully: {prefix}")
     except Exception as e:
         logger.error(f"Failed to delete prefix chunk labels: {e}")
@@ -272,24 +473,8 @@ def get_all_chunk_labels(redis_client, kb_id):
     :return: 去重后的标签列表
     """
     try:
-        # # 获取Redis连接
-        # redis_client = get_redis_connection(redis_db=5)  # 使用固定DB 5
-        # 初始化一个集合用于去重
-        unique_labels = set()
-        # 使用scan命令查找所有匹配的key
-        cursor = "0"
-        while cursor != 0:
-            cursor, keys = redis_client.scan(cursor=cursor, match=f"{kb_id}*")
-            for key in keys:
-                # 获取key对应的value
-                value = redis_client.get(key)
-                if value:
-                    # 解析JSON格式的value
-                    chunk_data = json.loads(value)
-                    # 将labels添加到集合中去重
-                    unique_labels.update(chunk_data.get("labels", []))
-        # 将集合转换为列表并返回
-        return list(unique_labels)
+        _ensure_chunk_label_index(redis_client, kb_id)
+        return list(redis_client.hkeys(CHUNK_LABEL_INDEX_KEY.format(kb_id=kb_id)))
     except Exception as e:
         logger.error(f"Failed to get {kb_id} all chunk labels: {e}")
         import traceback
@@ -297,6 +482,123 @@ def get_all_chunk_labels(redis_client, kb_id):
         return []
 
 
+def invalidate_chunk_label_matcher(kb_id):
+    """ 本进程内的标签更新后立即丢弃缓存的匹配器 """
+    with _chunk_label_matchers_lock:
+        _chunk_label_matchers.pop(kb_id, None)
+
+
+def get_chunk_label_matcher(redis_client, kb_id) -> AhoCorasickAutomaton:
+    """
+    获取知识库的标签匹配自动机，仅在版本号变化时重建；
+    其他进程的更新通过每 CHUNK_LABEL_CHECK_INTERVAL 秒一次的版本号检查感知
+    """
+    now = time.monotonic()
+    entry = _chunk_label_matchers.get(kb_id)
+    if entry and now - entry["checked_at"] < CHUNK_LABEL_CHECK_INTERVAL:
+        return entry["matcher"]
+    try:
+        version = redis_client.get(CHUNK_LABEL_VERSION_KEY.format(kb_id=kb_id))
+        if entry and version is not None and entry["version"] == version:
+            entry["checked_at"] = now
+            return entry["matcher"]
+        # 记录构建前读到的版本号，构建期间发生的更新会在下次检查时触发重建
+        matcher = AhoCorasickAutomaton(get_all_chunk_labels(redis_client, kb_id))
+        with _chunk_label_matchers_lock:
+            _chunk_label_matchers[kb_id] = {"version": version, "checked_at": now, "matcher": matcher}
+        logger.info(f"Built chunk label matcher: {kb_id}, labels: {matcher.size}")
+        return matcher
+    except Exception as e:
+        logger.error(f"Failed to build {kb_id} chunk label matcher: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return entry["matcher"] if entry else AhoCorasickAutomaton()
+
+
+def match_chunk_labels(redis_client, kb_ids, question):
+    """
+    统计问题中出现的各知识库 chunk 标签及其出现次数
+    :return: {标签: 在问题中的出现次数}
+    """
+    matched_labels = set()
+    for kb_id in kb_ids:
+        matched_labels.update(get_chunk_label_matcher(redis_client, kb_id).find_all(question))
+    return {label: question.count(label) for label in matched_labels}
+
+
+# 图谱实体词表的元素格式为 "{实体名}|||schema_type:{类型}"，版本号随词表更新递增，
+# 查询进程按版本号缓存实体名匹配自动机
+GRAPH_VOCABULARY_VERSION_KEY = "graph_vocabulary_version:{kb_id}"
+GRAPH_VOCABULARY_SEP = "|||schema_type:"
+
+_graph_vocabulary_matchers = {}  # kb_id -> {"version", "checked_at", "matcher"}
+_graph_vocabulary_matchers_lock = threading.Lock()
+
+
+class GraphVocabularyMatcher:
+    """ 知识库图谱实体名的匹配自动机，附带每个实体名的 schema_type """
+
+    def __init__(self, vocabulary=()):
+        self.schema_types = {}  # 实体名 -> [schema_type]
+        for v in vocabulary:
+            name, _, schema_type = v.partition(GRAPH_VOCABULARY_SEP)
+            self.schema_types.setdefault(name, []).append(schema_type)
+        self.automaton = AhoCorasickAutomaton(self.schema_types)
+
+    @property
+    def size(self):
+        return self.automaton.size
+
+    def match(self, question) -> dict:
+        """
+        返回问题中出现的实体名及其 schema_type，按在问题中首次出现的位置排序
+        :return: {实体名: [schema_type]}
+        """
+        if not self.size or not question:
+            return {}
+        first_pos = {}
+        for end, name in self.automaton.iter_matches(question):
+            first_pos.setdefault(name, end - len(name) + 1)
+        return {name: self.schema_types[name] for name in sorted(first_pos, key=lambda n: (first_pos[n], -len(n)))}
+
+
+def invalidate_graph_vocabulary_matcher(kb_id):
+    """ 本进程内的词表更新后立即丢弃缓存的匹配器 """
+    with _graph_vocabulary_matchers_lock:
+        _graph_vocabulary_matchers.pop(kb_id, None)
+
+
+def get_graph_vocabulary_matcher(redis_client, kb_id) -> GraphVocabularyMatcher:
+    """
+    获取知识库的图谱实体匹配器，仅在版本号变化时重建；
+    其他进程(图谱入库)的更新通过每 GRAPH_VOCABULARY_CHECK_INTERVAL 秒一次的版本号检查感知
+    """
+    now = time.monotonic()
+    entry = _graph_vocabulary_matchers.get(kb_id)
+    if entry and now - entry["checked_at"] < GRAPH_VOCABULARY_CHECK_INTERVAL:
+        return entry["matcher"]
+    try:
+        version_key = GRAPH_VOCABULARY_VERSION_KEY.format(kb_id=kb_id)
+        version = redis_client.get(version_key)
+        if version is None:  # 早于版本号引入的词表，初始化后即可按版本号缓存
+            redis_client.set(version_key, 0, nx=True)
+            version = redis_client.get(version_key)
+        if entry and entry["version"] == version:
+            entry["checked_at"] = now
+            return entry["matcher"]
+        # 记录构建前读到的版本号，构建期间发生的更新会在下次检查时触发重建
+        matcher = GraphVocabularyMatcher(query_graph_vocabulary_set(redis_client, kb_id) or ())
+        with _graph_vocabulary_matchers_lock:
+            _graph_vocabulary_matchers[kb_id] = {"version": version, "checked_at": now, "matcher": matcher}
+        logger.info(f"Built graph vocabulary matcher: {kb_id}, entities: {matcher.size}")
+        return matcher
+    except Exception as e:
+        logger.error(f"Failed to build {kb_id} graph vocabulary matcher: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return entry["matcher"] if entry else GraphVocabularyMatcher()
+
+
 def delete_graph_vocabulary_set(redis_client, kb_id):
     """
     如果键不存在则跳过，存在则删除 Redis 中的 graph_vocabulary 集合
@@ -312,6 +614,8 @@ def delete_graph_vocabulary_set(redis_client, kb_id):
         else:
             # 如果键存在，删除旧的集合
             redis_client.delete(graph_key)
+        redis_client.incr(GRAPH_VOCABULARY_VERSION_KEY.format(kb_id=kb_id))
+        invalidate_graph_vocabulary_matcher(kb_id)
     except Exception as e:
         logger.error(f"Failed to delete {kb_id} graph vocabulary set: {e}")
         import traceback
@@ -329,10 +633,16 @@ def update_graph_vocabulary_set(redis_client, kb_id, elements_to_add=None, eleme
     try:
         # 构造键名
         graph_key = f"graph_vocabulary_{kb_id}"
+        if not elements_to_add and not elements_to_remove:
+            return
+        pipe = redis_client.pipeline()
         if elements_to_add:
-            redis_client.sadd(graph_key, *elements_to_add)  # 添加元素
+            pipe.sadd(graph_key, *elements_to_add)  # 添加元素
         if elements_to_remove:
-            redis_client.srem(graph_key, *elements_to_remove)  # 删除元素
+            pipe.srem(graph_key, *elements_to_remove)  # 删除元素
+        pipe.incr(GRAPH_VOCABULARY_VERSION_KEY.format(kb_id=kb_id))
+        pipe.execute()
+        invalidate_graph_vocabulary_matcher(kb_id)
     except Exception as e:
         logger.error(f"Failed to update {kb_id} graph vocabulary set: {e}")
         import traceback
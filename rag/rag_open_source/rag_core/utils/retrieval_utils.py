@@ -0,0 +1,60 @@
+import os
+import time
+from concurrent import futures
+
+from logging_config import setup_logging
+from utils.constant import RETRIEVAL_MAX_WORKERS, RETRIEVAL_CHANNEL_TIMEOUT
+
+logger_name = 'rag_retrieval_utils'
+app_name = os.getenv("LOG_FILE")
+logger = setup_logging(app_name, logger_name)
+logger.info(logger_name + '---------LOG_FILE：' + repr(app_name))
+
+# 进程内共享的检索线程池，所有请求的各路召回通道都在这里并发执行
+_retrieval_pool = futures.ThreadPoolExecutor(max_workers=RETRIEVAL_MAX_WORKERS,
+                                             thread_name_prefix="rag_retrieval")
+
+
+class RetrievalExecutor:
+    """
+    检索通道并发执行器：一次请求内所有用户、所有召回通道同时发起，
+    每个通道有独立的截止时间，超时或异常的通道降级为默认结果，不影响其余通道。
+    """
+
+    def __init__(self, channel_timeout=None):
+        self.channel_timeout = channel_timeout or RETRIEVAL_CHANNEL_TIMEOUT
+        self._tasks = {}
+
+    def submit(self, key, channel, fn, *args, **kwargs):
+        """
+        提交一个通道任务
+        :param key: 任务标识，同一执行器内唯一，例如 (user_id, "milvus")
+        :param channel: 通道名，用于取截止时间，见 RETRIEVAL_CHANNEL_TIMEOUT
+        """
+        deadline = time.monotonic() + self.channel_timeout.get(channel, 60)
+        future = _retrieval_pool.submit(fn, *args, **kwargs)
+        self._tasks[key] = (channel, future, deadline)
+        return future
+
+    def result(self, key, default=None, degrade=True):
+        """
+        获取通道结果，等待不超过该通道剩余的截止时间
+        :param default: 通道未提交、超时或异常时返回的降级结果
+        :param degrade: False 时超时或异常直接抛出，用于不可降级的通道(如状态后过滤)
+        """
+        if key not in self._tasks:
+            return default
+        channel, future, deadline = self._tasks[key]
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except futures.TimeoutError:
+            future.cancel()
+            logger.warning(f"retrieval channel timeout, key: {key}, channel: {channel}")
+            if not degrade:
+                raise RuntimeError(f"retrieval channel {channel} timeout: {key}")
+            return default
+        except Exception as e:
+            logger.error(f"retrieval channel failed, key: {key}, channel: {channel}, error: {repr(e)}")
+            if not degrade:
+                raise
+            return default
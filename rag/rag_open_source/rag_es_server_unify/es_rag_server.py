@@ -9,14 +9,16 @@ from datetime import datetime
 from flask import Flask, request, Response
 
 from settings import EMBEDDING_BATCH_SIZE
-from settings import INDEX_NAME_PREFIX, SNIPPET_INDEX_NAME_PREFIX, KBNAME_MAPPING_INDEX
+from settings import INDEX_NAME_PREFIX, SNIPPET_INDEX_NAME_PREFIX, KBNAME_MAPPING_INDEX, META_FILTER_PUSHDOWN
 import utils.es_util as es_ops
 import utils.meta_util as meta_ops
 import utils.kb_info as kb_info_ops
 import utils.qa_util as qa_ops
 import utils.mapping_util as es_mapping
 from utils import emb_util
-from utils.util import get_qa_index_name
+from utils.emb_cache import emb_cache
+from model.model_manager import invalidate_model_configure
+from utils.util import get_qa_index_name, normalize_to_01
 
 app = Flask(__name__)
 
@@ -144,9 +146,10 @@ def add_vector_data():
         # ========= 将 embedding_content 编码好向量 =============
         content_vector_exist = False
         mapping_properties = {}
-        for batch_doc in batch_list(doc_list, batch_size=EMBEDDING_BATCH_SIZE):
-            res = emb_util.get_embs([x["embedding_content"] for x in batch_doc], embedding_model_id=embedding_model_id)
-            dense_vector_dim = len(res["result"][0]["dense_vec"]) if res["result"] else 1024
+        res = emb_util.get_embs_concurrent([x["embedding_content"] for x in doc_list], embedding_model_id=embedding_model_id)
+        for batch_doc, batch_res in zip(batch_list(doc_list, batch_size=EMBEDDING_BATCH_SIZE),
+                                        batch_list(res["result"], batch_size=EMBEDDING_BATCH_SIZE)):
+            dense_vector_dim = len(batch_res[0]["dense_vec"]) if batch_res else 1024
             field_name = f"q_{dense_vector_dim}_content_vector"
             if dense_vector_dim == 1024:
                 # 兼容老索引，避免创建两个1024 dim的向量字段
@@ -157,9 +160,7 @@ def add_vector_data():
                     field_name = "content_vector"
 
             for i, x in enumerate(batch_doc):
-                if len(batch_doc) != len(res["result"]):
-                    raise RuntimeError(f"Error getting embeddings:{batch_doc}")
-                x[field_name] = res["result"][i]["dense_vec"]
+                x[field_name] = batch_res[i]["dense_vec"]
         # ========= 将 embedding_content 编码好向量 =============
         es_result = es_ops.bulk_add_index_data(index_name, kb_id, doc_list)  # 注意 存储的时候传入 kb_id
         logger.info(f"{es_result}")
@@ -433,7 +434,11 @@ def es_knn_search():
                 emb_id2kb_names[embedding_model_id] = []
             emb_id2kb_names[embedding_model_id].append(kb_id)
         meta_filter_file_name_list = []
-        if final_conditions:
+        meta_filter_query = None
+        if final_conditions and META_FILTER_PUSHDOWN:
+            # 分段索引中已冗余 doc_meta，过滤条件直接作为检索的前置过滤
+            meta_filter_query = meta_ops.build_doc_meta_query(final_conditions)
+        elif final_conditions:
             meta_filter_file_name_list = meta_ops.search_with_doc_meta_filter(content_index_name, final_conditions)
             logger.info(f"用户请求的query为:{query}, filter_file_name_list: {filter_file_name_list}, meta_filter_file_name_list: {meta_filter_file_name_list}")
             if len(meta_filter_file_name_list) == 0:
@@ -459,7 +464,8 @@ def es_knn_search():
             logger.info(f"用户:{index_name},请求查询的kb_names为:{kb_names},embedding_model_id:{embedding_model_id}")
             result_dict = es_ops.search_data_knn_recall(index_name, kb_names, query, top_k, min_score,
                                                         filter_file_name_list=filter_file_name_list,
-                                                        embedding_model_id=embedding_model_id)
+                                                        embedding_model_id=embedding_model_id,
+                                                        meta_filter_query=meta_filter_query)
             search_list.extend(result_dict["search_list"])
             scores.extend(result_dict["scores"])
 
@@ -1112,6 +1118,57 @@ def update_uk_kb_name():
         return jsonarr
 
 
+
+@app.route('/rag/kn/emb_cache/stats', methods=['POST'])
+def emb_cache_stats():
+    """ 查询 embedding 缓存命中情况接口 """
+    logger.info("--------------------------查询 embedding 缓存命中情况接口---------------------------\n")
+    try:
+        result = {'code': 0, 'message': 'success', 'data': emb_cache.get_stats()}
+    except Exception as e:
+        logger.info(f"查询 embedding 缓存命中情况接口发生错误：{e}")
+        result = {"code": 1, "message": str(e)}
+    jsonarr = json.dumps(result, ensure_ascii=False)
+    logger.info(f"查询 embedding 缓存命中情况接口返回结果为：{jsonarr}")
+    return jsonarr
+
+
+@app.route('/rag/kn/emb_cache/invalidate', methods=['POST'])
+def emb_cache_invalidate():
+    """ 按 embedding 模型失效缓存接口，模型更换或升级后调用 """
+    logger.info("--------------------------失效 embedding 缓存接口---------------------------\n")
+    data = request.get_json()
+    embedding_model_id = data.get("embedding_model_id")
+    try:
+        if not embedding_model_id:
+            raise ValueError("embedding_model_id is required")
+        emb_cache.invalidate_model(embedding_model_id)
+        result = {'code': 0, 'message': 'success'}
+    except Exception as e:
+        logger.info(f"失效 embedding 缓存接口发生错误：{e}")
+        result = {"code": 1, "message": str(e)}
+    jsonarr = json.dumps(result, ensure_ascii=False)
+    logger.info(f"embedding_model_id:{embedding_model_id},失效 embedding 缓存接口返回结果为：{jsonarr}")
+    return jsonarr
+
+
+@app.route('/api/v1/rag/es/model_config/invalidate', methods=['POST'])
+def model_config_invalidate():
+    """ 失效模型配置缓存接口，模型配置修改后调用，不传 model_id 则失效全部模型 """
+    logger.info("--------------------------失效模型配置缓存接口---------------------------\n")
+    data = request.get_json(silent=True) or {}
+    model_id = data.get("model_id")
+    try:
+        invalidate_model_configure(model_id)
+        result = {'code': 0, 'message': 'success'}
+    except Exception as e:
+        logger.info(f"失效模型配置缓存接口发生错误：{e}")
+        result = {"code": 1, "message": str(e)}
+    jsonarr = json.dumps(result, ensure_ascii=False)
+    logger.info(f"model_id:{model_id},失效模型配置缓存接口返回结果为：{jsonarr}")
+    return jsonarr
+
+
 # ***************** 老的 ES snippet API servers **********************
 
 @app.route('/api/v1/rag/es/bulk_add', methods=['POST'])
@@ -1284,7 +1341,10 @@ def snippet_search():
                 final_conditions.append(deepcopy(condition))
 
         meta_filter_file_name_list = []
-        if final_conditions:
+        meta_filter_query = None
+        if final_conditions and META_FILTER_PUSHDOWN:
+            meta_filter_query = meta_ops.build_doc_meta_query(final_conditions)
+        elif final_conditions:
             meta_filter_file_name_list = meta_ops.search_with_doc_meta_filter(content_index_name, final_conditions)
             logger.info(f"用户请求的query为:{query}, filter_file_name_list: {filter_file_name_list}, meta_filter_file_name_list: {meta_filter_file_name_list}")
             if len(meta_filter_file_name_list) == 0:
@@ -1300,7 +1360,8 @@ def snippet_search():
             filter_file_name_list = filter_file_name_list + meta_filter_file_name_list
 
         result = es_ops.search_data_text_recall(index_name, kb_id, query, top_k, min_score, search_by,
-                                                filter_file_name_list=filter_file_name_list)
+                                                filter_file_name_list=filter_file_name_list,
+                                                meta_filter_query=meta_filter_query)
         search_list = result["search_list"]
         for item in search_list:  # 将 kb_id 转换为 kb_name
             item["kb_name"] = kb_id_2_kb_name[item["kb_name"]]
@@ -1341,7 +1402,10 @@ def keyword_search():
                 final_conditions.append(deepcopy(condition))
 
         meta_filter_file_name_list = []
-        if final_conditions:
+        meta_filter_query = None
+        if final_conditions and META_FILTER_PUSHDOWN:
+            meta_filter_query = meta_ops.build_doc_meta_query(final_conditions)
+        elif final_conditions:
             meta_filter_file_name_list = meta_ops.search_with_doc_meta_filter(content_index_name, final_conditions)
             logger.info(
                 f"filter_file_name_list: {filter_file_name_list}, meta_filter_file_name_list: {meta_filter_file_name_list}")
@@ -1358,7 +1422,8 @@ def keyword_search():
             filter_file_name_list = filter_file_name_list + meta_filter_file_name_list
 
         result = es_ops.search_data_keyword_recall(content_index_name, kb_id, keywords, top_k, min_score, search_by,
-                                                   filter_file_name_list=filter_file_name_list)
+                                                   filter_file_name_list=filter_file_name_list,
+                                                   meta_filter_query=meta_filter_query)
         search_list = result["search_list"]
         for item in search_list:  # 将 kb_id 转换为 kb_name
             item["kb_name"] = display_kb_name
@@ -1373,6 +1438,105 @@ def keyword_search():
         logger.info("request: /api/v1/rag/es/keyword_search end")
 
 
+def build_multi_search_item(data, user_id, kb_name):
+    """
+    为单个 (user_id, kb_name) 构建检索，与 snippet_search / keyword_search 的单知识库逻辑一致
+    :return: (index_name, search_body)，元数据过滤后没有文件时返回 None
+    """
+    search_type = data.get("search_type", "text")
+    top_k = int(data.get('top_k', 10))
+    min_score = float(data.get('min_score', 0.0))
+    filter_file_name_list = data.get("filter_file_name_list", [])
+    metadata_filtering_conditions = data.get("metadata_filtering_conditions", [])
+    if search_type == "keyword":
+        index_name = INDEX_NAME_PREFIX + user_id
+        content_index_name = 'content_control_' + index_name
+        search_by = data.get('search_by', "labels")
+    else:
+        index_name = SNIPPET_INDEX_NAME_PREFIX + user_id.replace('-', '_')
+        content_index_name = 'content_control_' + INDEX_NAME_PREFIX + user_id.replace('-', '_')
+        search_by = data.get('search_by', "snippet")
+
+    kb_id = kb_info_ops.get_uk_kb_id(user_id, kb_name)
+    final_conditions = []
+    for condition in metadata_filtering_conditions:
+        if condition["filtering_kb_name"] == kb_name:
+            condition = deepcopy(condition)
+            condition["filtering_kb_name"] = kb_id
+            final_conditions.append(condition)
+
+    meta_filter_query = None
+    if final_conditions and META_FILTER_PUSHDOWN:
+        meta_filter_query = meta_ops.build_doc_meta_query(final_conditions)
+    elif final_conditions:
+        meta_filter_file_name_list = meta_ops.search_with_doc_meta_filter(content_index_name, final_conditions)
+        logger.info(f"user_id: {user_id}, kb_name: {kb_name}, meta_filter_file_name_list: {meta_filter_file_name_list}")
+        if len(meta_filter_file_name_list) == 0:
+            return None
+        filter_file_name_list = filter_file_name_list + meta_filter_file_name_list
+
+    if search_type == "keyword":
+        # 标签只存储在 content_control 索引中，与 keyword_search 一致
+        search_body = es_ops.build_keyword_recall_body(kb_id, data.get('keywords'), top_k, min_score, search_by,
+                                                       filter_file_name_list, meta_filter_query)
+        return content_index_name, search_body
+    search_body = es_ops.build_text_recall_body(kb_id, data.get('query'), top_k, min_score, search_by,
+                                                filter_file_name_list, meta_filter_query)
+    return index_name, search_body
+
+
+@app.route('/api/v1/rag/es/multi_search', methods=['POST'])
+def multi_search():
+    """
+    多知识库全文/标签检索：所有 (user_id, kb_name) 的检索合并为一次 _msearch 请求，
+    search_items 为 [{"user_id": "", "kb_name": ""}]，也可以传 user_id + kb_names；
+    search_type 为 text(同 /api/v1/rag/es/search) 或 keyword(同 /api/v1/rag/es/keyword_search)，
+    返回结果按请求的知识库顺序拼接
+    """
+    logger.info("request: /api/v1/rag/es/multi_search")
+    data = request.get_json()
+    logger.info('multi_search request_params: ' + json.dumps(data, indent=4, ensure_ascii=False))
+    search_items = data.get("search_items")
+    if not search_items:
+        search_items = [{"user_id": data.get("user_id"), "kb_name": kb_name} for kb_name in data.get("kb_names", [])]
+    try:
+        searches = []
+        searched_items = []
+        for item in search_items:
+            try:
+                search = build_multi_search_item(data, item["user_id"], item["kb_name"])
+            except Exception as e:
+                # 单个知识库出错不影响其他知识库的检索
+                logger.error(f"multi_search, user_id: {item['user_id']}, kb_name: {item['kb_name']}, error: {e}")
+                continue
+            if search is not None:
+                searches.append(search)
+                searched_items.append(item)
+
+        search_list = []
+        scores = []
+        for item, result in zip(searched_items, es_ops.msearch_recall(searches)):
+            if result is None:
+                continue
+            for hit in result["search_list"]:  # 将 kb_id 转换为 kb_name
+                hit["kb_name"] = item["kb_name"]
+            search_list.extend(result["search_list"])
+            scores.extend(result["scores"])
+        result = {
+            "search_list": search_list,
+            "scores": scores
+        }
+        response = json.dumps({'code': 200, 'msg': 'Success', 'result': result}, indent=4, ensure_ascii=False)
+        logger.info("multi_search response: %s", response)
+        return Response(response, mimetype='application/json', status=200)
+    except Exception as e:
+        response = json.dumps({'code': 400, 'msg': str(e), 'result': None}, ensure_ascii=False)
+        logger.info("multi_search response: %s", response)
+        return Response(response, mimetype='application/json', status=400)
+    finally:
+        logger.info("request: /api/v1/rag/es/multi_search end")
+
+
 @app.route('/api/v1/rag/es/rescore', methods=['POST'])
 def snippet_rescore():
     logger.info("request: /api/v1/rag/es/rescore")
@@ -1386,15 +1550,6 @@ def snippet_rescore():
 
     logger.info(f"query: {query}, weights: {weights}, search_list_infos:{search_list_infos}")
     try:
-        def normalize_to_01(scores):
-            if len(scores) == 1:
-                return [1.0]  # 单个分数归一化为1
-            min_score = min(scores)
-            max_score = max(scores)
-            if min_score == max_score:
-                return [1.0 for _ in scores]  # 所有分数相同，统一设为1
-            return [(score - min_score) / (max_score - min_score) for score in scores]
-
         search_list = []
         bm25_scores = []
         cosine_scores = []
@@ -1412,14 +1567,22 @@ def snippet_rescore():
                 kb_id_2_kb_name[kb_id] = kb_name
             result = es_ops.rescore_bm25_score(index_name, query, search_by, temp_search_list)
             temp_search_list = result["search_list"]
+            # 向量得分直接使用向量索引中已存储的分段向量，只需对 query 编码(召回阶段已编码，命中 embedding 缓存)
+            query_vector = emb_util.get_embs([query], embedding_model_id=embedding_model_id)["result"][0]["dense_vec"]
+            content_vectors = es_ops.get_content_vectors(INDEX_NAME_PREFIX + user_id,
+                                                         [item["content_id"] for item in temp_search_list],
+                                                         len(query_vector)) if temp_search_list else {}
+            cosine_scores.extend(emb_util.rescore_cosine(query_vector,
+                                                         [content_vectors.get(item["content_id"], [])
+                                                          for item in temp_search_list],
+                                                         [item["snippet"] for item in temp_search_list],
+                                                         embedding_model_id))
             for item in temp_search_list:
                 item["kb_name"] = kb_id_2_kb_name[item["kb_name"]]
                 item["user_id"] = user_id
 
             search_list.extend(temp_search_list)
-            bm25_scores = result["scores"]
-            contents = [item["snippet"] for item in search_list]
-            cosine_scores.extend(emb_util.calculate_cosine(query, contents, embedding_model_id))
+            bm25_scores.extend(result["scores"])
             logger.info(f"rescore bm25_scores: {bm25_scores}, cosine_scores: {cosine_scores}")
 
         bm25_normalized = normalize_to_01(bm25_scores)
@@ -1582,15 +1745,9 @@ def add_community_reports_data():
             doc["status"] = True  # 初始化启停状态
 
         # ========= 将 embedding_content 编码好向量 =============
-        for batch_doc in batch_list(doc_list, batch_size=EMBEDDING_BATCH_SIZE):
-            res = emb_util.get_embs([x["embedding_content"] for x in batch_doc], embedding_model_id=embedding_model_id)
-            dense_vector_dim = len(res["result"][0]["dense_vec"]) if res["result"] else 1024
-            field_name = f"q_{dense_vector_dim}_content_vector"
-
-            for i, x in enumerate(batch_doc):
-                if len(batch_doc) != len(res["result"]):
-                    raise RuntimeError(f"Error getting embeddings:{batch_doc}")
-                x[field_name] = res["result"][i]["dense_vec"]
+        res = emb_util.get_embs_concurrent([x["embedding_content"] for x in doc_list], embedding_model_id=embedding_model_id)
+        for x, emb in zip(doc_list, res["result"]):
+            x[f"q_{len(emb['dense_vec'])}_content_vector"] = emb["dense_vec"]
         es_result = es_ops.bulk_add_index_data(report_index_name, kb_id, doc_list)  # 注意 存储的时候传入 kb_id
         if not es_result["success"]:
             logger.info(f"当前用户:{user_id},知识库:{kb_name},add_community_report失败：{es_result}")
@@ -1861,15 +2018,9 @@ def add_qa_data():
         logger.info(f"用户:{user_id},问答库:{qa_base_name},qa_base_id:{qa_base_id}")
 
         # ========= 将 embedding_content 编码好向量 =============
-        for batch_doc in batch_list(qa_list, batch_size=EMBEDDING_BATCH_SIZE):
-            res = emb_util.get_embs([x["question"] for x in batch_doc], embedding_model_id=embedding_model_id)
-            dense_vector_dim = len(res["result"][0]["dense_vec"]) if res["result"] else 1024
-            field_name = f"q_{dense_vector_dim}_content_vector"
-
-            for i, x in enumerate(batch_doc):
-                if len(batch_doc) != len(res["result"]):
-                    raise RuntimeError(f"Error getting embeddings:{batch_doc}")
-                x[field_name] = res["result"][i]["dense_vec"]
+        res = emb_util.get_embs_concurrent([x["question"] for x in qa_list], embedding_model_id=embedding_model_id)
+        for x, emb in zip(qa_list, res["result"]):
+            x[f"q_{len(emb['dense_vec'])}_content_vector"] = emb["dense_vec"]
         # ========= 将 embedding_content 编码好向量 =============
         es_result = qa_ops.bulk_add_index_data(qa_index_name, qa_base_name, qa_list)
         if not es_result["success"]:
@@ -2085,23 +2236,17 @@ def qa_rescore():
             temp_search_list = search_list_info["search_list"]
             embedding_model_id = kb_info_ops.get_uk_kb_emb_model_id(user_id, qa_base_names[0])
 
-            result = qa_ops.qa_rescore_bm25_score(qa_index_name, query, temp_search_list)
+            # 问题向量与问答对存在同一文档中，随 bm25 重算一并取回，只需对 query 编码
+            query_vector = emb_util.get_embs([query], embedding_model_id=embedding_model_id)["result"][0]["dense_vec"]
+            result = qa_ops.qa_rescore_bm25_score(qa_index_name, query, temp_search_list,
+                                                  vector_field=f"q_{len(query_vector)}_content_vector")
             temp_search_list = result["search_list"]
             search_list.extend(temp_search_list)
             bm25_scores.extend(result["scores"])
             contents = [item["question"] for item in temp_search_list]
-            cosine_scores.extend(emb_util.calculate_cosine(query, contents, embedding_model_id))
+            cosine_scores.extend(emb_util.rescore_cosine(query_vector, result["vectors"], contents, embedding_model_id))
             logger.info(f"rescore bm25_scores: {bm25_scores}, cosine_scores: {cosine_scores}")
 
-        def normalize_to_01(scores):
-            if len(scores) == 1:
-                return [1.0]  # 单个分数归一化为1
-            min_score = min(scores)
-            max_score = max(scores)
-            if min_score == max_score:
-                return [1.0 for _ in scores]  # 所有分数相同，统一设为1
-            return [(score - min_score) / (max_score - min_score) for score in scores]
-
         bm25_normalized = normalize_to_01(bm25_scores)
         cosine_normalized = normalize_to_01(cosine_scores)
 
@@ -2271,5 +2416,72 @@ def text_search():
         logger.info(f"当前用户:{user_id},问答库:{base_names},query:{query},全文检索的接口返回结果为：{jsonarr}")
         return jsonarr
 
+@app.route('/api/v1/rag/es/hybrid_search', methods=['POST'])
+def hybrid_search():
+    """ 多用户、多问答库混合检索，向量检索与全文检索在一次请求中完成，所有用户的结果统一融合排序 """
+    logger.info("--------------------------启动问答库混合检索---------------------------\n")
+    data = request.get_json()
+    user_base_names = data.get("user_base_names")  # {userId: [问答库名称]}
+    if user_base_names is None:
+        user_base_names = {data.get("userId"): data.get("base_names")}
+    top_k = data.get("topk", 10)
+    query = data.get("question")
+    min_score = data.get("threshold", 0)
+    metadata_filtering_conditions = data.get("metadata_filtering_conditions", [])
+    weights = data.get("weights")  # 为空时按 RRF 融合
+    logger.info(f"请求查询的user_base_names为:{user_base_names}, query: {query}, topK: {top_k}, "
+                f"threshold: {min_score}, weights: {weights}, "
+                f"metadata_filtering_conditions: {metadata_filtering_conditions}")
+    try:
+        filtering_conditions = {}
+        for condition in metadata_filtering_conditions:
+            base_name = condition["filtering_qa_base_name"]
+            filtering_conditions[base_name] = condition
+
+        index2emb_bases = {}
+        index2meta_filters = {}
+        for user_id, all_base_names in user_base_names.items():
+            qa_index_name = get_qa_index_name(user_id)
+            exists_base_names = kb_info_ops.get_uk_qa_name_list(user_id)  # 从映射表中获取
+            emb_id2base_names = index2emb_bases.setdefault(qa_index_name, {})
+            final_conditions = index2meta_filters.setdefault(qa_index_name, [])
+            for base_name in all_base_names:
+                if base_name not in exists_base_names:
+                    raise RuntimeError(f"用户:{user_id}, {base_name}问答库不存在")
+
+                if base_name in filtering_conditions:
+                    condition = filtering_conditions[base_name]
+                    final_conditions.append(deepcopy(condition))
+
+                embedding_model_id = kb_info_ops.get_uk_kb_emb_model_id(user_id, base_name)
+                if embedding_model_id not in emb_id2base_names:
+                    emb_id2base_names[embedding_model_id] = []
+                emb_id2base_names[embedding_model_id].append(base_name)
+
+        result_dict = qa_ops.hybrid_search(index2emb_bases, query, top_k, min_score,
+                                           index2meta_filters=index2meta_filters, weights=weights)
+
+        result = {
+            "code": 0,
+            "message": "success",
+            "data": {
+                "search_list": result_dict["search_list"],
+                "scores": result_dict["scores"]
+            }
+        }
+        jsonarr = json.dumps(result, ensure_ascii=False)
+        logger.info(f"问答库:{user_base_names},query:{query},混合检索的接口返回结果为：{jsonarr}")
+        return jsonarr
+
+    except Exception as e:
+        logger.info(f"查询问答库时发生错误：{e}")
+        result = {
+            "code": 1,
+            "message": str(e)
+        }
+        jsonarr = json.dumps(result, ensure_ascii=False)
+        logger.info(f"问答库:{user_base_names},query:{query},混合检索的接口返回结果为：{jsonarr}")
+        return jsonarr
+
 if __name__ == '__main__':
     app.run()  # debug=True
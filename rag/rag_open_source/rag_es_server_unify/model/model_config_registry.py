@@ -0,0 +1,95 @@
+"""
+进程内模型配置缓存，供 model_manager 使用。
+
+模型配置修改后调用失效接口递增 redis 中的版本号，各进程最多每 MODEL_CONFIG_CHECK_INTERVAL 秒校验一次版本，
+版本变化即丢弃本地缓存；未调用失效接口时配置变更最迟在 MODEL_CONFIG_CACHE_TTL 后生效。
+"""
+import threading
+import time
+
+from settings import MODEL_CONFIG_CACHE_TTL, MODEL_CONFIG_MAX_STALE, MODEL_CONFIG_CHECK_INTERVAL
+from log.logger import logger
+
+_UNSET = object()
+
+
+class ModelConfigRegistry:
+    """
+    进程内模型配置缓存：
+    - 按 ttl 过期，过期后由单个线程回源刷新(single-flight)，其余线程直接使用旧值
+    - 回源失败时在 max_stale 内继续使用旧值(stale-while-revalidate)
+    - 传入 version_loader 时每 check_interval 秒校验一次全局版本，版本变化则清空缓存
+    """
+
+    def __init__(self, loader, ttl: float = MODEL_CONFIG_CACHE_TTL, max_stale: float = MODEL_CONFIG_MAX_STALE,
+                 version_loader=None, check_interval: float = MODEL_CONFIG_CHECK_INTERVAL):
+        self._loader = loader
+        self._ttl = ttl
+        self._max_stale = max_stale
+        self._version_loader = version_loader
+        self._check_interval = check_interval
+        self._entries = {}  # model_id -> (model_config, fetched_at)
+        self._locks = {}
+        self._guard = threading.Lock()
+        self._version = _UNSET
+        self._checked_at = 0.0
+
+    def _key_lock(self, model_id: str) -> threading.Lock:
+        with self._guard:
+            lock = self._locks.get(model_id)
+            if lock is None:
+                lock = self._locks[model_id] = threading.Lock()
+            return lock
+
+    def _check_version(self):
+        if self._version_loader is None:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self._check_interval:
+            return
+        self._checked_at = now
+        try:
+            version = self._version_loader()
+        except Exception as e:
+            logger.warning(f"模型配置版本校验失败, error: {repr(e)}")
+            return
+        if version != self._version:
+            if self._version is not _UNSET:
+                logger.info(f"模型配置版本变化: {self._version} -> {version}, 清空本地缓存")
+                self.invalidate()
+            self._version = version
+
+    def get(self, model_id: str):
+        self._check_version()
+        entry = self._entries.get(model_id)
+        if entry and time.monotonic() - entry[1] < self._ttl:
+            return entry[0]
+
+        lock = self._key_lock(model_id)
+        if entry and not lock.acquire(blocking=False):
+            # 已有线程在刷新，直接返回旧值
+            return entry[0]
+        if not entry:
+            lock.acquire()
+        try:
+            entry = self._entries.get(model_id)
+            if entry and time.monotonic() - entry[1] < self._ttl:
+                return entry[0]
+            try:
+                model_config = self._loader(model_id)
+            except Exception as e:
+                if entry and time.monotonic() - entry[1] < self._ttl + self._max_stale:
+                    logger.warning(f"模型参数刷新失败，使用缓存旧值, model_id: {model_id}, error: {repr(e)}")
+                    return entry[0]
+                raise
+            self._entries[model_id] = (model_config, time.monotonic())
+            return model_config
+        finally:
+            lock.release()
+
+    def invalidate(self, model_id: str = None):
+        with self._guard:
+            if model_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(model_id, None)
@@ -1,8 +1,11 @@
+import redis
 import requests
 
 from enum import Enum
 from settings import MODEL_PROVIDER_URL
+from settings import REDIS_ADDRESS, REDIS_PORT, REDIS_PASSWD, EMB_CACHE_REDIS_DB
 from log.logger import logger
+from model.model_config_registry import ModelConfigRegistry
 
 
 class ModelType(Enum):
@@ -147,9 +150,9 @@ class RerankModelConfig(ModelConfigure):
             model_args=rerank_cfg
         )
 
-def get_model_configure(model_id: str) -> ModelConfigure:
+def _fetch_model_configure(model_id: str) -> ModelConfigure:
     """
-    Get model configuration by model id.
+    Fetch model configuration from the model provider by model id.
     """
 
     header = {
@@ -177,3 +180,33 @@ def get_model_configure(model_id: str) -> ModelConfigure:
     except Exception as e:
         logger.error("模型参数请求异常：" + repr(e))
         raise RuntimeError(f"Failed to get model configuration: {e}")
+
+
+# 模型配置全局版本号，调用 invalidate_model_configure 时递增，所有 worker 据此清空本地缓存
+MODEL_CONFIG_VERSION_KEY = "model_config_version"
+redis_client = redis.Redis(connection_pool=redis.ConnectionPool(host=REDIS_ADDRESS, port=REDIS_PORT,
+                                                                password=REDIS_PASSWD, db=int(EMB_CACHE_REDIS_DB)))
+
+
+def _get_model_config_version():
+    return redis_client.get(MODEL_CONFIG_VERSION_KEY)
+
+
+_model_config_registry = ModelConfigRegistry(_fetch_model_configure, version_loader=_get_model_config_version)
+
+
+def get_model_configure(model_id: str) -> ModelConfigure:
+    """
+    Get model configuration by model id, served from the process-wide cache.
+    """
+    return _model_config_registry.get(model_id)
+
+
+def invalidate_model_configure(model_id: str = None):
+    """
+    Drop cached configuration of model_id, or of all models when model_id is None.
+    Other workers drop their caches within MODEL_CONFIG_CHECK_INTERVAL seconds.
+    """
+    _model_config_registry.invalidate(model_id)
+    redis_client.incr(MODEL_CONFIG_VERSION_KEY)
+    logger.info(f"模型配置缓存已失效, model_id: {model_id}")
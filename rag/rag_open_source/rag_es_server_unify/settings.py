@@ -7,13 +7,15 @@ config = Config('./config/config.ini')
 INDEX_NAME_PREFIX = config.get('DEFAULT', 'INDEX_NAME_PREFIX')  # 测试环境索引前缀
 SNIPPET_INDEX_NAME_PREFIX = config.get('DEFAULT', 'SNIPPET_INDEX_NAME_PREFIX')  # 老的ES snippet 测试环境索引前缀
 KBNAME_MAPPING_INDEX = config.get('DEFAULT', 'KBNAME_MAPPING_INDEX')  # userid 的所有 kb_name映射表
+KBNAME_MAPPING_VERSION_INDEX = KBNAME_MAPPING_INDEX + "_version"  # 每个 userid 映射表的版本号，用于多进程缓存一致
 
 #日志名称
 APP_NAME = config.get('DEFAULT', 'APP_NAME')  # 应用名称
 LOGGER_NAME = config.get('DEFAULT', 'LOGGER_NAME')  # 日志器名称
 
 # embedding
-EMBEDDING_BATCH_SIZE = os.getenv("EMBEDDING_BATCH_SIZE", 10)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 10))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))  # 同时在途的 embedding 批次数
 
 # ES
 ES_HOSTS = [os.getenv("ES_HOSTS")]
@@ -27,9 +29,12 @@ if ES_HOSTS is None or ES_USER is None or ES_PASSWORD is None:
 if ES_VERIFY_CERTS is None:
     ES_VERIFY_CERTS = config.getboolean('ES', 'Verify_certs')
 DELETE_BACTH_SIZE = config.getint('ES', 'DELETE_BACTH_SIZE')
+META_FILTER_PUSHDOWN = config.getboolean('ES', 'META_FILTER_PUSHDOWN')  # 元数据过滤条件直接下推到分段/snippet 索引查询
 GET_KB_ID_URL = os.getenv("GET_KB_ID_URL")
 if GET_KB_ID_URL is None:
     GET_KB_ID_URL = config.get('ES', 'GET_KB_ID_URL')
+KB_REGISTRY_CHECK_INTERVAL = float(os.getenv("KB_REGISTRY_CHECK_INTERVAL", 1))  # 知识库映射缓存版本校验间隔(秒)
+QA_HYBRID_RRF_K = int(os.getenv("QA_HYBRID_RRF_K", 60))  # 问答库混合检索 RRF 融合的平滑常数 k
 
 #model
 MODEL_PROVIDER_URL = os.getenv("MODEL_PROVIDER_URL")
@@ -37,4 +42,21 @@ MODEL_PROVIDER_ACCESS_TOKEN = ""
 if MODEL_PROVIDER_URL is None:
     MODEL_PROVIDER_URL = config.getstr('MODEL_PROVIDER', 'MODEL_PROVIDER_URL')
     MODEL_PROVIDER_ACCESS_TOKEN = config.getstr('MODEL_PROVIDER', 'MODEL_PROVIDER_ACCESS_TOKEN')
+MODEL_CONFIG_CACHE_TTL = float(os.getenv("MODEL_CONFIG_CACHE_TTL", 300))  # 模型配置缓存有效期(秒)
+MODEL_CONFIG_MAX_STALE = float(os.getenv("MODEL_CONFIG_MAX_STALE", 3600))  # 回源失败时允许继续使用旧值的时长(秒)
+MODEL_CONFIG_CHECK_INTERVAL = float(os.getenv("MODEL_CONFIG_CHECK_INTERVAL", 1))  # 模型配置版本校验间隔(秒)
 
+
+# embedding cache
+USE_EMB_CACHE = config.getboolean('REDIS', 'USE_EMB_CACHE')  # 是否启用 redis 二级缓存
+EMB_CACHE_LOCAL_SIZE = config.getint('REDIS', 'EMB_CACHE_LOCAL_SIZE')  # 本地 LRU 缓存条数
+EMB_CACHE_REDIS_TTL = config.getint('REDIS', 'EMB_CACHE_REDIS_TTL')  # redis 缓存过期时间(秒)
+EMB_CACHE_REDIS_DB = config.getint('REDIS', 'EMB_CACHE_REDIS_DB')
+EMB_CACHE_VERSION_CHECK_INTERVAL = float(os.getenv("EMB_CACHE_VERSION_CHECK_INTERVAL", 1))  # 模型缓存版本校验间隔(秒)
+REDIS_ADDRESS = os.getenv("REDIS_HOST")
+REDIS_PORT = os.getenv("REDIS_PORT")
+REDIS_PASSWD = os.getenv("REDIS_PASSWD")
+if REDIS_ADDRESS is None or REDIS_PORT is None or REDIS_PASSWD is None:
+    REDIS_ADDRESS = config.getstr('REDIS', 'REDIS_HOST')
+    REDIS_PORT = config.getstr('REDIS', 'REDIS_PORT')
+    REDIS_PASSWD = config.getstr('REDIS', 'REDIS_PASSWD')
@@ -0,0 +1,154 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from settings import USE_EMB_CACHE, EMB_CACHE_LOCAL_SIZE, EMB_CACHE_REDIS_TTL, EMB_CACHE_REDIS_DB
+from settings import EMB_CACHE_VERSION_CHECK_INTERVAL
+from settings import REDIS_ADDRESS, REDIS_PORT, REDIS_PASSWD
+from log.logger import logger
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class LocalLRU:
+    """线程安全的本地 LRU 缓存，key 为 (embedding_model_id, model_version, text_hash)"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def invalidate_model(self, embedding_model_id: str):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == embedding_model_id]:
+                del self._data[key]
+
+
+class EmbeddingCache:
+    """
+    内容寻址的 embedding 缓存：本地 LRU 为一级缓存，可选的 redis 为二级缓存(多进程/多实例共享)。
+    redis 与本地的 key 都带有模型版本号，按模型失效只需递增版本号；
+    各 worker 最多每 EMB_CACHE_VERSION_CHECK_INTERVAL 秒从 redis 校验一次版本，版本变化后旧的本地向量不再命中。
+    """
+
+    def __init__(self, local_size: int = EMB_CACHE_LOCAL_SIZE, use_redis: bool = USE_EMB_CACHE):
+        self.local = LocalLRU(local_size)
+        self.redis_client = self._connect_redis() if use_redis else None
+        self._stats_lock = threading.Lock()
+        self.stats = {"local_hit": 0, "redis_hit": 0, "miss": 0}
+        self._versions = {}  # embedding_model_id -> (version, checked_at)
+
+    @staticmethod
+    def _connect_redis():
+        try:
+            import redis
+            pool = redis.ConnectionPool(host=REDIS_ADDRESS, port=REDIS_PORT, password=REDIS_PASSWD,
+                                        db=int(EMB_CACHE_REDIS_DB))
+            logger.info("embedding cache connected to redis")
+            return redis.Redis(connection_pool=pool)
+        except Exception as e:
+            logger.error(f"embedding cache redis unavailable, use local cache only: {e}")
+            return None
+
+    def _count(self, name: str, n: int):
+        if n:
+            with self._stats_lock:
+                self.stats[name] += n
+
+    def _model_version(self, embedding_model_id: str) -> str:
+        if self.redis_client is None:
+            return "0"
+        entry = self._versions.get(embedding_model_id)
+        now = time.monotonic()
+        if entry and now - entry[1] < EMB_CACHE_VERSION_CHECK_INTERVAL:
+            return entry[0]
+        try:
+            version = (self.redis_client.get(f"emb_ver:{embedding_model_id}") or b"0").decode()
+        except Exception as e:
+            logger.warning(f"embedding cache version check failed: {e}")
+            version = entry[0] if entry else "0"
+        self._versions[embedding_model_id] = (version, now)
+        return version
+
+    @staticmethod
+    def _redis_keys(embedding_model_id: str, version: str, hashes: list) -> list:
+        return [f"emb:{embedding_model_id}:{version}:{h}" for h in hashes]
+
+    def get_many(self, embedding_model_id: str, texts: list) -> list:
+        """返回与 texts 等长的向量列表，未命中位置为 None"""
+        hashes = [text_hash(t) for t in texts]
+        version = self._model_version(embedding_model_id)
+        vectors = [self.local.get((embedding_model_id, version, h)) for h in hashes]
+        local_hit = sum(v is not None for v in vectors)
+        self._count("local_hit", local_hit)
+
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing and self.redis_client is not None:
+            try:
+                keys = self._redis_keys(embedding_model_id, version, [hashes[i] for i in missing])
+                for i, raw in zip(missing, self.redis_client.mget(keys)):
+                    if raw is not None:
+                        vectors[i] = np.frombuffer(raw, dtype=np.float32).tolist()
+                        self.local.put((embedding_model_id, version, hashes[i]), vectors[i])
+                        self._count("redis_hit", 1)
+            except Exception as e:
+                logger.warning(f"embedding cache redis get failed: {e}")
+        self._count("miss", sum(v is None for v in vectors))
+        return vectors
+
+    def put_many(self, embedding_model_id: str, texts: list, vectors: list):
+        hashes = [text_hash(t) for t in texts]
+        version = self._model_version(embedding_model_id)
+        for h, vec in zip(hashes, vectors):
+            self.local.put((embedding_model_id, version, h), vec)
+        if self.redis_client is not None and hashes:
+            try:
+                keys = self._redis_keys(embedding_model_id, version, hashes)
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key, vec in zip(keys, vectors):
+                    pipe.set(key, np.asarray(vec, dtype=np.float32).tobytes(), ex=EMB_CACHE_REDIS_TTL)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"embedding cache redis put failed: {e}")
+
+    def invalidate_model(self, embedding_model_id: str):
+        """失效某个模型的全部缓存向量"""
+        self.local.invalidate_model(embedding_model_id)
+        if self.redis_client is not None:
+            version = self.redis_client.incr(f"emb_ver:{embedding_model_id}")
+            self._versions[embedding_model_id] = (str(version), time.monotonic())
+        logger.info(f"embedding cache invalidated, model: {embedding_model_id}")
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        total = stats["local_hit"] + stats["redis_hit"] + stats["miss"]
+        stats["hit_rate"] = round((total - stats["miss"]) / total, 4) if total else 0.0
+        stats["local_size"] = len(self.local)
+        stats["use_redis"] = self.redis_client is not None
+        return stats
+
+
+emb_cache = EmbeddingCache()
@@ -1,48 +1,110 @@
 import json
 import time
+import threading
+from concurrent import futures
+
+import httpx
 import numpy as np
 
 from openai import OpenAI
 from model.model_manager import get_model_configure
+from settings import EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY
+from utils.emb_cache import emb_cache
 
 from log.logger import logger
 
-def get_embs(texts: list, embedding_model_id=""):
-    """ 先使用 openai embedding协议获取 文本向量"""
-    emb_info = get_model_configure(embedding_model_id)
-    logger.info(f"Starting embedding request for {len(texts)} texts, model: {emb_info.model_name}")
+# 退避间隔
+RATE_LIMIT_BACKOFF = [10, 20, 40, 60]  # 限流退避
+OTHER_ERROR_MAX_RETRIES = 2  # 其他错误最多重试2次
+OTHER_ERROR_WAIT = 0.5  # 每次0.5s
+
+
+class RateLimitGate:
+    """
+    同一 embedding 服务共享的 429 退避闸门：任一线程遇到限流后，所有线程在闸门打开前都等待，
+    而不是各自独立 sleep 后再次同时打满服务
+    """
+
+    def __init__(self, backoff=RATE_LIMIT_BACKOFF):
+        self._backoff = backoff
+        self._lock = threading.Lock()
+        self._open_at = 0.0
+        self._level = 0
+
+    def wait(self):
+        delay = self._open_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_rate_limited(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._open_at:  # 其他线程尚未触发本轮退避
+                wait_time = self._backoff[min(self._level, len(self._backoff) - 1)]
+                self._level += 1
+                self._open_at = now + wait_time
+            return self._open_at - now
+
+    def on_success(self):
+        if self._level:
+            with self._lock:
+                self._level = 0
 
+
+class EmbeddingClient:
+    """长连接的 embedding 客户端，按 (endpoint, api_key) 复用连接池与退避闸门"""
+
+    def __init__(self, endpoint_url: str, api_key: str):
+        self.endpoint_url = endpoint_url
+        self.gate = RateLimitGate()
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=endpoint_url,
+            max_retries=0,  # 重试由 gate 统一控制
+            http_client=httpx.Client(limits=httpx.Limits(max_connections=EMBEDDING_MAX_CONCURRENCY * 4,
+                                                         max_keepalive_connections=EMBEDDING_MAX_CONCURRENCY * 2,
+                                                         keepalive_expiry=60)),
+        )
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_embedding_client(endpoint_url: str, api_key: str) -> EmbeddingClient:
+    key = (endpoint_url, api_key)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = EmbeddingClient(endpoint_url, api_key)
+                logger.info(f"Created embedding client for {endpoint_url}")
+    return client
+
+
+def _embed_batch(texts: list, embedding_model_id=""):
+    """
+    请求一批文本的向量
+    :return: ({"result": [{"dense_vec": [...]}, ...]}, 本批是否遇到过限流)
+    """
+    emb_info = get_model_configure(embedding_model_id)
     api_key = emb_info.api_key or "fake api key"
+    emb_client = get_embedding_client(emb_info.endpoint_url, api_key)
     # 安全记录API Key（仅显示部分）
     masked_key = api_key[:4] + "****" + api_key[-4:] if len(api_key) > 8 else "****"
+    logger.info(f"Sending embedding request: url: {emb_info.endpoint_url}, model: {emb_info.model_name}, "
+                f"api_key: {masked_key}, text_count: {len(texts)}")
 
-    client = OpenAI(
-        api_key=api_key,
-        base_url=emb_info.endpoint_url,
-    )
-
-    # 安全的请求日志
-    request_details = {
-        "url": emb_info.endpoint_url,
-        "model": emb_info.model_name,
-        "api_key": masked_key,  # 使用脱敏后的key
-        "text_count": len(texts),
-        "input": texts
-    }
-    logger.info(f"Sending embedding request: {json.dumps(request_details, ensure_ascii=False)}")
-
-    # 退避间隔
-    rate_limit_backoff = [10, 20, 40, 60]  # 限流退避
-    other_error_max_retries = 2  # 其他错误最多重试2次
-    other_error_wait = 0.5  # 每次0.5s
-
+    rate_limited = False
     attempt = 0
     last_error = None
-    while attempt < max(len(rate_limit_backoff), other_error_max_retries) + 1:
+    while attempt < max(len(RATE_LIMIT_BACKOFF), OTHER_ERROR_MAX_RETRIES) + 1:
+        emb_client.gate.wait()
         try:
             # 记录请求开始时间
             start_time = time.time()
-            completion = client.embeddings.create(
+            completion = emb_client.client.embeddings.create(
                 model=emb_info.model_name,
                 input=texts,
                 encoding_format="float"
@@ -50,34 +112,24 @@ def get_embs(texts: list, embedding_model_id=""):
 
             response_json = json.loads(completion.model_dump_json())
             dense_vec_data = response_json["data"]
-
-            # 计算响应时间
-            latency = time.time() - start_time
-            logger.info(f"Received response in {latency:.2f}s")
+            emb_client.gate.on_success()
 
             # 安全的响应日志（只记录元数据）
             response_metadata = {
                 "object": response_json.get("object"),
                 "model": response_json.get("model"),
                 "usage": response_json.get("usage"),
-                "data_count": len(dense_vec_data)
+                "data_count": len(dense_vec_data),
+                "latency": round(time.time() - start_time, 3)
             }
             logger.info(f"Response metadata: {json.dumps(response_metadata)}")
 
-            # 调试日志：记录前3个向量的维度
-            if dense_vec_data:
-                sample_info = [
-                    {"index": i, "vec_len": len(item["embedding"])}
-                    for i, item in enumerate(dense_vec_data[:3])
-                ]
-                logger.debug(f"Sample vector dimensions: {sample_info}")
-
             # 构建结果
             result_list = [
                 {"dense_vec": emb_vec["embedding"]}
                 for emb_vec in dense_vec_data
             ]
-            return {"result": result_list}
+            return {"result": result_list}, rate_limited
 
         except Exception as e:
             # 增强错误日志
@@ -98,19 +150,19 @@ def get_embs(texts: list, embedding_model_id=""):
             # 判断是否限流
             is_rate_limited = error_details and "429" in error_details
             if is_rate_limited:
-                if attempt < len(rate_limit_backoff):
-                    wait_time = rate_limit_backoff[attempt]
-                    logger.warning(f"Rate limited (429). Retrying after {wait_time}s...")
-                    time.sleep(wait_time)
+                rate_limited = True
+                if attempt < len(RATE_LIMIT_BACKOFF):
+                    wait_time = emb_client.gate.on_rate_limited()
+                    logger.warning(f"Rate limited (429). Retrying after {wait_time:.1f}s...")
                     attempt += 1
                     continue
                 else:
                     logger.error("Exceeded max retries due to rate limiting.")
                     break
             else:
-                if attempt < other_error_max_retries:
-                    logger.warning(f"Non-429 error. Retrying after {other_error_wait}s...")
-                    time.sleep(other_error_wait)
+                if attempt < OTHER_ERROR_MAX_RETRIES:
+                    logger.warning(f"Non-429 error. Retrying after {OTHER_ERROR_WAIT}s...")
+                    time.sleep(OTHER_ERROR_WAIT)
                     attempt += 1
                     continue
                 else:
@@ -121,24 +173,108 @@ def get_embs(texts: list, embedding_model_id=""):
     raise RuntimeError(f"Failed to get embeddings after retries. Model config: {emb_info}, last error: {last_error}")
 
 
-def calculate_cosine(query, contents, embedding_model_id="") -> list[float]:
-    query_vector_scores = []
-    query_vector = get_embs([query], embedding_model_id=embedding_model_id)["result"][0]["dense_vec"]
-    contents_vector = get_embs(contents, embedding_model_id=embedding_model_id)["result"]
-    for item in contents_vector:
-        vec1 = np.array(query_vector)
-        vec2 = np.array(item["dense_vec"])
+def _get_embs_with_cache(texts: list, embedding_model_id: str, embed_func):
+    """先查 embedding 缓存，只对未命中的文本调用 embed_func，并回填缓存"""
+    vectors = emb_cache.get_many(embedding_model_id, texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        # 同一请求中的重复文本只编码一次
+        missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+        res = embed_func(missing_texts)
+        if len(res["result"]) != len(missing_texts):
+            raise RuntimeError(f"Error getting embeddings: expect {len(missing_texts)}, got {len(res['result'])}")
+        new_vectors = [item["dense_vec"] for item in res["result"]]
+        emb_cache.put_many(embedding_model_id, missing_texts, new_vectors)
+        text_vectors = dict(zip(missing_texts, new_vectors))
+        for i in missing:
+            vectors[i] = text_vectors[texts[i]]
+    logger.info(f"embedding cache, model id: {embedding_model_id}, texts: {len(texts)}, miss: {len(missing)}")
+    return {"result": [{"dense_vec": v} for v in vectors]}
 
-        # calculate dot product
-        dot_product = np.dot(vec1, vec2)
 
-        # calculate norm
-        norm_vec1 = np.linalg.norm(vec1)
-        norm_vec2 = np.linalg.norm(vec2)
+def get_embs(texts: list, embedding_model_id=""):
+    """ 先使用 openai embedding协议获取 文本向量"""
+    logger.info(f"Starting embedding request for {len(texts)} texts, model id: {embedding_model_id}")
+    return _get_embs_with_cache(texts, embedding_model_id,
+                                lambda batch: _embed_batch(batch, embedding_model_id=embedding_model_id)[0])
+
 
-        # calculate cosine similarity
-        cosine_sim = dot_product / (norm_vec1 * norm_vec2)
-        query_vector_scores.append(cosine_sim)
+def get_embs_concurrent(texts: list, embedding_model_id="", batch_size=EMBEDDING_BATCH_SIZE,
+                        max_concurrency=EMBEDDING_MAX_CONCURRENCY):
+    """
+    大批量文本向量化：按批并发请求，最多 max_concurrency 个批次同时在途，结果保持输入顺序。
+    批大小自适应：遇到限流的批次后减半，连续成功后逐步恢复到 batch_size。
+    """
+    return _get_embs_with_cache(texts, embedding_model_id,
+                                lambda batch: _dispatch_batches(batch, embedding_model_id, batch_size, max_concurrency))
 
-    return query_vector_scores
 
+def _dispatch_batches(texts: list, embedding_model_id: str, batch_size: int, max_concurrency: int):
+    results = [None] * len(texts)
+    current_size = batch_size
+    clean_batches = 0
+    start = 0
+    pending = {}
+    with futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        while start < len(texts) or pending:
+            while start < len(texts) and len(pending) < max_concurrency:
+                end = min(start + current_size, len(texts))
+                pending[executor.submit(_embed_batch, texts[start:end], embedding_model_id)] = (start, end)
+                start = end
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                batch_start, batch_end = pending.pop(future)
+                res, rate_limited = future.result()
+                if len(res["result"]) != batch_end - batch_start:
+                    raise RuntimeError(f"Error getting embeddings: expect {batch_end - batch_start}, "
+                                       f"got {len(res['result'])}")
+                results[batch_start:batch_end] = res["result"]
+                if rate_limited:
+                    current_size = max(1, current_size // 2)
+                    clean_batches = 0
+                else:
+                    clean_batches += 1
+                    if clean_batches >= max_concurrency and current_size < batch_size:
+                        current_size = min(batch_size, current_size * 2)
+                        clean_batches = 0
+    return {"result": results}
+
+
+def cosine_scores(query_vector, vectors) -> list[float]:
+    """query 向量与一组向量的余弦相似度，一次矩阵运算完成"""
+    if len(vectors) == 0:
+        return []
+    matrix = np.asarray(vectors, dtype=np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    norms[norms == 0] = np.finfo(np.float32).tiny
+    return (matrix @ query / norms).tolist()
+
+
+def rescore_cosine(query_vector, candidate_vectors: list, texts: list, embedding_model_id="") -> list[float]:
+    """
+    计算每个候选的向量得分
+    :param candidate_vectors: candidate_vectors[i] 为第 i 个候选已存储的向量列表(父子分段时可能有多个)，取最大相似度
+    :param texts: 候选原文，已存储向量缺失的候选回退为对原文编码
+    """
+    missing = [i for i, vectors in enumerate(candidate_vectors) if not vectors]
+    if missing:
+        logger.info(f"rescore candidates without stored vectors: {len(missing)}/{len(candidate_vectors)}")
+        res = get_embs([texts[i] for i in missing], embedding_model_id=embedding_model_id)["result"]
+        candidate_vectors = list(candidate_vectors)
+        for i, item in zip(missing, res):
+            candidate_vectors[i] = [item["dense_vec"]]
+
+    owners = [i for i, vectors in enumerate(candidate_vectors) for _ in vectors]
+    flat_scores = cosine_scores(query_vector, [v for vectors in candidate_vectors for v in vectors])
+    scores = [float("-inf")] * len(candidate_vectors)
+    for i, score in zip(owners, flat_scores):
+        if score > scores[i]:
+            scores[i] = score
+    return scores
+
+
+def calculate_cosine(query, contents, embedding_model_id="") -> list[float]:
+    query_vector = get_embs([query], embedding_model_id=embedding_model_id)["result"][0]["dense_vec"]
+    contents_vector = get_embs(contents, embedding_model_id=embedding_model_id)["result"]
+    return cosine_scores(query_vector, [item["dense_vec"] for item in contents_vector])
@@ -11,6 +11,7 @@ from utils.config_util import es
 from elasticsearch import helpers
 from utils.util import validate_index_name, generate_md5
 from utils import emb_util
+from utils import kb_info
 
 warnings.filterwarnings("ignore")
 
@@ -365,9 +366,71 @@ def rescore_bm25_score(index_name, query, search_by="snippet", search_list = [])
 
     return result_dict
 
-def search_data_keyword_recall(index_name, kb_name, keywords, top_k, min_score, search_by="labels",
-                            filter_file_name_list=[]):
-    """根据查询检索数据，仅返回分数高于 min_score 的文档，并按分数从高到低排序"""
+def get_content_vectors(index_name, content_ids, dim):
+    """
+    按 content_id 批量取出已存储的向量，供重排序直接计算相似度，无需重新编码
+    :param dim: 向量维度，与 query 向量一致
+    :return: {content_id: [vector, ...]}，父子分段时一个 content_id 对应多个子分段向量
+    """
+    field_name = f"q_{dim}_content_vector"
+    field_exist, properties = is_field_exist(index_name, field_name)
+    if not field_exist:
+        if dim == 1024 and "content_vector" in properties:
+            field_name = "content_vector"
+        else:
+            logger.info(f"es 索引 {index_name} 字段 {field_name} 不存在，无已存储向量可用")
+            return {}
+
+    search_body = {
+        "query": {
+            "bool": {
+                "filter": [
+                    {
+                        "bool": {
+                            "should": [
+                                {"terms": {"content_id": content_ids}},
+                                {"terms": {"content_id.keyword": content_ids}}
+                            ],
+                            "minimum_should_match": 1
+                        }
+                    }
+                ]
+            }
+        },
+        "size": 10000,
+        "_source": ["content_id", field_name]
+    }
+    response = es.search(index=index_name, body=search_body)
+
+    content_vectors = {}
+    for hit in response['hits']['hits']:
+        vector = hit['_source'].get(field_name)
+        if vector:
+            content_vectors.setdefault(hit['_source']['content_id'], []).append(vector)
+    return content_vectors
+
+
+def build_file_filter(file_field, filter_file_name_list, meta_filter_query=None):
+    """
+    构建文件过滤子句：文件名列表与元数据过滤条件(下推模式)满足其一即可，
+    与先按元数据查出文件名再并入 filter_file_name_list 的语义一致；
+    下推时以 constant_score 包装，放在 must 中的得分贡献与原 terms 子句相同
+    """
+    if not meta_filter_query:
+        return {"terms": {file_field: filter_file_name_list}} if filter_file_name_list else None
+    if filter_file_name_list:
+        meta_filter_query = {
+            "bool": {
+                "should": [{"terms": {file_field: filter_file_name_list}}, meta_filter_query],
+                "minimum_should_match": 1
+            }
+        }
+    return {"constant_score": {"filter": meta_filter_query}}
+
+
+def build_keyword_recall_body(kb_name, keywords, top_k, min_score, search_by="labels",
+                              filter_file_name_list=[], meta_filter_query=None):
+    """构建标签关键词检索的查询体"""
     labels_list = keywords.keys()
     # 构建查询体，每个匹配项都有相同的权重
     should_clauses = []
@@ -383,9 +446,10 @@ def search_data_keyword_recall(index_name, kb_name, keywords, top_k, min_score,
     must_clauses = [
         {"term": {"kb_name": kb_name}}
     ]
-    # 如果提供了文件名过滤列表，则添加文件名过滤条件
-    if filter_file_name_list:
-        must_clauses.append({"terms": {"title.keyword": filter_file_name_list}})
+    # 如果提供了文件名过滤列表或元数据过滤条件，则添加文件过滤条件
+    file_filter = build_file_filter("title.keyword", filter_file_name_list, meta_filter_query)
+    if file_filter:
+        must_clauses.append(file_filter)
 
 
     search_body = {
@@ -402,33 +466,14 @@ def search_data_keyword_recall(index_name, kb_name, keywords, top_k, min_score,
             {"_score": {"order": "desc"}}  # 按分数降序排序
         ]
     }
-    logger.info(f"search_data_keyword_recall, es index: {index_name}, search body: {search_body}")
-
-    response = es.search(index=index_name, body=search_body)
-
-    search_list = []
-    scores = []
-
-    # 遍历搜索结果
-    for hit in response['hits']['hits']:
-        hit_data = hit['_source']
-        hit_data["score"] = hit['_score']
-        search_list.append(hit_data)
-        scores.append(hit['_score'])
-
-    # 构建结果字典
-    result_dict = {
-        "search_list": search_list,
-        "scores": scores
-    }
-
-    return result_dict
+    return search_body
 
 
-def search_data_text_recall(index_name, kb_name, query, top_k, min_score, search_by="snippet",
-                            filter_file_name_list=[]):
-    """根据查询检索数据，仅返回分数高于 min_score 的文档，并按分数从高到低排序"""
-    if filter_file_name_list:
+def build_text_recall_body(kb_name, query, top_k, min_score, search_by="snippet",
+                           filter_file_name_list=[], meta_filter_query=None):
+    """构建全文检索的查询体"""
+    file_filter = build_file_filter("title.keyword", filter_file_name_list, meta_filter_query)
+    if file_filter:
         search_body = {
             "query": {
                 "bool": {
@@ -436,7 +481,7 @@ def search_data_text_recall(index_name, kb_name, query, top_k, min_score, search
                         # 假设 'search_by' 是你要查询的字段名称，query 是具体的查询值
                         {"match": {search_by: query}},
                         {"term": {"kb_name": kb_name}},
-                        {"terms": {"title.keyword": filter_file_name_list}},
+                        file_filter,
                     ],
                 }
             },
@@ -471,9 +516,11 @@ def search_data_text_recall(index_name, kb_name, query, top_k, min_score, search
                 {"_score": {"order": "desc"}}  # 按分数降序排序
             ]
         }
+    return search_body
 
-    response = es.search(index=index_name, body=search_body)
 
+def parse_recall_hits(response):
+    """将检索响应转换为 {"search_list": [...], "scores": [...]}"""
     search_list = []
     scores = []
     # 遍历搜索结果，填充列表
@@ -492,6 +539,50 @@ def search_data_text_recall(index_name, kb_name, query, top_k, min_score, search
     return result_dict
 
 
+def search_data_keyword_recall(index_name, kb_name, keywords, top_k, min_score, search_by="labels",
+                            filter_file_name_list=[], meta_filter_query=None):
+    """根据查询检索数据，仅返回分数高于 min_score 的文档，并按分数从高到低排序"""
+    search_body = build_keyword_recall_body(kb_name, keywords, top_k, min_score, search_by,
+                                            filter_file_name_list, meta_filter_query)
+    logger.info(f"search_data_keyword_recall, es index: {index_name}, search body: {search_body}")
+
+    response = es.search(index=index_name, body=search_body)
+    return parse_recall_hits(response)
+
+
+def search_data_text_recall(index_name, kb_name, query, top_k, min_score, search_by="snippet",
+                            filter_file_name_list=[], meta_filter_query=None):
+    """根据查询检索数据，仅返回分数高于 min_score 的文档，并按分数从高到低排序"""
+    search_body = build_text_recall_body(kb_name, query, top_k, min_score, search_by,
+                                         filter_file_name_list, meta_filter_query)
+    response = es.search(index=index_name, body=search_body)
+    return parse_recall_hits(response)
+
+
+def msearch_recall(searches: list) -> list:
+    """
+    多个检索合并为一次 _msearch 请求
+    :param searches: [(index_name, search_body), ...]
+    :return: 与 searches 一一对应的结果字典，单个检索出错时对应结果为 None
+    """
+    if not searches:
+        return []
+    msearch_body = []
+    for index_name, search_body in searches:
+        msearch_body.append({"index": index_name})
+        msearch_body.append(search_body)
+    response = es.msearch(searches=msearch_body)
+
+    results = []
+    for (index_name, _), item in zip(searches, response["responses"]):
+        if "error" in item:
+            logger.error(f"msearch_recall, es index: {index_name}, error: {item['error']}")
+            results.append(None)
+        else:
+            results.append(parse_recall_hits(item))
+    return results
+
+
 def search_text_title_list(index_name, kb_name, query, top_k, min_score=0):
     """根据查询检索数据，仅返回分数高于 min_score 的文档，并按分数从高到低排序"""
     search_body = {
@@ -535,7 +626,8 @@ def is_field_exist(index_name:str, field_name:str)-> (bool, dict):
 
     return True, properties
 
-def search_data_knn_recall(index_name, kb_names, query, top_k, min_score, filter_file_name_list=[], embedding_model_id=""):
+def search_data_knn_recall(index_name, kb_names, query, top_k, min_score, filter_file_name_list=[], embedding_model_id="",
+                           meta_filter_query=None):
     """根据查询检索数据，仅返回分数高于 min_score 的文档，并按分数从高到低排序，支持多知识库"""
 
     query_vector = emb_util.get_embs([query], embedding_model_id=embedding_model_id)["result"][0]["dense_vec"]
@@ -559,14 +651,15 @@ def search_data_knn_recall(index_name, kb_names, query, top_k, min_score, filter
         logger.info(f"es 索引 {index_name} 使用向量字段: {field_name} 执行向量检索")
 
     # ============== KNN 通道召回数据 ==========
-    if filter_file_name_list:
+    file_filter = build_file_filter("file_name", filter_file_name_list, meta_filter_query)
+    if file_filter:
         search_body = {
             "knn": {
                 "field": field_name,
                 "query_vector": query_vector,
                 "filter": [
                     {"terms": {"kb_name": kb_names}},
-                    {"terms": {"file_name": filter_file_name_list}},
+                    file_filter,
                 ],
                 "k": 10,
                 "num_candidates": max(50, top_k),
@@ -1066,6 +1159,7 @@ def delete_uk_data_by_kbname(userId: str, kb_name: str):
             "failures": response.get('failures', [])
         }
         es.indices.refresh(index=KBNAME_MAPPING_INDEX)
+        kb_info.kb_registry.invalidate(userId)
     except Exception as e:
         delete_status = {
             "success": False,
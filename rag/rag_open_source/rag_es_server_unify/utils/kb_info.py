@@ -1,11 +1,14 @@
 import requests
 import json
+import time
+import threading
 import uuid
+from collections import Counter
 
 from utils.config_util import es
 from log.logger import logger
-from elasticsearch import helpers
-from settings import GET_KB_ID_URL, KBNAME_MAPPING_INDEX
+from elasticsearch import helpers, NotFoundError
+from settings import GET_KB_ID_URL, KBNAME_MAPPING_INDEX, KBNAME_MAPPING_VERSION_INDEX, KB_REGISTRY_CHECK_INTERVAL
 
 def get_maas_kb_id(user_id, kb_name):
     """获取maas的kb_id"""
@@ -22,28 +25,98 @@ def get_maas_kb_id(user_id, kb_name):
         raise RuntimeError(kb_name + ",get_maas_kb_id Error: " + str(e) + "url:" + GET_KB_ID_URL) from e
 
 
+class KBRegistry:
+    """
+    进程内的知识库映射缓存：按 userId 一次性加载映射表中该用户的全部记录，
+    (userId, kb_name) -> kb_id / embedding_model_id / enable_graph 直接从内存返回。
+    映射表每次写入后递增该用户在 KBNAME_MAPPING_VERSION_INDEX 中的版本号，
+    各 worker 最多每 KB_REGISTRY_CHECK_INTERVAL 秒用一次 get 校验版本，版本变化则重新加载。
+    """
+
+    def __init__(self, check_interval: float = KB_REGISTRY_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._users = {}  # userId -> {"version", "checked_at", "kbs": {kb_name: [source, ...]}, "maas_ids": {}}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_version(userId) -> int:
+        try:
+            return es.get(index=KBNAME_MAPPING_VERSION_INDEX, id=userId)["_source"].get("version", 0)
+        except NotFoundError:
+            return 0
+
+    @staticmethod
+    def _load_kbs(userId) -> dict:
+        query = {"query": {"term": {"userId": userId}}, "size": 10000}
+        response = es.search(index=KBNAME_MAPPING_INDEX, body=query)
+        hits = response["hits"]["hits"]
+        if response["hits"]["total"]["value"] > len(hits):
+            hits = helpers.scan(es, index=KBNAME_MAPPING_INDEX, query={"query": {"term": {"userId": userId}}})
+        kbs = {}
+        for hit in hits:
+            kbs.setdefault(hit["_source"].get("kb_name"), []).append(hit["_source"])
+        return kbs
+
+    def _get_user(self, userId) -> dict:
+        now = time.monotonic()
+        entry = self._users.get(userId)
+        if entry is not None and now - entry["checked_at"] < self.check_interval:
+            return entry
+        version = self._get_version(userId)
+        if entry is not None and entry["version"] == version:
+            entry["checked_at"] = now
+            return entry
+        # 先读版本再加载数据，加载期间发生的写入会在下次校验时再次触发加载
+        entry = {"version": version, "checked_at": now, "kbs": self._load_kbs(userId), "maas_ids": {}}
+        with self._lock:
+            self._users[userId] = entry
+        logger.info(f"kb registry loaded, userId: {userId}, version: {version}, kb count: {len(entry['kbs'])}")
+        return entry
+
+    def get_sources(self, userId, kb_name) -> list:
+        """返回 (userId, kb_name) 在映射表中的全部记录"""
+        return self._get_user(userId)["kbs"].get(kb_name, [])
+
+    def get_kb_names(self, userId, is_qa: bool) -> list:
+        """与映射表上 kb_name 的 terms 聚合结果一致：按记录数降序、名称升序"""
+        counter = Counter()
+        for kb_name, sources in self._get_user(userId)["kbs"].items():
+            for source in sources:
+                if is_qa and source.get("is_qa") is True or not is_qa and source.get("is_qa") is None:
+                    counter[kb_name] += 1
+        return [kb_name for kb_name, _ in sorted(counter.items(), key=lambda x: (-x[1], x[0]))]
+
+    def get_maas_kb_id(self, userId, kb_name):
+        """映射表中没有 kb_id 时回退到 maas 查询，结果随用户缓存一起失效"""
+        maas_ids = self._get_user(userId)["maas_ids"]
+        if kb_name not in maas_ids:
+            maas_ids[kb_name] = get_maas_kb_id(userId, kb_name)
+        return maas_ids[kb_name]
+
+    def invalidate(self, userId):
+        """映射表写入后调用：递增版本号使所有进程的缓存失效"""
+        with self._lock:
+            self._users.pop(userId, None)
+        try:
+            es.update(index=KBNAME_MAPPING_VERSION_INDEX, id=userId,
+                      script={"source": "ctx._source.version += 1", "lang": "painless"},
+                      upsert={"version": 1}, retry_on_conflict=5)
+        except Exception as e:
+            logger.error(f"kb registry invalidate failed, userId: {userId}, error: {e}")
+
+
+kb_registry = KBRegistry()
+
 def get_uk_kb_id(userId, kb_name):
     """ 获取知识库映射的 kb_id """
     kb_id = ""
     logger.info(f"userId:{userId},kb_name:{kb_name} ====== get_uk_kb_id")
-    # 查询条件
-    query = {
-        "query": {
-            "bool": {
-                "must": [
-                    {"term": {"userId": userId}},
-                    {"term": {"kb_name": kb_name}},
-                ]
-            }
-        }
-    }
-    response = es.search(index=KBNAME_MAPPING_INDEX, body=query)
-    # 遍历搜索结果，获取 kb_id
-    for hit in response["hits"]["hits"]:
-        kb_id = hit['_source']["kb_id"]
+    # 遍历映射记录，获取 kb_id
+    for source in kb_registry.get_sources(userId, kb_name):
+        kb_id = source["kb_id"]
     # ========= 返回 =========
     if not kb_id:
-        kb_id = get_maas_kb_id(userId, kb_name)  # 如果没有找到，则从 maas 知识库中获取
+        kb_id = kb_registry.get_maas_kb_id(userId, kb_name)  # 如果没有找到，则从 maas 知识库中获取
     logger.info(f"userId:{userId},kb_name:{kb_name} 对应的 kb_id 为:{kb_id}")
     return kb_id
 
@@ -52,33 +125,24 @@ def get_uk_kb_info(userId, kb_name):
     """ 获取知识库info  """
     kb_info = {}
     logger.info(f"userId:{userId},kb_name:{kb_name} ====== get_uk_kb_info")
-    # 查询条件
-    query = {
-        "query": {
-            "bool": {
-                "must": [
-                    {"term": {"userId": userId}},
-                    {"term": {"kb_name": kb_name}},
-                ]
-            }
-        }
-    }
-    response = es.search(index=KBNAME_MAPPING_INDEX, body=query)
-    if len(response["hits"]["hits"]) > 1:
+    sources = kb_registry.get_sources(userId, kb_name)
+    if len(sources) > 1:
         raise ValueError("存在多条kb info 记录")
-    for hit in response["hits"]["hits"]:
-        kb_id = hit['_source']["kb_id"]
+    for source in sources:
+        kb_id = source["kb_id"]
         if not kb_id:
-            kb_id = get_maas_kb_id(userId, kb_name)  # 如果没有找到，则从 maas 知识库中获取
+            kb_id = kb_registry.get_maas_kb_id(userId, kb_name)  # 如果没有找到，则从 maas 知识库中获取
         kb_info["kb_id"] = kb_id
-        kb_info["embedding_model_id"] = hit['_source']["embedding_model_id"]
-        if "enable_graph" in hit['_source']:
-            kb_info["enable_knowledge_graph"] = hit['_source']["enable_graph"]
+        kb_info["embedding_model_id"] = source["embedding_model_id"]
+        if "enable_graph" in source:
+            kb_info["enable_knowledge_graph"] = source["enable_graph"]
     logger.info(f"userId:{userId},kb_name:{kb_name} 对应的 kb_info 为:{kb_info}")
     return kb_info
 
 def get_uk_kb_name_list(index_name, user_id):
     """ 获取 userid 的所有 kb_name 映射表下 某个 user_id 所有的知识库名称的集合"""
+    if index_name == KBNAME_MAPPING_INDEX:
+        return kb_registry.get_kb_names(user_id, is_qa=False)
     body = {
         "query": {
             "bool": {
@@ -119,21 +183,9 @@ def get_uk_kb_emb_model_id(userId, kb_name):
     """ 获取知识库映射的 embedding_model_id  """
     embedding_model_id = ""
     logger.info(f"userId:{userId},kb_name:{kb_name} ====== get_uk_kb_emb_model_id")
-    # 查询条件
-    query = {
-        "query": {
-            "bool": {
-                "must": [
-                    {"term": {"userId": userId}},
-                    {"term": {"kb_name": kb_name}},
-                ]
-            }
-        }
-    }
-    response = es.search(index=KBNAME_MAPPING_INDEX, body=query)
-    # 遍历搜索结果，获取 kb_id
-    for hit in response["hits"]["hits"]:
-        embedding_model_id = hit['_source']["embedding_model_id"]
+    # 遍历映射记录，获取 embedding_model_id
+    for source in kb_registry.get_sources(userId, kb_name):
+        embedding_model_id = source["embedding_model_id"]
     logger.info(f"userId:{userId},kb_name:{kb_name} 对应的 embedding_model_id 为:{embedding_model_id}")
     return embedding_model_id
 
@@ -171,6 +223,7 @@ def update_uk_kb_name(userId, old_kb_name, new_kb_name):
     try:
         helpers.bulk(es, actions)
         es.indices.refresh(index=KBNAME_MAPPING_INDEX)
+        kb_registry.invalidate(userId)
         return {'code': 0, 'message': 'success'}
     except Exception as e:
         # 如果批量操作失败，返回失败状态和错误信息
@@ -178,29 +231,7 @@ def update_uk_kb_name(userId, old_kb_name, new_kb_name):
 
 def get_uk_qa_name_list(user_id):
     """ 获取 userid 的所有 qa_name 映射表下 某个 user_id 所有的问答库名称的集合"""
-    body = {
-        "query": {
-            "bool": {
-                "must": [
-                    {"term": {"userId": user_id}},
-                    {"term": {"is_qa": True}},
-                ]
-            }
-        },
-        "aggs": {
-            "unique_res": {
-                "terms": {
-                    "field": "kb_name",
-                    "size": 100000,  # 根据需要设置大小
-                }
-            }
-        },
-        "size": 0  # 不需要原始文档，只用于聚合
-    }
-
-    response = es.search(index=KBNAME_MAPPING_INDEX, body=body)
-    unique_res = [bucket['key'] for bucket in response['aggregations']['unique_res']['buckets']]
-    return unique_res
+    return kb_registry.get_kb_names(user_id, is_qa=True)
 
 
 def bulk_add_uk_index_data(index_name, data):
@@ -230,6 +261,9 @@ def bulk_add_uk_index_data(index_name, data):
         # 执行批量操作
         helpers.bulk(es, actions)
         res = es.indices.refresh(index=index_name)
+        if index_name == KBNAME_MAPPING_INDEX:
+            for user_id in {item["userId"] for item in data}:
+                kb_registry.invalidate(user_id)
 
         # logger.info(f"{res}： bulk_add_uk_index_data  ----- {data}")
         return {"success": True, "uploaded": len(actions), "error": None}
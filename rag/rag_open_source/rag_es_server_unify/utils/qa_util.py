@@ -4,9 +4,19 @@ from utils.es_util import check_index_exists
 from log.logger import logger
 
 from settings import DELETE_BACTH_SIZE
-from utils.util import validate_index_name
+from utils.util import validate_index_name, normalize_to_01
 from utils.meta_util import retype_meta_datas, build_doc_meta_query
-from utils.emb_util import get_embs
+from utils.emb_util import get_embs, rescore_cosine
+from settings import QA_HYBRID_RRF_K
+
+QA_VECTOR_FIELDS = [
+    "content_vector",
+    "q_768_content_vector",
+    "q_1024_content_vector",
+    "q_1536_content_vector",
+    "q_2048_content_vector"
+]
+
 
 def delete_data_by_qa_info(index_name: str, qa_name: str, qa_id: str):
     """根据索引名和 qa_name, qa_id字段 精确匹配删除文档，并返回删除操作的状态"""
@@ -431,11 +441,14 @@ def rename_metas(index_name, qa_base_name, qa_base_id, key_mappings):
         return {"success": False, "error": str(e)}
 
 
-def qa_rescore_bm25_score(index_name, query, search_list = []):
+def qa_rescore_bm25_score(index_name, query, search_list = [], vector_field=""):
+    """
+    根据 qa_pair_id 进行过滤，重计算bm 25得分，并按分数从高到低排序
+    :param vector_field: 指定时一并返回问题已存储的向量(result_dict["vectors"])，供向量重排序使用
+    """
     qa_pair_ids = []
     for item in search_list:
         qa_pair_ids.append(item['qa_pair_id'])
-    """根据content id 进行过滤，重计算bm 25得分，并按分数从高到低排序"""
     search_body = {
         "query": {
             "bool": {
@@ -452,13 +465,7 @@ def qa_rescore_bm25_score(index_name, query, search_list = []):
             {"_score": {"order": "desc"}}  # 按分数降序排序
         ],
         "_source": {
-            "excludes": [
-                "content_vector",
-                "q_768_content_vector",
-                "q_1024_content_vector",
-                "q_1536_content_vector",
-                "q_2048_content_vector"
-            ]
+            "excludes": [field for field in QA_VECTOR_FIELDS if field != vector_field]
         }  # 排除embedding数据
     }
 
@@ -466,10 +473,14 @@ def qa_rescore_bm25_score(index_name, query, search_list = []):
 
     search_list = []
     scores = []
+    vectors = []
     # 遍历搜索结果，填充列表
     for hit in response['hits']['hits']:
         hit_data = hit['_source']
         hit_data["score"] = hit['_score']
+        if vector_field:
+            vector = hit_data.pop(vector_field, None)
+            vectors.append([vector] if vector else [])
         search_list.append(hit_data)
         scores.append(hit['_score'])
 
@@ -478,6 +489,8 @@ def qa_rescore_bm25_score(index_name, query, search_list = []):
         "search_list": search_list,
         "scores": scores
     }
+    if vector_field:
+        result_dict["vectors"] = vectors
 
     return result_dict
 
@@ -592,4 +605,183 @@ def text_search(index_name, base_names, query, top_k, min_score, meta_filter_lis
         "scores": scores
     }
 
-    return result_dict
\ No newline at end of file
+    return result_dict
+
+
+def qa_weighted_scores(query, index2doc_ids, emb_groups, weights):
+    """
+    与 qa_rescore 一致地对所有用户候选的并集重新打分：每个候选都计算 question 的 BM25 得分与问题向量的余弦相似度，
+    两组得分在整个并集上归一化后按权重相加。各索引的打分合并为一次 msearch 请求
+    :param index2doc_ids: {索引名: [_id]}
+    :param emb_groups: {(索引名, embedding_model_id): (向量字段, query 向量, [问答库名称])}
+    :return: ({(索引名, _id): 加权得分}, {(索引名, _id): 文档})
+    """
+    index2doc_ids = {index_name: doc_ids for index_name, doc_ids in index2doc_ids.items() if doc_ids}
+    if not index2doc_ids:
+        return {}, {}
+    base2group = {(index_name, base_name): (index_name, embedding_model_id)
+                  for (index_name, embedding_model_id), (_, _, base_names) in emb_groups.items()
+                  for base_name in base_names}
+    vector_fields = {field for field, _, _ in emb_groups.values()}
+    searches = []
+    for index_name, doc_ids in index2doc_ids.items():
+        searches.append({"index": index_name})
+        searches.append({
+            "query": {
+                "bool": {
+                    "filter": [
+                        {"ids": {"values": doc_ids}}
+                    ],
+                    "should": [
+                        {"match": {"question": query}}  # 未命中的候选 BM25 得分为 0
+                    ]
+                }
+            },
+            "size": len(doc_ids),
+            "_source": {"excludes": [field for field in QA_VECTOR_FIELDS if field not in vector_fields]}
+        })
+    responses = es.msearch(searches=searches)["responses"]
+
+    docs = {}
+    bm25_scores = {}
+    stored_vectors = {}
+    group_keys = {}  # (索引名, embedding_model_id) -> [(索引名, _id)]
+    for index_name, item in zip(index2doc_ids, responses):
+        if "error" in item:
+            raise RuntimeError(f"qa_weighted_scores error, es index: {index_name}, error: {item['error']}")
+        for hit in item['hits']['hits']:
+            key = (index_name, hit["_id"])
+            hit_data = hit['_source']
+            group = base2group[(index_name, hit_data["QABase"])]
+            vectors = {field: hit_data.pop(field, None) for field in vector_fields}
+            stored_vectors[key] = vectors[emb_groups[group][0]]
+            docs[key] = hit_data
+            bm25_scores[key] = hit['_score']
+            group_keys.setdefault(group, []).append(key)
+    if not docs:
+        return {}, {}
+
+    cosine_scores = {}
+    for group, keys in group_keys.items():
+        query_vector = emb_groups[group][1]
+        candidate_vectors = [[stored_vectors[key]] if stored_vectors[key] else [] for key in keys]
+        contents = [docs[key]["question"] for key in keys]
+        cosine_scores.update(zip(keys, rescore_cosine(query_vector, candidate_vectors, contents, group[1])))
+
+    keys = list(docs)
+    bm25_normalized = normalize_to_01([bm25_scores[key] for key in keys])
+    cosine_normalized = normalize_to_01([cosine_scores[key] for key in keys])
+    fused_scores = {}
+    for key, text_score, vector_score in zip(keys, bm25_normalized, cosine_normalized):
+        fused_scores[key] = weights["vector_weight"] * vector_score + weights["text_weight"] * text_score
+    return fused_scores, docs
+
+
+def hybrid_search(index2emb_bases, query, top_k, min_score, index2meta_filters={}, weights=None):
+    """
+    问答库混合检索：所有用户索引下各 embedding 模型的 KNN 检索与 question 字段的 BM25 检索合并为一次 msearch 请求，
+    各用户的结果合并后统一融合排序，默认按 RRF 融合；传入 weights 时与 qa_rescore 一致，
+    候选并集按 BM25 与余弦相似度归一化后加权融合(需再发一次 msearch 取回候选在另一通道上的得分)
+    :param index2emb_bases: {索引名: {embedding_model_id: [问答库名称]}}
+    :param index2meta_filters: {索引名: [元数据过滤条件]}
+    :param weights: {"vector_weight": float, "text_weight": float}
+    """
+    def qa_filter(index_name, base_names):
+        return {
+            "bool": {
+                "must": [
+                    {"terms": {"QABase": base_names}},
+                    {"term": {"status": True}},
+                    build_doc_meta_query(index2meta_filters.get(index_name, []))
+                ]
+            }
+        }
+
+    source_excludes = {"excludes": QA_VECTOR_FIELDS}  # 排除embedding数据
+
+    searches = []
+    search_kinds = []  # 与 responses 一一对应: (索引名, "vector" / "text")
+    emb_groups = {}
+    query_vectors = {}  # 同一 embedding 模型只对 query 编码一次
+    for index_name, emb_id2base_names in index2emb_bases.items():
+        all_base_names = []
+        for embedding_model_id, base_names in emb_id2base_names.items():
+            if embedding_model_id not in query_vectors:
+                query_vectors[embedding_model_id] = get_embs([query], embedding_model_id=embedding_model_id)["result"][0]["dense_vec"]
+            query_vector = query_vectors[embedding_model_id]
+            vector_field = f"q_{len(query_vector)}_content_vector"
+            emb_groups[(index_name, embedding_model_id)] = (vector_field, query_vector, base_names)
+            searches.append({"index": index_name})
+            searches.append({
+                "knn": {
+                    "field": vector_field,
+                    "query_vector": query_vector,
+                    "filter": qa_filter(index_name, base_names),
+                    "k": top_k,
+                    "num_candidates": max(50, top_k),
+                },
+                "min_score": min_score,
+                "size": top_k,
+                "_source": source_excludes
+            })
+            search_kinds.append((index_name, "vector"))
+            all_base_names.extend(base_names)
+        searches.append({"index": index_name})
+        searches.append({
+            "query": {
+                "bool": {
+                    "filter": qa_filter(index_name, all_base_names),
+                    "must": [
+                        {"match": {"question": query}}
+                    ]
+                }
+            },
+            "min_score": min_score,
+            "size": top_k,
+            "_source": source_excludes
+        })
+        search_kinds.append((index_name, "text"))
+    if not searches:
+        return {"search_list": [], "scores": []}
+
+    responses = es.msearch(searches=searches)["responses"]
+    hits_by_kind = {"vector": [], "text": []}
+    for (index_name, kind), item in zip(search_kinds, responses):
+        if "error" in item:
+            raise RuntimeError(f"hybrid_search error, es index: {index_name}, error: {item['error']}")
+        hits_by_kind[kind].extend((index_name, hit) for hit in item["hits"]["hits"])
+    # 各用户、各 embedding 模型的同一路结果合并后按分数取前 top_k，文档以 (索引名, _id) 标识
+    vector_hits = sorted(hits_by_kind["vector"], key=lambda x: x[1]["_score"], reverse=True)[:top_k]
+    text_hits = sorted(hits_by_kind["text"], key=lambda x: x[1]["_score"], reverse=True)[:top_k]
+
+    docs = {}
+    fused_scores = {}
+    if weights:
+        # 两路候选的并集在两个通道上都重新打分，不以单路 top_k 内的相对位置代替
+        index2doc_ids = {}
+        for index_name, hit in vector_hits + text_hits:
+            doc_ids = index2doc_ids.setdefault(index_name, [])
+            if hit["_id"] not in doc_ids:
+                doc_ids.append(hit["_id"])
+        fused_scores, docs = qa_weighted_scores(query, index2doc_ids, emb_groups, weights)
+    else:
+        for hits in [vector_hits, text_hits]:
+            for rank, (index_name, hit) in enumerate(hits, start=1):
+                key = (index_name, hit["_id"])
+                docs.setdefault(key, hit["_source"])
+                fused_scores[key] = fused_scores.get(key, 0.0) + 1.0 / (QA_HYBRID_RRF_K + rank)
+
+    search_list = []
+    scores = []
+    for key in sorted(fused_scores, key=fused_scores.get, reverse=True)[:top_k]:
+        hit_data = docs[key]
+        hit_data["score"] = fused_scores[key]
+        search_list.append(hit_data)
+        scores.append(fused_scores[key])
+
+    logger.info(f"hybrid_search, es indexes: {list(index2emb_bases)}, vector hits: {len(vector_hits)}, "
+                f"text hits: {len(text_hits)}, fused: {len(search_list)}")
+    return {
+        "search_list": search_list,
+        "scores": scores
+    }
@@ -15,7 +15,8 @@ def get_main_index_name(user_id:str) -> str:
     return settings.INDEX_NAME_PREFIX + user_id
 
 def get_snippet_index_name(user_id:str) -> str:
-    return settings.SNIPPET_INDEX_NAME_PREFIX + user_id
+    # 与 /api/v1/rag/es/bulk_add 写入时的索引名保持一致
+    return settings.SNIPPET_INDEX_NAME_PREFIX + user_id.replace('-', '_')
 
 def get_content_control_index_name(user_id:str) -> str:
     return 'content_control_' + get_main_index_name(user_id)
@@ -66,4 +67,15 @@ def generate_md5(content_str):
     # 获取十六进制的MD5值
     md5_value = md5_obj.hexdigest()
 
-    return md5_value
\ No newline at end of file
+    return md5_value
+
+
+def normalize_to_01(scores):
+    """min-max 归一化到 [0, 1]，加权重排序时统一各路得分的量纲"""
+    if len(scores) == 1:
+        return [1.0]  # 单个分数归一化为1
+    min_score = min(scores)
+    max_score = max(scores)
+    if min_score == max_score:
+        return [1.0 for _ in scores]  # 所有分数相同，统一设为1
+    return [(score - min_score) / (max_score - min_score) for score in scores]
@@ -168,6 +168,7 @@ pyinstaller --name asyn_add_file \
             --add-data "./rag_core/utils:utils" \
             --add-data "./rag_core/logging_config.py:." \
             --add-data "../root/miniconda3/envs/rag-new/lib/python3.10/site-packages/pymilvus/model/sparse/bm25/lang.yaml:pymilvus/model/sparse/bm25" \
+            --hidden-import="asyn_add_file_consumer" \
             --hidden-import="nltk" \
             --hidden-import="utils.milvus_utils" \
             --hidden-import="utils.minio_utils" \